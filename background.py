@@ -0,0 +1,173 @@
+"""
+Ход компьютера в фоне.
+
+Поиск идёт в отдельном процессе, окно в это время рисуется и обрабатывает события.
+Пока пользователь думает, движок обдумывает (ponder) позицию после ожидаемого ответа пользователя:
+если пользователь так и сходил, ход компьютера уже готов или почти готов.
+Подсказка пользователю (лучшие ходы с оценками) тоже ищется в фоне.
+"""
+
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from base import Move, Player
+from board import Board
+from process import GameProcess
+from search import AlphaBetaSearch, AnalysisLine, analyze_position
+from stats import SearchStats
+from transposition import TranspositionTable
+
+_transposition_table: Optional[TranspositionTable] = None
+"""Таблица транспозиций процесса поиска - живёт между ходами"""
+_hint_table: Optional[TranspositionTable] = None
+"""Таблица транспозиций подсказок (оценки в ней - за пользователя)"""
+
+
+def _think(bitboards: Dict[str, int], players: Dict[str, Player], color: str, depth: int,
+           time_budget: Optional[float], tt_memory_bytes: int) -> Tuple[Optional[int], Optional[int], SearchStats]:
+    """Лучший ход, ожидаемый ответ соперника и статистика поиска (выполняется в процессе поиска)"""
+    global _transposition_table
+    if _transposition_table is None and tt_memory_bytes:
+        _transposition_table = TranspositionTable(tt_memory_bytes)
+
+    player = players[color]
+    other_player = players[player.opponent_color.value]
+    board = Board(None, players, bitboards=bitboards)
+    search = AlphaBetaSearch(player, other_player, transposition_table=_transposition_table)
+    if time_budget:
+        move = search.iterative_deepening(board, depth, time_budget)
+    else:
+        move = search.get_best_move(board, depth)
+    stats = search.get_stats(move)
+    if move is None:
+        return None, None, stats
+    return move.packed, search.expected_reply(board, move.packed), stats
+
+
+def _analyze(bitboards: Dict[str, int], players: Dict[str, Player], color: str, depth: int, lines: int,
+             tt_memory_bytes: int) -> List[AnalysisLine]:
+    """Лучшие ходы игрока color с оценками (выполняется в процессе поиска)"""
+    global _hint_table
+    if _hint_table is None and tt_memory_bytes:
+        _hint_table = TranspositionTable(tt_memory_bytes)
+    board = Board(None, players, bitboards=bitboards)
+    return analyze_position(board, players[color], depth, lines, transposition_table=_hint_table)
+
+
+class BackgroundEngine:
+    """Поиск хода компьютера в отдельном процессе с обдумыванием на времени пользователя"""
+
+    def __init__(self, game: GameProcess, ponder: bool = True):
+        self.game = game
+        self.ponder = ponder
+        # по процессу на поиск, обдумывание и подсказку: обдумывание, которое не угадало ход пользователя,
+        # и подсказка не задерживают настоящий поиск (запущенный в процессе поиск отменить нельзя)
+        self._search_executor = self._new_executor()
+        self._ponder_executor = self._new_executor()
+        self._hint_executor = self._new_executor()
+        self._future: Optional[Future] = None
+        """Поиск хода компьютера в текущей позиции"""
+        self._ponder: Optional[Tuple[Dict[str, int], Future]] = None
+        """Обдумывание: позиция после ожидаемого хода пользователя и её поиск"""
+        self._hints: Optional[Tuple[Dict[str, int], Future]] = None
+        """Подсказка: позиция и её анализ"""
+
+    @property
+    def thinking(self) -> bool:
+        """Компьютер ищет ход"""
+        return self._future is not None
+
+    def start_thinking(self):
+        """Пользователь походил - начинаем искать ответ (или берём обдумывание, если ход угадан)"""
+        ponder, self._ponder = self._ponder, None
+        if self._hints is not None:
+            # подсказка была для позиции до хода пользователя
+            self._hints[1].cancel()
+            self._hints = None
+        if ponder is not None and ponder[0] != self.game.board.bitboards:
+            # ход не угадан - обдумывание не нужно (если оно уже идёт, процесс обдумывания досчитает его сам)
+            ponder[1].cancel()
+            ponder = None
+        book_move = self.game.get_book_move()
+        if book_move is not None:
+            # ход из дебютной книги - искать нечего, poll сделает его сразу
+            self._future = Future()
+            self._future.set_result((book_move.packed, None, self.game.book_stats(book_move)))
+        elif ponder is not None:
+            self._future = ponder[1]
+        else:
+            self._future = self._submit('_search_executor', self.game.board)
+
+    def poll(self) -> Optional[Move]:
+        """Если ход компьютера найден - делаем его и начинаем обдумывать ответ пользователя"""
+        if self._future is None or not self._future.done():
+            return None
+        future, self._future = self._future, None
+        try:
+            move, expected_reply, stats = future.result()
+        except Exception as e:
+            # процесс поиска упал - ищем ход здесь же (окно на время поиска замирает)
+            print('BACKGROUND SEARCH FAILED', repr(e))
+            return self.game.step_computer()
+        self.game.record_stats(stats)
+        if move is None:
+            # ходов нет - компьютер проиграл
+            self.game.set_no_moves(self.game.computer_player)
+            return None
+
+        computer_move = Move.from_packed(self.game.computer_player, move)
+        self.game.apply_computer_move(computer_move)
+        if self.ponder and expected_reply is not None and not self.game.is_game_over:
+            expected_board = self.game.board.make_move_code(expected_reply, self.game.other_player)
+            self._ponder = (expected_board.bitboards, self._submit('_ponder_executor', expected_board))
+        return computer_move
+
+    def request_hints(self):
+        """Начать искать подсказку для текущей позиции (если ещё не ищется)"""
+        bitboards = self.game.board.bitboards
+        if self._hints is not None:
+            if self._hints[0] == bitboards:
+                return
+            self._hints[1].cancel()
+        game = self.game
+        self._hints = (dict(bitboards), self._submit_to(
+            '_hint_executor', _analyze, dict(bitboards), game.players, game.other_player.color.value,
+            game.HINT_DEPTH, game.HINT_LINES, game.TT_MEMORY_BYTES,
+        ))
+
+    def hints(self) -> Optional[List[AnalysisLine]]:
+        """Подсказка для текущей позиции (None - ещё не найдена или искалась для другой позиции)"""
+        if self._hints is None or self._hints[0] != self.game.board.bitboards or not self._hints[1].done():
+            return None
+        if self._hints[1].exception() is not None:  # процесс подсказки упал - подсказки нет
+            return []
+        return self._hints[1].result()
+
+    @staticmethod
+    def _new_executor() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+
+    def _submit_to(self, executor_name: str, fn, *args) -> Future:
+        """Задача в пул executor_name; если его процесс упал - пул создаётся заново"""
+        try:
+            return getattr(self, executor_name).submit(fn, *args)
+        except BrokenProcessPool:
+            setattr(self, executor_name, self._new_executor())
+            return getattr(self, executor_name).submit(fn, *args)
+
+    def _submit(self, executor_name: str, board: Board) -> Future:
+        game = self.game
+        if game.TIME_BUDGET:
+            depth, time_budget = game.MAX_DEPTH, game.TIME_BUDGET
+        else:
+            depth, time_budget = game.PREDICT_LEVEL, None
+        return self._submit_to(
+            executor_name, _think, board.bitboards, game.players, game.computer_player.color.value, depth, time_budget,
+            game.TT_MEMORY_BYTES,
+        )
+
+    def close(self):
+        for executor in (self._search_executor, self._ponder_executor, self._hint_executor):
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -57,13 +57,36 @@ class EvaluateCtx:
 
 @dataclass
 class Move:
-    """Ход на доске"""
+    """
+    Ход на доске.
+    Внутри движка ходы - упакованные числа (см. bitboard.pack_move), Move - обёртка для интерфейса.
+    """
     player: Player
     pos_from: HorsePosition
     pos_to: HorsePosition
     is_damage_to_opponent: Optional[bool] = None
     """Этот ход срубит соперника"""
 
+    @property
+    def packed(self) -> int:
+        """Ход одним числом: откуда | куда << 6 | рубка << 12"""
+        return (self.pos_from[0] * 8 + self.pos_from[1]) | (self.pos_to[0] * 8 + self.pos_to[1]) << 6 \
+            | bool(self.is_damage_to_opponent) << 12
+
+    @property
+    def notation(self) -> str:
+        """Ход четырьмя цифрами: линия и колонка откуда, линия и колонка куда"""
+        return '{}{}{}{}'.format(*self.pos_from, *self.pos_to)
+
+    @classmethod
+    def from_packed(cls, player: Player, code: int) -> 'Move':
+        return cls(
+            player=player,
+            pos_from=HorsePosition(divmod(code & 63, 8)),
+            pos_to=HorsePosition(divmod(code >> 6 & 63, 8)),
+            is_damage_to_opponent=bool(code >> 12 & 1),
+        )
+
 
 @dataclass
 class ClickEvent:
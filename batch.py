@@ -0,0 +1,84 @@
+"""
+Пакетная оценка позиций на NumPy.
+
+Board.evaluate считает одну позицию, проходя показатели на Python. Здесь сразу много позиций (все дети узла,
+позиции записанных партий) считаются операциями над массивами: позиция - строка из 64 нулей и единиц на каждый цвет
+(planes), показатели оценки считают свою часть через EvaluateStrategy.calc_batch. Порядок сложения показателей
+тот же, что в calc_for, поэтому результат совпадает с calc_for до последнего бита.
+
+Позиции можно передать битовыми досками (по числу на цвет), массивами 8 x 8 int8 (1 - белый конь,
+-1 - чёрный, 0 - пусто; [линия][колонка], как Board.position) или досками Board.
+
+Нужен numpy (pip install numpy). Движок без него работает: модуль импортируется только там,
+где нужна пакетная оценка.
+"""
+
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Sequence, Type
+
+import numpy as np
+
+from base import Color, EvaluateCtx, Player
+from bitboard import KNIGHT_TARGETS
+from board import Board
+from eveluate import EvaluateStrategy
+
+Planes = Dict[str, np.ndarray]
+"""Цвет -> массив (позиции, 64) int8: 1 - на клетке конь этого цвета"""
+
+
+@lru_cache(maxsize=None)
+def knight_matrix() -> np.ndarray:
+    """Матрица 64 x 64: 1, если кони на этих клетках бьют друг друга"""
+    matrix = np.zeros((64, 64), dtype=np.int8)
+    for sq, targets in enumerate(KNIGHT_TARGETS):
+        matrix[sq, list(targets)] = 1
+    return matrix
+
+
+def unpack_bitboards(masks: Sequence[int]) -> np.ndarray:
+    """Битовые доски -> массив (позиции, 64) int8, столбец - номер клетки"""
+    masks = np.asarray(masks, dtype=np.uint64).astype('<u8')
+    return np.unpackbits(masks.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little').view(np.int8)
+
+
+def planes_from_bitboards(white: Sequence[int], black: Sequence[int]) -> Planes:
+    """Позиции по битовым доскам: белые и черные кони каждой позиции"""
+    return {Color.WHITE.value: unpack_bitboards(white), Color.BLACK.value: unpack_bitboards(black)}
+
+
+def planes_from_arrays(positions: np.ndarray) -> Planes:
+    """Позиции массивами (позиции, 8, 8) int8: 1 - белый конь, -1 - чёрный"""
+    squares = np.asarray(positions).reshape(-1, 64)
+    return {
+        Color.WHITE.value: (squares == 1).view(np.int8),
+        Color.BLACK.value: (squares == -1).view(np.int8),
+    }
+
+
+def planes_from_boards(boards: Iterable[Board]) -> Planes:
+    white, black = [], []
+    for board in boards:
+        white.append(board.bitboards[Color.WHITE.value])
+        black.append(board.bitboards[Color.BLACK.value])
+    return planes_from_bitboards(white, black)
+
+
+def evaluate_batch(planes: Planes, player: Player, ctx: EvaluateCtx,
+                   strategy_cls: Optional[Type[EvaluateStrategy]] = None) -> np.ndarray:
+    """Оценки всех позиций для игрока, как Board.evaluate(player, ctx) каждой (float64)"""
+    strategy_cls = strategy_cls or Board.evaluate_strategy_cls
+    return np.asarray(strategy_cls.calc_batch(planes, player, ctx), dtype=np.float64)
+
+
+def evaluate_children(board: Board, mover: Player, player: Player, other_player: Player,
+                      strategy_cls: Optional[Type[EvaluateStrategy]] = None) -> Dict[int, float]:
+    """
+    Оценки позиций после каждого хода mover - для player, как в листьях поиска (следующим ходит соперник mover).
+    Ход -> оценка
+    """
+    moves = board.logic.get_legal_move_codes(mover)
+    children = [board.make_move_code(move, mover) for move in moves]
+    ctx = EvaluateCtx(next_step_player=other_player if mover is player else player, other_player=other_player)
+    scores = evaluate_batch(planes_from_boards(children), player, ctx, strategy_cls)
+    return dict(zip(moves, scores.tolist()))
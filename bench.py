@@ -0,0 +1,274 @@
+"""
+Замеры генератора ходов и движка.
+
+Запуск: python bench.py [--perft-depth 4] [--search-depth 4] [--min-time 0.5] [--parallel-workers N] [--out results.json]
+
+1. perft - количество позиций после всех последовательностей из N ходов от начальной позиции
+   (игра до финиша: в позиции, где конь уже дошёл, ходов нет). Числа сверены с исходной
+   реализацией на списках списков и служат проверкой генератора ходов: при расхождении - код выхода 1.
+2. Микрозамеры: ходов в секунду (генерация), make_move / apply+undo в секунду, оценок позиции в секунду
+   (по одной, инкрементально и пакетом на NumPy, если он установлен).
+3. Поиск на фиксированную глубину по сохранённым позициям середины игры (без таблицы транспозиций,
+   количество позиций и найденный ход от запуска к запуску не меняются - меняется только время).
+4. Ускорение параллельного поиска: те же позиции на ту же глубину последовательно и в ParallelSearch,
+   отношение времени (процессы пула запускаются до замера). --parallel-workers 0 - не замерять.
+
+Результат - JSON в stdout (и в --out), чтобы сравнивать между коммитами.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from base import Color, EvaluateCtx, Player
+from board import Board
+from engine import format_move
+from eveluate import EvaluateStrategy
+from parallel import ParallelSearch
+from positions import PositionLogic
+from process import GameProcess
+from search import AlphaBetaSearch
+
+PERFT_EXPECTED = {1: 26, 2: 676, 3: 17056, 4: 430336, 5: 10620972}
+"""Позиций от начальной позиции (одинаково для обеих начальных позиций - они зеркальны)"""
+
+MIDDLEGAME_POSITIONS: List[Tuple[str, int, int]] = [
+    # (название, белые, чёрные) - пользователь белыми (снизу), ходит компьютер (чёрные, сверху)
+    ('captures-3', 0x650a084000000000, 0x4002008e9),
+    ('captures-3b', 0xc60c200008000000, 0x800208097),
+    ('black-7', 0x2108662000000000, 0x102496),
+    ('advanced', 0x5918080800000000, 0x100b000aa),
+    ('center', 0xe200220a00000000, 0x200640aa),
+]
+
+
+def new_game(player_is_white: bool = True) -> GameProcess:
+    game = GameProcess()
+    game.TT_MEMORY_BYTES = 0
+    game.make_players(player_is_white=player_is_white)
+    return game
+
+
+def middlegame_boards(game: GameProcess) -> List[Tuple[str, Board]]:
+    return [
+        (name, Board(None, game.players, bitboards={Color.WHITE.value: white, Color.BLACK.value: black}))
+        for name, white, black in MIDDLEGAME_POSITIONS
+    ]
+
+
+def perft(board: Board, depth: int, player: Player, other_player: Player) -> int:
+    """Количество позиций на глубине depth (ходы делаются на самой доске через apply_code/undo)"""
+    if board.is_finished(player) or board.is_finished(other_player):
+        return 0
+    moves = board.logic.get_legal_move_codes(player)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        board.apply_code(move, player)
+        nodes += perft(board, depth - 1, other_player, player)
+        board.undo()
+    return nodes
+
+
+def measure(func: Callable[[], int], min_time: float) -> Tuple[float, int]:
+    """Повторять func, пока не пройдёт min_time секунд. Возвращает операций в секунду и количество операций"""
+    operations = 0
+    started = time.perf_counter()
+    while True:
+        operations += func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return operations / elapsed, operations
+
+
+def bench_perft(max_depth: int) -> List[dict]:
+    results = []
+    for player_is_white in (True, False):
+        game = new_game(player_is_white)
+        for depth in range(1, max_depth + 1):
+            started = time.perf_counter()
+            nodes = perft(game.board.copy(), depth, game.other_player, game.computer_player)
+            elapsed = time.perf_counter() - started
+            expected = PERFT_EXPECTED.get(depth)
+            results.append({
+                'start': 'black_top' if player_is_white else 'white_top',
+                'depth': depth,
+                'nodes': nodes,
+                'expected': expected,
+                'ok': expected is None or nodes == expected,
+                'seconds': elapsed,
+                'nodes_per_s': nodes / elapsed if elapsed else 0.0,
+            })
+    return results
+
+
+def bench_micro(min_time: float) -> Dict[str, dict]:
+    game = new_game()
+    boards = [board for _, board in middlegame_boards(game)]
+    players = list(game.players.values())
+    ctx = EvaluateCtx(next_step_player=game.computer_player, other_player=game.other_player)
+    moves = [(board, player, board.logic.get_legal_move_codes(player)) for board in boards for player in players]
+
+    def movegen():
+        # новая PositionLogic на каждый вызов - иначе ходы берутся из кэша
+        return sum(
+            len(PositionLogic(board.bitboards, board.players)._get_legal_moves(player))
+            for board in boards for player in players
+        )
+
+    def make_move():
+        count = 0
+        for board, player, codes in moves:
+            for code in codes:
+                board.make_move_code(code, player)
+            count += len(codes)
+        return count
+
+    def apply_undo():
+        count = 0
+        for board, player, codes in moves:
+            for code in codes:
+                board.apply_code(code, player)
+                board.undo()
+            count += len(codes)
+        return count
+
+    def evaluate():
+        for board in boards:
+            EvaluateStrategy(PositionLogic(board.bitboards, board.players)).calc_for(game.computer_player, ctx)
+        return len(boards)
+
+    incremental = [EvaluateStrategy.incremental(board.logic) for board in boards]
+
+    def evaluate_incremental():
+        for evaluation in incremental:
+            evaluation.calc_for(game.computer_player, ctx)
+        return len(incremental)
+
+    funcs = [
+        ('movegen_moves', movegen),
+        ('make_move', make_move),
+        ('apply_undo', apply_undo),
+        ('evaluate', evaluate),
+        ('evaluate_incremental', evaluate_incremental),
+    ]
+    try:
+        from batch import evaluate_batch, planes_from_boards
+    except ImportError:  # нет numpy - пакетную оценку не меряем
+        pass
+    else:
+        planes = planes_from_boards(boards * 200)
+
+        def evaluate_numpy():
+            evaluate_batch(planes, game.computer_player, ctx)
+            return len(boards) * 200
+
+        funcs.append(('evaluate_batch', evaluate_numpy))
+
+    results = {}
+    for name, func in funcs:
+        per_second, operations = measure(func, min_time)
+        results[name] = {'per_s': per_second, 'operations': operations}
+    return results
+
+
+def bench_search(depth: int) -> List[dict]:
+    game = new_game()
+    results = []
+    for name, board in middlegame_boards(game):
+        search = AlphaBetaSearch(game.computer_player, game.other_player)
+        started = time.perf_counter()
+        move = search.get_best_move(board, depth)
+        elapsed = time.perf_counter() - started
+        results.append({
+            'position': name,
+            'depth': depth,
+            'nodes': search.nodes,
+            'best_move': format_move(move) if move else None,
+            'seconds': elapsed,
+            'nodes_per_s': search.nodes / elapsed if elapsed else 0.0,
+        })
+    return results
+
+
+def bench_parallel(depth: int, workers: Optional[int]) -> dict:
+    game = new_game()
+    boards = middlegame_boards(game)
+    parallel = ParallelSearch(workers)
+    try:
+        # запуск процессов пула не входит в замер
+        parallel.get_best_move(boards[0][1], 1, game.computer_player)
+        positions = []
+        for name, board in boards:
+            search = AlphaBetaSearch(game.computer_player, game.other_player)
+            started = time.perf_counter()
+            serial_move = search.get_best_move(board, depth)
+            serial_time = time.perf_counter() - started
+            started = time.perf_counter()
+            parallel_move = parallel.get_best_move(board, depth, game.computer_player)
+            parallel_time = time.perf_counter() - started
+            positions.append({
+                'position': name,
+                'depth': depth,
+                'serial_seconds': serial_time,
+                'parallel_seconds': parallel_time,
+                'speedup': serial_time / parallel_time if parallel_time else 0.0,
+                'serial_nodes': search.nodes,
+                'parallel_nodes': parallel.stats.nodes,
+                'utilization': parallel.stats.utilization,
+                'same_move': (serial_move.packed if serial_move else None) == (
+                    parallel_move.packed if parallel_move else None),
+            })
+    finally:
+        parallel.close()
+    serial_total = sum(position['serial_seconds'] for position in positions)
+    parallel_total = sum(position['parallel_seconds'] for position in positions)
+    return {
+        'workers': parallel.workers,
+        'speedup': serial_total / parallel_total if parallel_total else 0.0,
+        'positions': positions,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры генератора ходов и поиска')
+    parser.add_argument('--perft-depth', type=int, default=4)
+    parser.add_argument('--search-depth', type=int, default=4)
+    parser.add_argument('--min-time', type=float, default=0.5, help='секунд на каждый микрозамер')
+    parser.add_argument('--parallel-workers', type=int, default=None,
+                        help='процессов параллельного поиска (по умолчанию - по числу ядер, 0 - не замерять)')
+    parser.add_argument('--out', default=None, help='записать JSON ещё и в файл')
+    args = parser.parse_args()
+
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'perft': bench_perft(args.perft_depth),
+        'micro': bench_micro(args.min_time),
+        'search': bench_search(args.search_depth),
+    }
+    if args.parallel_workers != 0:
+        results['parallel'] = bench_parallel(args.search_depth, args.parallel_workers)
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text + '\n')
+    if not all(result['ok'] for result in results['perft']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Битовое представление доски.
+
+Клетка (line, column) - это бит с номером line * 8 + column.
+На каждый цвет - одно 64-битное число, в котором единицы стоят на клетках с конями этого цвета.
+Маски ходов коня посчитаны заранее для каждой клетки, поэтому генерация ходов и проверка финиша -
+это операции над масками, а не обход 64 строк.
+"""
+
+from typing import Dict, Iterator, Tuple
+
+from base import BoardPositions, HorsePosition, Color
+
+EMPTY = '*'
+
+KNIGHT_STEPS = ((1, 2), (-1, 2), (1, -2), (-1, -2), (2, 1), (-2, 1), (2, -1), (-2, -1))
+"""Определение возможных ходов конём (порядок важен - в нём же генерируются ходы)"""
+
+
+def square(line: int, column: int) -> int:
+    """Номер клетки"""
+    return line * 8 + column
+
+
+def square_position(sq: int) -> HorsePosition:
+    """Позиция на доске по номеру клетки"""
+    return HorsePosition(divmod(sq, 8))
+
+
+def popcount(mask: int) -> int:
+    """Количество клеток в маске"""
+    return mask.bit_count()
+
+
+def iter_squares(mask: int) -> Iterator[int]:
+    """Номера клеток маски по возрастанию (построчно, как при обходе списка списков)"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+MOVE_SQUARES_MASK = 0xFFF
+"""Часть упакованного хода без флага рубки"""
+CAPTURE_FLAG = 1 << 12
+
+
+def pack_move(from_sq: int, to_sq: int, capture: bool = False) -> int:
+    """Ход одним числом: откуда | куда << 6 | рубка << 12"""
+    return from_sq | to_sq << 6 | capture << 12
+
+
+def move_from(code: int) -> int:
+    """Клетка, откуда ходит конь"""
+    return code & 63
+
+
+def move_to(code: int) -> int:
+    """Клетка, куда ходит конь"""
+    return code >> 6 & 63
+
+
+def is_capture(code: int) -> bool:
+    return bool(code & CAPTURE_FLAG)
+
+
+MIRROR_MOVE = 7 | 7 << 6
+"""XOR упакованного хода с этим числом - тот же ход в зеркальной позиции"""
+
+_REVERSED_BYTES = bytes(int(f'{byte:08b}'[::-1], 2) for byte in range(256))
+
+
+def mirror_square(sq: int) -> int:
+    """Клетка, зеркальная по колонкам (колонка c <-> 7 - c)"""
+    return sq ^ 7
+
+
+def mirror_bitboard(mask: int) -> int:
+    """Маска, зеркальная по колонкам: каждая линия - байт, в байте переставляются биты"""
+    return int.from_bytes(mask.to_bytes(8, 'little').translate(_REVERSED_BYTES), 'little')
+
+
+def mirror_bitboards(bitboards: Dict[str, int]) -> Dict[str, int]:
+    return {color: mirror_bitboard(mask) for color, mask in bitboards.items()}
+
+
+def mirror_move(code: int) -> int:
+    """Упакованный ход в зеркальной позиции (флаг рубки сохраняется)"""
+    return code ^ MIRROR_MOVE
+
+
+def flip_bitboard(mask: int) -> int:
+    """Маска, зеркальная по линиям (линия l <-> 7 - l): байты в обратном порядке"""
+    return int.from_bytes(mask.to_bytes(8, 'little'), 'big')
+
+
+def _knight_targets(sq: int) -> Tuple[int, ...]:
+    line, column = divmod(sq, 8)
+    targets = []
+    for i, j in KNIGHT_STEPS:
+        x, y = line + i, column + j
+        if 0 <= x < 8 and 0 <= y < 8:
+            targets.append(square(x, y))
+    return tuple(targets)
+
+
+def _mask(squares) -> int:
+    mask = 0
+    for sq in squares:
+        mask |= 1 << sq
+    return mask
+
+
+KNIGHT_TARGETS: Tuple[Tuple[int, ...], ...] = tuple(_knight_targets(sq) for sq in range(64))
+"""Клетки, куда может прыгнуть конь с каждой клетки (в порядке KNIGHT_STEPS)"""
+
+KNIGHT_MASKS: Tuple[int, ...] = tuple(_mask(targets) for targets in KNIGHT_TARGETS)
+"""Маска прыжков коня с каждой клетки"""
+
+LINE_MASKS: Tuple[int, ...] = tuple(_mask(square(line, column) for column in range(8)) for line in range(8))
+"""Маска каждой линии"""
+
+REACH_LINE_MASKS: Tuple[int, ...] = tuple(
+    _mask(sq for sq in range(64) if KNIGHT_MASKS[sq] & LINE_MASKS[line]) for line in range(8)
+)
+"""Клетки, с которых конь одним прыжком попадает на линию"""
+
+FORWARD_KNIGHT_MASKS: Dict[int, Tuple[int, ...]] = {
+    # домашняя линия 0 - идём к линии 7, вперёд это линии с большим номером
+    0: tuple(_mask(t for t in KNIGHT_TARGETS[sq] if t // 8 > sq // 8) for sq in range(64)),
+    # домашняя линия 7 - идём к линии 0
+    7: tuple(_mask(t for t in KNIGHT_TARGETS[sq] if t // 8 < sq // 8) for sq in range(64)),
+}
+"""Прыжки коня только вперёд (назад ходить нельзя, только рубить) - по домашней линии игрока"""
+
+
+def positions_to_bitboards(position: BoardPositions) -> Dict[str, int]:
+    """Список списков 'W'/'B'/'*' -> битовые доски по цветам"""
+    bitboards = {color.value: 0 for color in Color}
+    for line_index, line in enumerate(position):
+        for column_index, column_color in enumerate(line):
+            if column_color != EMPTY:
+                bitboards[column_color] |= 1 << square(line_index, column_index)
+    return bitboards
+
+
+def bitboards_to_positions(bitboards: Dict[str, int]) -> BoardPositions:
+    """Битовые доски -> список списков 'W'/'B'/'*' (нужен только для отрисовки)"""
+    position = [[EMPTY] * 8 for _ in range(8)]
+    for color, mask in bitboards.items():
+        for sq in iter_squares(mask):
+            line, column = divmod(sq, 8)
+            position[line][column] = color
+    return BoardPositions(position)
@@ -1,8 +1,9 @@
-import copy
 from typing import List, Optional, Dict
-from eveluate import EvaluateStrategy
-from base import Player, BoardPositions, HorsePosition, Move, Color, EvaluateCtx
+from eveluate import EvaluateStrategy, IncrementalEvaluation
+from base import Player, BoardPositions, Move, Color, EvaluateCtx
+from bitboard import positions_to_bitboards, bitboards_to_positions
 from positions import PositionLogic
+from zobrist import ZOBRIST_KEYS, ZOBRIST_MIRROR_KEYS, zobrist_hash, mirror_zobrist_hash
 
 
 def switch_color(color: Color):
@@ -54,22 +55,106 @@ class Board:
     """Шахматная Доска"""
     evaluate_strategy_cls: EvaluateStrategy = EvaluateStrategy
 
-    def __init__(self, position: Optional[BoardPositions], players: Dict[Color, Player]):
-        self.position = position
+    def __init__(self, position: Optional[BoardPositions], players: Dict[Color, Player],
+                 bitboards: Optional[Dict[str, int]] = None, zobrist: Optional[int] = None,
+                 mirror_zobrist: Optional[int] = None):
+        self.bitboards = bitboards if bitboards is not None else positions_to_bitboards(position)
         self.players = players
-        self.logic = PositionLogic(position, players)
+        self.logic = PositionLogic(self.bitboards, players)
+        self.hash = zobrist if zobrist is not None else zobrist_hash(self.bitboards)
+        """Хеш позиции по Зобристу (без учёта очереди хода)"""
+        self.mirror_hash = mirror_zobrist if mirror_zobrist is not None else mirror_zobrist_hash(self.bitboards)
+        """Хеш зеркальной по колонкам позиции"""
+        self._undo_stack: List[tuple] = []
+        """Ходы, сделанные через apply: (цвет, цвет соперника, откуда, куда, срублен ли конь, прошлые хеши)"""
+        self.evaluation: Optional[IncrementalEvaluation] = None
+        """Оценка, обновляемая по ходам apply/undo (включается start_incremental_evaluation)"""
+
+    @property
+    def position(self) -> BoardPositions:
+        """Позиция списком списков - только для отрисовки"""
+        return bitboards_to_positions(self.bitboards)
+
+    @property
+    def canonical_hash(self) -> int:
+        """Общий хеш позиции и её зеркала"""
+        return min(self.hash, self.mirror_hash)
+
+    @property
+    def is_mirrored(self) -> bool:
+        """canonical_hash взят от зеркала позиции - ходы под этим ключом хранятся зеркальными"""
+        return self.mirror_hash < self.hash
+
+    def is_finished(self, player: Player) -> bool:
+        """Игрок дошёл до финишной линии"""
+        return self.logic.is_finished(player)
 
     def evaluate(self, player: Player, ctx: EvaluateCtx) -> float:
         """
         Ценность позиции игрока в этом положении на доске
         """
+        if self.evaluation is not None:
+            return self.evaluation.calc_for(player, ctx)
         return self.evaluate_strategy_cls(self.logic).calc_for(player, ctx)
 
+    def start_incremental_evaluation(self):
+        """Дальше оценка не пересчитывается целиком, а обновляется по каждому apply/undo"""
+        self.evaluation = self.evaluate_strategy_cls.incremental(self.logic)
+
+    def copy(self) -> 'Board':
+        """Независимая копия доски"""
+        return Board(None, self.players, bitboards=dict(self.bitboards), zobrist=self.hash,
+                     mirror_zobrist=self.mirror_hash)
+
     def make_move(self, move: Move) -> 'Board':
         """Сделать ход. Создаем новую доску, делаем на ней ход и возвращаем новую доску"""
-        new_board = Board(copy.deepcopy(self.position), self.players)  # возможно нужна копия players
-        new_board.position[move.pos_from[0]][move.pos_from[1]] = '*'
-        new_board.position[move.pos_to[0]][move.pos_to[1]] = move.player.color.value
+        return self.make_move_code(move.packed, move.player)
+
+    def make_move_code(self, code: int, player: Player) -> 'Board':
+        """make_move для упакованного хода"""
+        new_board = self.copy()
+        new_board.apply_code(code, player)
         return new_board
 
+    def apply(self, move: Move):
+        """Сделать ход на этой же доске (без копирования, для поиска). Отменяется через undo()"""
+        self.apply_code(move.packed, move.player)
+
+    def apply_code(self, code: int, player: Player):
+        """apply для упакованного хода (см. bitboard.pack_move)"""
+        from_sq = code & 63
+        to_sq = code >> 6 & 63
+        to_bit = 1 << to_sq
+        color = player.color.value
+        opponent_color = player.opponent_color.value
+        bitboards = self.bitboards
+        captured = bool(bitboards[opponent_color] & to_bit)
+        self._undo_stack.append((color, opponent_color, from_sq, to_sq, captured, self.hash, self.mirror_hash))
+
+        bitboards[color] = bitboards[color] & ~(1 << from_sq) | to_bit
+        zobrist = self.hash ^ ZOBRIST_KEYS[color][from_sq] ^ ZOBRIST_KEYS[color][to_sq]
+        mirror_keys = ZOBRIST_MIRROR_KEYS[color]
+        mirror_zobrist = self.mirror_hash ^ mirror_keys[from_sq] ^ mirror_keys[to_sq]
+        if captured:  # если там был чужой конь - он срублен
+            bitboards[opponent_color] &= ~to_bit
+            zobrist ^= ZOBRIST_KEYS[opponent_color][to_sq]
+            mirror_zobrist ^= ZOBRIST_MIRROR_KEYS[opponent_color][to_sq]
+        self.hash = zobrist
+        self.mirror_hash = mirror_zobrist
+        self.logic.invalidate()
+        if self.evaluation is not None:
+            self.evaluation.update(color, opponent_color, from_sq, to_sq, captured, 1)
 
+    def undo(self):
+        """Отменить последний ход, сделанный через apply()"""
+        color, opponent_color, from_sq, to_sq, captured, zobrist, mirror_zobrist = self._undo_stack.pop()
+        if self.evaluation is not None:
+            self.evaluation.update(color, opponent_color, from_sq, to_sq, captured, -1)
+        to_bit = 1 << to_sq
+        bitboards = self.bitboards
+        bitboards[color] = bitboards[color] & ~to_bit | 1 << from_sq
+        if captured:
+            bitboards[opponent_color] |= to_bit
+        self.hash = zobrist
+        self.mirror_hash = mirror_zobrist
+        self.logic.invalidate()
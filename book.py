@@ -0,0 +1,183 @@
+"""
+Дебютная книга: лучшие ходы компьютера в первых позициях игры, посчитанные заранее.
+
+Файл - заголовок и отсортированные по ключу записи (ключ позиции 8 байт, упакованный ход 2 байта).
+Ключ - Board.canonical_hash ^ ZOBRIST_TO_MOVE[цвет компьютера]: позиция и её зеркало по колонкам - одна запись,
+ход хранится в ориентации ключа. Файл не читается целиком, а отображается в память (mmap) и ищется
+двоичным поиском: процессы движка на одной машине делят одни и те же страницы файла.
+
+Генерация: python book.py --out opening_book.bin [--plies 2] [--depth 6] [--workers N]
+Перебираются все ходы пользователя, за компьютер - найденный лучший ход, и так plies ходов компьютера,
+для обеих начальных позиций. Позиции ищутся в пуле процессов.
+"""
+
+import argparse
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from base import Move, Player
+from bitboard import mirror_move
+from board import Board
+from search import AlphaBetaSearch
+from transposition import TranspositionTable
+from zobrist import ZOBRIST_TO_MOVE
+
+
+def book_key(board: Board, player: Player) -> Tuple[int, bool]:
+    """Ключ позиции, где ходит player, и то, что ключ взят от зеркала позиции"""
+    return board.canonical_hash ^ ZOBRIST_TO_MOVE[player.color.value], board.is_mirrored
+
+
+class OpeningBook:
+    """Дебютная книга, открытая через mmap"""
+    MAGIC = b'HGBOOK01'
+    HEADER = struct.Struct('<8sII')
+    """Метка формата, количество записей, глубина поиска при генерации"""
+    RECORD = struct.Struct('<QH')
+    """Ключ позиции, упакованный ход"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.depth = self.HEADER.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC or len(self._mmap) != self.HEADER.size + self.count * self.RECORD.size:
+            self._mmap.close()
+            raise ValueError(f'{path} - не дебютная книга')
+
+    def __len__(self) -> int:
+        return self.count
+
+    def probe(self, key: int) -> Optional[int]:
+        """Ход по ключу позиции (двоичный поиск по файлу)"""
+        record, offset = self.RECORD, self.HEADER.size
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            middle_key, move = record.unpack_from(self._mmap, offset + middle * record.size)
+            if middle_key == key:
+                return move
+            if middle_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def get_move(self, board: Board, player: Player) -> Optional[Move]:
+        """Ход игрока из книги (None - позиции в книге нет)"""
+        key, mirrored = book_key(board, player)
+        code = self.probe(key)
+        if code is None:
+            return None
+        if mirrored:
+            code = mirror_move(code)
+        # ключ мог совпасть случайно - ход должен быть возможен
+        if not board.logic.is_legal(player, code):
+            return None
+        return Move.from_packed(player, code)
+
+    def close(self):
+        self._mmap.close()
+
+    @classmethod
+    def write(cls, path: str, records: Dict[int, int], depth: int):
+        """Записать книгу (ключ -> упакованный ход). Файл подменяется целиком - недописанную книгу никто не откроет"""
+        with open(path + '.tmp', 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, len(records), depth))
+            for key in sorted(records):
+                f.write(cls.RECORD.pack(key, records[key]))
+        os.replace(path + '.tmp', path)
+
+
+_books: Dict[str, Tuple[int, OpeningBook]] = {}
+"""Путь -> время изменения файла и открытая книга"""
+
+
+def open_book(path: str) -> Optional[OpeningBook]:
+    """
+    Книга по пути, одна на процесс (None - файла нет).
+    Книга, построенная или перестроенная, пока процесс работает, открывается заново.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _books.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = _books[path] = (mtime, OpeningBook(path))
+    return cached[1]
+
+
+_transposition_table: Optional[TranspositionTable] = None
+
+
+def _search_book_position(bitboards: Dict[str, int], players: Dict[str, Player], color: str, depth: int) -> int:
+    """Лучший ход позиции (выполняется в процессе пула)"""
+    global _transposition_table
+    if _transposition_table is None:
+        _transposition_table = TranspositionTable()
+    player = players[color]
+    search = AlphaBetaSearch(player, players[player.opponent_color.value], transposition_table=_transposition_table)
+    return search.get_best_move(Board(None, players, bitboards=bitboards), depth).packed
+
+
+def generate(path: str, plies: int, depth: int, workers: Optional[int] = None):
+    """Построить книгу: plies ходов компьютера от обеих начальных позиций, поиск на глубину depth"""
+    from process import GameProcess
+
+    records: Dict[int, int] = {}
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=context) as executor:
+        for player_is_white in (True, False):
+            game = GameProcess()
+            game.TT_MEMORY_BYTES = 0
+            game.make_players(player_is_white=player_is_white)
+            user, computer = game.other_player, game.computer_player
+            frontier = [game.board]
+            for ply in range(plies):
+                # позиции после каждого хода пользователя (зеркальные - один раз)
+                positions: Dict[int, Tuple[Board, bool]] = {}
+                for board in frontier:
+                    for code in board.logic.get_legal_move_codes(user):
+                        child = board.make_move_code(code, user)
+                        key, mirrored = book_key(child, computer)
+                        if key not in records and key not in positions and not child.is_finished(user):
+                            positions[key] = (child, mirrored)
+
+                started = time.perf_counter()
+                futures = {
+                    key: executor.submit(_search_book_position, board.bitboards, board.players, computer.color.value, depth)
+                    for key, (board, _) in positions.items()
+                }
+                frontier = []
+                for key, future in futures.items():
+                    move = future.result()
+                    board, mirrored = positions[key]
+                    records[key] = mirror_move(move) if mirrored else move
+                    child = board.make_move_code(move, computer)
+                    if not child.is_finished(computer):
+                        frontier.append(child)
+                print(f'{"белые" if player_is_white else "чёрные"} у пользователя, ход {ply + 1}: '
+                      f'{len(positions)} позиций за {time.perf_counter() - started:.1f} с')
+
+    OpeningBook.write(path, records, depth)
+    print(f'{path}: {len(records)} позиций')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генерация дебютной книги')
+    parser.add_argument('--out', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opening_book.bin'))
+    parser.add_argument('--plies', type=int, default=2, help='ходов компьютера от начала игры')
+    parser.add_argument('--depth', type=int, default=6, help='глубина поиска каждой позиции')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    generate(args.out, args.plies, args.depth, args.workers)
+
+
+if __name__ == '__main__':
+    main()
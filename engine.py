@@ -0,0 +1,233 @@
+"""
+Движок без интерфейса: GameProcess по простому строковому протоколу через stdin/stdout.
+
+Запуск: python engine.py [--white] [--hash MB] [--depth N]
+Одна игра - один процесс. pygame не импортируется ни здесь, ни в модулях движка.
+
+Команды (по одной в строке):
+    isready                                     -> readyok
+    newgame [white|black]                       цвет пользователя (компьютер - другой цвет, его домашняя линия 0)
+    position startpos [moves 7253 0021 ...]     начальная позиция и ходы после неё
+    position bits <белые> <чёрные> [moves ...]  позиция битовыми досками (клетка line * 8 + column, можно 0x...)
+    go depth <N>                                -> bestmove <ход> (или bestmove none), N - от 1 до GameProcess.MAX_DEPTH
+    go movetime <мс>                            то же, но поиск по времени
+    analyze depth <N> [lines <K>]               -> K лучших ходов компьютера (по умолчанию 3) за один поиск
+    analyze movetime <мс> [lines <K>]           то же, но поиск по времени
+    quit
+
+Ход - четыре цифры: линия и колонка откуда, линия и колонка куда (как в консольном вводе, только без пробела).
+Ходить в moves может любая сторона - цвет определяется по коню на клетке, откуда ход.
+Перед bestmove выводится строка info depth <глубина> nodes <позиции> time <мс> (или info book - ход из дебютной книги).
+analyze выводит ту же строку info, затем по строке на вариант: info line <номер> score <оценка> pv <ходы>
+(оценка для компьютера, #N - выигрыш через N ходов, -#N - проигрыш) и bestmove - ход первого варианта.
+Дебютная книга в analyze не используется.
+Дебютная книга - GameProcess.BOOK_PATH, --book задаёт другой файл, --no-book отключает её.
+Всё, что печатает GameProcess, уходит в stderr, чтобы не мешать протоколу.
+"""
+
+import argparse
+import contextlib
+import sys
+import time
+from typing import List, Optional, TextIO, Tuple
+
+from base import Color, HorsePosition, Move
+from bitboard import MOVE_SQUARES_MASK
+from board import Board, BLACK_TOP_POSITIONS, WHITE_TOP_POSITIONS
+from process import GameProcess
+from search import format_score
+
+
+class EngineError(Exception):
+    """Неверная команда протокола"""
+
+
+def parse_move(text: str) -> Move:
+    """'7253' -> Move без игрока (игрок определяется по доске)"""
+    if len(text) != 4 or not text.isdigit() or any(int(c) > 7 for c in text):
+        raise EngineError(f'bad move {text}')
+    return Move(
+        player=None,
+        pos_from=HorsePosition((int(text[0]), int(text[1]))),
+        pos_to=HorsePosition((int(text[2]), int(text[3]))),
+    )
+
+
+def format_move(move: Move) -> str:
+    return move.notation
+
+
+class HeadlessEngine:
+    """Обработка команд протокола для одной игры"""
+    DEFAULT_DEPTH = GameProcess.PREDICT_LEVEL
+
+    def __init__(self, player_is_white: bool = True, tt_memory_bytes: Optional[int] = None,
+                 default_depth: Optional[int] = None, book_path: Optional[str] = GameProcess.BOOK_PATH):
+        self.tt_memory_bytes = tt_memory_bytes
+        self.default_depth = default_depth or self.DEFAULT_DEPTH
+        self.book_path = book_path
+        self.game = self.new_game(player_is_white)
+
+    def new_game(self, player_is_white: bool) -> GameProcess:
+        game = GameProcess()
+        if self.tt_memory_bytes is not None:
+            game.TT_MEMORY_BYTES = self.tt_memory_bytes
+        game.BOOK_PATH = self.book_path
+        game.make_players(player_is_white=player_is_white)
+        return game
+
+    def handle(self, line: str) -> List[str]:
+        """Выполнить команду, вернуть строки ответа"""
+        tokens = line.split()
+        if not tokens:
+            return []
+        command, args = tokens[0], tokens[1:]
+        if command == 'isready':
+            return ['readyok']
+        if command == 'newgame':
+            self.game.close()
+            self.game = self.new_game(player_is_white=(args or ['white'])[0] != 'black')
+            return []
+        if command == 'position':
+            self.set_position(args)
+            return []
+        if command == 'go':
+            return self.go(args)
+        if command == 'analyze':
+            return self.analyze(args)
+        raise EngineError(f'unknown command {command}')
+
+    def set_position(self, args: List[str]):
+        game = self.game
+        if args[:1] == ['startpos']:
+            player_is_white = game.other_player.color == Color.WHITE
+            board = Board(BLACK_TOP_POSITIONS if player_is_white else WHITE_TOP_POSITIONS, game.players)
+            rest = args[1:]
+        elif args[:1] == ['bits'] and len(args) >= 3:
+            try:
+                white, black = int(args[1], 0), int(args[2], 0)
+            except ValueError:
+                raise EngineError('bad bitboards')
+            if white & black or white >> 64 or black >> 64:
+                raise EngineError('bad bitboards')
+            board = Board(None, game.players, bitboards={Color.WHITE.value: white, Color.BLACK.value: black})
+            rest = args[3:]
+        else:
+            raise EngineError('position startpos|bits <white> <black> [moves ...]')
+
+        if rest and rest[0] != 'moves':
+            raise EngineError(f'unexpected {rest[0]}')
+        for text in rest[1:]:
+            board = self.make_move(board, parse_move(text), text)
+
+        # позиция задаётся целиком - выбор хода пользователем в GUI сбрасываем, партия не записывается
+        game.board = board
+        game._position_from = None
+        game.user_legal_moves = None
+        game.game_record = None
+        game.no_moves_player = None
+
+    @staticmethod
+    def make_move(board: Board, move: Move, text: str) -> Board:
+        from_bit = 1 << (move.pos_from[0] * 8 + move.pos_from[1])
+        color = next((color for color, mask in board.bitboards.items() if mask & from_bit), None)
+        if color is None:
+            raise EngineError(f'illegal move {text}')
+        move.player = board.players[color]
+        legal_codes = {code & MOVE_SQUARES_MASK for code in board.logic.get_legal_move_codes(move.player)}
+        if move.packed not in legal_codes:
+            raise EngineError(f'illegal move {text}')
+        return board.make_move(move)
+
+    def parse_limits(self, args: List[str]) -> Tuple[int, Optional[float]]:
+        """depth <N> | movetime <мс> -> глубина и время на поиск (None - поиск на глубину)"""
+        if args[:1] == ['depth'] and len(args) == 2 and args[1].isdigit() and int(args[1]) > 0:
+            if int(args[1]) > self.game.MAX_DEPTH:
+                raise EngineError(f'depth must be 1..{self.game.MAX_DEPTH}')
+            return int(args[1]), None
+        if args[:1] == ['movetime'] and len(args) == 2 and args[1].isdigit() and int(args[1]) > 0:
+            return self.game.MAX_DEPTH, int(args[1]) / 1000
+        if args:
+            raise EngineError('depth <N> | movetime <ms>')
+        return self.default_depth, None
+
+    def go(self, args: List[str]) -> List[str]:
+        game = self.game
+        depth, time_budget = self.parse_limits(args)
+
+        move = game.get_book_move()
+        if move is not None:
+            game.record_stats(game.book_stats(move))
+            return ['info book', f'bestmove {format_move(move)}']
+
+        started = time.perf_counter()
+        move = game.get_best_move(depth=depth, player=game.computer_player, other_player=game.other_player,
+                                  time_budget=time_budget)
+        elapsed = int((time.perf_counter() - started) * 1000)
+        return [
+            f'info depth {game.depth_reached} nodes {game.nodes} time {elapsed}',
+            f'bestmove {format_move(move) if move else "none"}',
+        ]
+
+    def analyze(self, args: List[str]) -> List[str]:
+        game = self.game
+        lines = game.HINT_LINES
+        if len(args) >= 2 and args[-2] == 'lines':
+            if not args[-1].isdigit() or int(args[-1]) < 1:
+                raise EngineError('lines <K>')
+            lines = int(args[-1])
+            args = args[:-2]
+        depth, time_budget = self.parse_limits(args)
+
+        started = time.perf_counter()
+        analysis = game.analyze(depth, lines, time_budget=time_budget)
+        elapsed = int((time.perf_counter() - started) * 1000)
+        response = [f'info depth {game.depth_reached} nodes {game.nodes} time {elapsed}']
+        for number, line in enumerate(analysis, 1):
+            pv = ' '.join(format_move(move) for move in line.pv)
+            response.append(f'info line {number} score {format_score(line.score)} pv {pv}')
+        response.append(f'bestmove {format_move(analysis[0].move) if analysis else "none"}')
+        return response
+
+    def close(self):
+        self.game.close()
+
+
+def serve(engine: HeadlessEngine, stdin: TextIO, stdout: TextIO):
+    """Читать команды до quit или конца ввода"""
+    for line in stdin:
+        if line.strip() == 'quit':
+            break
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                answer = engine.handle(line)
+        except EngineError as e:
+            answer = [f'error {e}']
+        for out in answer:
+            stdout.write(out + '\n')
+        stdout.flush()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Движок "Буква Г" без интерфейса')
+    parser.add_argument('--white', action='store_true', help='компьютер играет белыми (по умолчанию - чёрными)')
+    parser.add_argument('--hash', type=int, default=None, help='память под таблицу транспозиций, МБ (0 - без неё)')
+    parser.add_argument('--depth', type=int, default=None, help='глубина для go без параметров')
+    parser.add_argument('--book', default=GameProcess.BOOK_PATH, help='файл дебютной книги')
+    parser.add_argument('--no-book', action='store_true', help='не использовать дебютную книгу')
+    args = parser.parse_args(argv)
+
+    engine = HeadlessEngine(
+        player_is_white=not args.white,
+        tt_memory_bytes=args.hash * 1024 * 1024 if args.hash is not None else None,
+        default_depth=args.depth,
+        book_path=None if args.no_book else args.book,
+    )
+    try:
+        serve(engine, sys.stdin, sys.stdout)
+    finally:
+        engine.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,12 @@
+from typing import Dict, List, Type, TYPE_CHECKING
 
-from base import Player, EvaluateCtx
+from base import Player, EvaluateCtx, Color
+from bitboard import KNIGHT_MASKS, LINE_MASKS, iter_squares, popcount
 from positions import PositionLogic
 
+if TYPE_CHECKING:
+    import numpy as np
+
 
 class IEvaluateIndex:
     """Показатель/Критерий"""
@@ -12,15 +17,119 @@ class IEvaluateIndex:
     def calc_for(self, player: Player, ctx: EvaluateCtx) -> float:
         raise NotImplementedError
 
+    @classmethod
+    def is_mirror_symmetric(cls) -> bool:
+        """Показатель не меняется, если отразить доску по колонкам (колонка c <-> 7 - c)"""
+        return False
+
+    # Инкрементальный расчёт: показатель хранит свой вклад и обновляет его по каждому ходу
+
+    def reset(self):
+        """Посчитать вклад заново по текущей позиции"""
+        raise NotImplementedError
+
+    def update(self, color: str, opponent_color: str, from_sq: int, to_sq: int, captured: bool, sign: int):
+        """
+        Учесть ход (sign=1) или его отмену (sign=-1).
+        Доски в обоих случаях - в положении после хода.
+        """
+        raise NotImplementedError
+
+    def calc_incremental(self, player: Player, ctx: EvaluateCtx) -> float:
+        """То же, что calc_for, но по накопленному вкладу"""
+        raise NotImplementedError
+
+    # Пакетный расчёт (см. batch.py): planes - цвет -> массив (позиции, 64) из 0 и 1
+
+    @classmethod
+    def calc_batch(cls, planes: Dict[str, 'np.ndarray'], player: Player, ctx: EvaluateCtx) -> 'np.ndarray':
+        """То же, что calc_for, для всех позиций сразу"""
+        raise NotImplementedError
+
+
+class PieceSquareEvaluateIndex(IEvaluateIndex):
+    """Показатель, который складывается из очков каждого коня на его клетке"""
+    totals: Dict[str, int]
+
+    def piece_score(self, player: Player, sq: int) -> int:
+        raise NotImplementedError
+
+    @classmethod
+    def is_mirror_symmetric(cls) -> bool:
+        index = cls(None)
+        return all(
+            index.piece_score(player, sq) == index.piece_score(player, sq ^ 7)
+            for player in (Player(Color.WHITE, 0, True), Player(Color.BLACK, 7, False)) for sq in range(64)
+        )
+
+    @classmethod
+    def piece_weights(cls, player: Player) -> List[int]:
+        """Очки коня игрока на каждой клетке"""
+        index = cls(None)
+        return [index.piece_score(player, sq) for sq in range(64)]
+
+    def reset(self):
+        self.totals = {
+            color: sum(self.piece_score(player, sq) for sq in iter_squares(self.logic.bitboards[color]))
+            for color, player in self.logic.players.items()
+        }
+
+    def update(self, color: str, opponent_color: str, from_sq: int, to_sq: int, captured: bool, sign: int):
+        players = self.logic.players
+        player = players[color]
+        self.totals[color] += sign * (self.piece_score(player, to_sq) - self.piece_score(player, from_sq))
+        if captured:
+            self.totals[opponent_color] -= sign * self.piece_score(players[opponent_color], to_sq)
+
 
 # todo близость к пустым финишным клеткам
 
 class DangerPositionsEvaluateIndex(IEvaluateIndex):
     """Оценка позиций под угрозой сруба"""
+    DANGER_SCORE = 100
+    """Очки за каждую возможную рубку"""
+    pairs: int
+    """Пары (свой конь, чужой конь) на расстоянии хода конём - столько рубок есть у каждой из сторон"""
 
     def calc_for(self, player: Player, ctx: EvaluateCtx) -> float:
         dangers = self.logic.get_danger_positions(player)
-        score = len(dangers) * 100
+        return self.score(len(dangers), ctx)
+
+    @classmethod
+    def is_mirror_symmetric(cls) -> bool:
+        return True  # ход конём в зеркале - тоже ход конём
+
+    def reset(self):
+        # удар конём симметричен: если A бьёт B, то и B бьёт A, поэтому число рубок у сторон одинаковое
+        bitboards = list(self.logic.bitboards.values())
+        self.pairs = sum(popcount(KNIGHT_MASKS[sq] & bitboards[1]) for sq in iter_squares(bitboards[0]))
+
+    def update(self, color: str, opponent_color: str, from_sq: int, to_sq: int, captured: bool, sign: int):
+        own = self.logic.bitboards[color]
+        opponent = self.logic.bitboards[opponent_color]
+        to_bit = 1 << to_sq
+        # конь ушёл с from_sq (если рубил - срубленный был ещё на доске)
+        delta = -popcount(KNIGHT_MASKS[from_sq] & (opponent | to_bit if captured else opponent))
+        if captured:
+            # срубленный конь больше не под ударом наших коней (кроме ушедшего - он учтён выше)
+            delta -= popcount(KNIGHT_MASKS[to_sq] & own & ~to_bit)
+        # конь встал на to_sq
+        delta += popcount(KNIGHT_MASKS[to_sq] & opponent)
+        self.pairs += sign * delta
+
+    def calc_incremental(self, player: Player, ctx: EvaluateCtx) -> float:
+        return self.score(self.pairs, ctx)
+
+    @classmethod
+    def calc_batch(cls, planes: Dict[str, 'np.ndarray'], player: Player, ctx: EvaluateCtx) -> 'np.ndarray':
+        from batch import knight_matrix
+        # для каждого нашего коня - сколько чужих он бьёт
+        pairs = ((planes[player.color.value] @ knight_matrix()) * planes[player.opponent_color.value]).sum(axis=1)
+        return cls.score(pairs, ctx)
+
+    @classmethod
+    def score(cls, dangers_count: int, ctx: EvaluateCtx) -> float:
+        score = dangers_count * cls.DANGER_SCORE
 
         # todo продумать большой вес, чтобы обязательно рубить (доработка get_danger_positions)
 
@@ -31,29 +140,52 @@ class DangerPositionsEvaluateIndex(IEvaluateIndex):
             return - score
 
 
-class TotalCountEvaluateIndex(IEvaluateIndex):
+class TotalCountEvaluateIndex(PieceSquareEvaluateIndex):
     """ Оценка количества коней (0 - 100)  """
     max = 8
+    SCORE = 100.0
+    """Очки за всех max коней"""
 
     def calc_for(self, player: Player, ctx: EvaluateCtx) -> float:
-        return len(self.logic.get_player_positions(player)) / 8 * 100.0
+        return popcount(self.logic.get_bitboard(player)) / self.max * self.SCORE
+
+    def piece_score(self, player: Player, sq: int) -> int:
+        return 1
 
+    def calc_incremental(self, player: Player, ctx: EvaluateCtx) -> float:
+        return self.totals[player.color.value] / self.max * self.SCORE
 
-class HomeTotalCountEvaluateIndex(IEvaluateIndex):
+    @classmethod
+    def calc_batch(cls, planes: Dict[str, 'np.ndarray'], player: Player, ctx: EvaluateCtx) -> 'np.ndarray':
+        return planes[player.color.value].sum(axis=1) / cls.max * cls.SCORE
+
+
+class HomeTotalCountEvaluateIndex(PieceSquareEvaluateIndex):
     """Оценка количества коней на домашнем месте (0 - 100)"""
     max = 8
 
+    # две крайние позиции весят меньше, т.к их прикрывают соседи (предположение)
+    score_column_map = {0: 10, 1: 10, 2: 15, 3: 15, 4: 15, 5: 15, 6: 10, 7: 10}
+
     def calc_for(self, player: Player, ctx: EvaluateCtx) -> float:
-        positions = self.logic.get_player_positions(player)
         # колонки, которые закрывают домашние позиции
-        home_columns = [column_index for line_index, column_index in positions if line_index == player.home_line]
+        home = self.logic.get_bitboard(player) & LINE_MASKS[player.home_line]
+        home_columns = [sq % 8 for sq in iter_squares(home)]
+        return sum([self.score_column_map.get(column_index) for column_index in home_columns])
+
+    def piece_score(self, player: Player, sq: int) -> int:
+        line, column = divmod(sq, 8)
+        return self.score_column_map.get(column) if line == player.home_line else 0
+
+    def calc_incremental(self, player: Player, ctx: EvaluateCtx) -> float:
+        return self.totals[player.color.value]
 
-        # две крайние позиции весят меньше, т.к их прикрывают соседи (предположение)
-        score_column_map = {0: 10, 1: 10, 2: 15, 3: 15, 4: 15, 5: 15, 6: 10, 7: 10}
-        return sum([score_column_map.get(column_index) for column_index in home_columns])
+    @classmethod
+    def calc_batch(cls, planes: Dict[str, 'np.ndarray'], player: Player, ctx: EvaluateCtx) -> 'np.ndarray':
+        return planes[player.color.value] @ cls.piece_weights(player)
 
 
-class FinishTotalCountEvaluateIndex(IEvaluateIndex):
+class FinishTotalCountEvaluateIndex(PieceSquareEvaluateIndex):
     """Оценка близости коней к финишному месту"""
     SCORE_LINE_MAP = {0: 1000, 1: 900, 2: 700, 3: 500, 4: 200, 5: 100, 6: 0, 7: 0}
 
@@ -64,14 +196,27 @@ class FinishTotalCountEvaluateIndex(IEvaluateIndex):
 
     def calc_player(self, player: Player):
         # Ищем линии, которые занимают наши пешки. Чем ближе к финишу - тем лучше.
-        positions = self.logic.get_player_positions(player)
-        lines = [line_index for line_index, column_index in positions]
+        positions = self.logic.get_bitboard(player)
         scores = 0
-        for line in lines:
-            diff = abs(player.finish_line - line)
-            scores += self.SCORE_LINE_MAP.get(diff, 0)
+        for line, line_mask in enumerate(LINE_MASKS):
+            count = popcount(positions & line_mask)
+            if count:
+                diff = abs(player.finish_line - line)
+                scores += self.SCORE_LINE_MAP.get(diff, 0) * count
         return scores
 
+    def piece_score(self, player: Player, sq: int) -> int:
+        return self.SCORE_LINE_MAP.get(abs(player.finish_line - sq // 8), 0)
+
+    def calc_incremental(self, player: Player, ctx: EvaluateCtx) -> float:
+        return self.totals[player.color.value] - self.totals[ctx.other_player.color.value]
+
+    @classmethod
+    def calc_batch(cls, planes: Dict[str, 'np.ndarray'], player: Player, ctx: EvaluateCtx) -> 'np.ndarray':
+        other_player = ctx.other_player
+        return planes[player.color.value] @ cls.piece_weights(player) \
+            - planes[other_player.color.value] @ cls.piece_weights(other_player)
+
 
 # class OtherPlayerAhtungEvaluateIndex(IEvaluateIndex):
 #     """Юзер бликок к победе!!! Ахтунг"""
@@ -101,6 +246,13 @@ class IEvaluateStrategy:
 
 
 class EvaluateStrategy(IEvaluateStrategy):
+    INDEXES: List[Type[IEvaluateIndex]] = [
+        TotalCountEvaluateIndex,
+        HomeTotalCountEvaluateIndex,
+        DangerPositionsEvaluateIndex,
+        FinishTotalCountEvaluateIndex,
+        # OtherPlayerAhtungEvaluateIndex,
+    ]
 
     def calc_for(self, player: Player, ctx: EvaluateCtx) -> float:
         """
@@ -114,11 +266,42 @@ class EvaluateStrategy(IEvaluateStrategy):
         :param player:
         :return:
         """
-        scores = sum([
-            TotalCountEvaluateIndex(self.logic).calc_for(player, ctx),
-            HomeTotalCountEvaluateIndex(self.logic).calc_for(player, ctx),
-            DangerPositionsEvaluateIndex(self.logic).calc_for(player, ctx),
-            FinishTotalCountEvaluateIndex(self.logic).calc_for(player, ctx),
-            # OtherPlayerAhtungEvaluateIndex(self.logic).calc_for(player, ctx),
-        ])
+        scores = sum([index_cls(self.logic).calc_for(player, ctx) for index_cls in self.INDEXES])
         return scores
+
+    @classmethod
+    def is_mirror_symmetric(cls) -> bool:
+        """
+        Оценка позиции и её зеркала по колонкам одинакова (все показатели симметричны).
+        Только тогда поиск и дебютная книга хранят позицию и её зеркало под одним ключом.
+        """
+        return all(index_cls.is_mirror_symmetric() for index_cls in cls.INDEXES)
+
+    @classmethod
+    def calc_batch(cls, planes: Dict[str, 'np.ndarray'], player: Player, ctx: EvaluateCtx) -> 'np.ndarray':
+        """calc_for для многих позиций сразу (см. batch.py), показатели складываются в том же порядке"""
+        return sum([index_cls.calc_batch(planes, player, ctx) for index_cls in cls.INDEXES])
+
+    @classmethod
+    def incremental(cls, logic: PositionLogic) -> 'IncrementalEvaluation':
+        """Оценка, которая дальше обновляется по ходам (см. Board.start_incremental_evaluation)"""
+        return IncrementalEvaluation(cls.INDEXES, logic)
+
+
+class IncrementalEvaluation:
+    """
+    Оценка позиции, которая обновляется по ходам вместо полного пересчёта на каждом листе.
+    Результат calc_for совпадает с EvaluateStrategy.calc_for для той же позиции.
+    """
+
+    def __init__(self, indexes: List[Type[IEvaluateIndex]], logic: PositionLogic):
+        self.indexes = [index_cls(logic) for index_cls in indexes]
+        for index in self.indexes:
+            index.reset()
+
+    def update(self, color: str, opponent_color: str, from_sq: int, to_sq: int, captured: bool, sign: int):
+        for index in self.indexes:
+            index.update(color, opponent_color, from_sq, to_sq, captured, sign)
+
+    def calc_for(self, player: Player, ctx: EvaluateCtx) -> float:
+        return sum([index.calc_incremental(player, ctx) for index in self.indexes])
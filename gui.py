@@ -1,9 +1,9 @@
-from typing import List, Optional
-
-import pygame as pg
+from typing import Dict, FrozenSet, List, Optional, Tuple
 
 from base import HorsePosition, BoardPositions, Color
+from background import BackgroundEngine
 from process import GameProcess
+from search import AnalysisLine, format_score
 from base import UserStepFinishedEvent, ClickEvent
 
 
@@ -22,27 +22,30 @@ def get_legal_point(x, y):
     return x * TILE + 40, y * TILE + 40, 20, 20
 
 
-def get_click_mouse_pos(sc) -> Optional[ClickEvent]:
-    """подсветить клетку и вернуть клик"""
-    x, y = pg.mouse.get_pos()
-    grid_x, grid_y = x // TILE, y // TILE
-    BLUE = (10, 135, 206, 235)
-    # pg.Rect(get_rect(grid_x, grid_y))
-    pg.draw.rect(sc, BLUE, get_figure(grid_x, grid_y), 5, border_radius=100)
-    # sc.set_alpha(80)
-    click = pg.mouse.get_pressed()
-    return ClickEvent(line=grid_y, column=grid_x) if click[0] else False
+def get_tile_event(pos) -> ClickEvent:
+    """Клетка под точкой экрана"""
+    x, y = pos
+    return ClickEvent(line=y // TILE, column=x // TILE)
+
 
+BLUE = (10, 135, 206, 235)
+GREEN = (34, 139, 34)
 
-def draw_current_position(sc, grid_y, grid_x):
-    BLUE = (10, 135, 206, 235)
-    pg.draw.rect(sc, BLUE, get_figure(grid_x, grid_y), 5, border_radius=100)
 
+def draw_current_position(sc, grid_y, grid_x, color=BLUE):
+    pg.draw.rect(sc, color, get_figure(grid_x, grid_y), 5, border_radius=100)
 
-def draw_legal_moves(sc, positions: List[HorsePosition]):
-    BLUE = (10, 135, 206, 235)
+
+def draw_legal_moves(sc, positions: List[HorsePosition], color=BLUE):
     for p in positions:
-        pg.draw.rect(sc, BLUE, get_legal_point(p[1], p[0]), 10, border_radius=100)
+        pg.draw.rect(sc, color, get_legal_point(p[1], p[0]), 10, border_radius=100)
+
+
+def draw_hints(sc, font, line, column, texts: List[str]):
+    """Подсказка на клетке, куда ведёт ход: точка хода и номер варианта с оценкой (в левом верхнем углу)"""
+    draw_legal_moves(sc, [HorsePosition((line, column))], GREEN)
+    for i, text in enumerate(texts):
+        sc.blit(font.render(text, True, GREEN), (column * TILE + 4, line * TILE + 2 + i * 18))
 
 
 def draw_board(sc, position: BoardPositions):
@@ -60,57 +63,200 @@ def draw_board(sc, position: BoardPositions):
                 pg.draw.rect(sc, pg.Color('DarkSlateGray'), get_figure(column_index, line_index), border_radius=100)
 
 
+class BoardRenderer:
+    """
+    Отрисовка доски по изменившимся клеткам.
+
+    Поле без фигур и сами фигуры рисуются один раз заранее. В кадре перерисовываются только клетки,
+    где сменилась фигура, выбранный конь, подсветка ходов или курсор, и на экран отправляются только они.
+    """
+    FPS = 60
+    """Кадров в секунду, пока на экране что-то меняется"""
+    IDLE_FPS = 15
+    """Кадров в секунду, когда ничего не меняется (ожидание клика или хода компьютера)"""
+
+    SELECTED = 'selected'
+    HOVER = 'hover'
+    LEGAL = 'legal'
+    HINT_FROM = 'hint_from'
+    HINT = 'hint'
+    """Выделение - пара (HINT, текст): клетка, куда ведёт ход подсказки"""
+
+    PIECE_COLORS = {Color.WHITE.value: 'white', Color.BLACK.value: 'DarkSlateGray'}
+
+    def __init__(self, sc):
+        self.sc = sc
+        self.background = pg.Surface(sc.get_size())
+        draw_board(self.background, [[None] * 8 for _ in range(8)])
+        self.sprites = {color: self._make_sprite(name) for color, name in self.PIECE_COLORS.items()}
+        self.font = None
+        self.hint_font = None
+        self.position: Optional[BoardPositions] = None
+        """Нарисованная позиция"""
+        self.marks: Dict[Tuple[int, int], FrozenSet[str]] = {}
+        """Нарисованные поверх клеток выделения"""
+        self.message: Optional[str] = None
+        self.message_surface = None
+
+    @staticmethod
+    def _make_sprite(color_name: str):
+        """Конь на прозрачной клетке (рисуется в левый верхний угол клетки)"""
+        sprite = pg.Surface((TILE, TILE), pg.SRCALPHA)
+        pg.draw.rect(sprite, pg.Color(color_name), get_figure(0, 0), border_radius=100)
+        return sprite
+
+    def get_marks(self, selected: Optional[HorsePosition], legal_moves: Optional[List[HorsePosition]],
+                  hover: Optional[ClickEvent], hints: Optional[List[AnalysisLine]] = None
+                  ) -> Dict[Tuple[int, int], FrozenSet[str]]:
+        """Выделения по клеткам (line, column)"""
+        marks = {}
+        if selected:
+            marks.setdefault(tuple(selected), set()).add(self.SELECTED)
+        for p in legal_moves or ():
+            marks.setdefault(tuple(p), set()).add(self.LEGAL)
+        for rank, hint in enumerate(hints or (), 1):
+            marks.setdefault(tuple(hint.move.pos_from), set()).add(self.HINT_FROM)
+            marks.setdefault(tuple(hint.move.pos_to), set()).add((self.HINT, f'{rank}: {format_score(hint.score)}'))
+        if hover:
+            marks.setdefault((hover.line, hover.column), set()).add(self.HOVER)
+        return {cell: frozenset(flags) for cell, flags in marks.items()}
+
+    def render(self, position: BoardPositions, selected: Optional[HorsePosition] = None,
+               legal_moves: Optional[List[HorsePosition]] = None, hover: Optional[ClickEvent] = None,
+               message: Optional[str] = None, hints: Optional[List[AnalysisLine]] = None) -> List:
+        """Перерисовать изменившиеся клетки. Возвращает прямоугольники для pg.display.update (пустой - ничего не менялось)"""
+        marks = self.get_marks(selected, legal_moves, hover, hints)
+        if self.position is None or message != self.message:
+            cells = {(line, column) for line in range(8) for column in range(8)}
+        else:
+            cells = {
+                (line, column) for line in range(8) for column in range(8)
+                if position[line][column] != self.position[line][column]
+            }
+            cells.update(cell for cell in marks.keys() | self.marks.keys() if marks.get(cell) != self.marks.get(cell))
+
+        rects = [self.draw_cell(line, column, position[line][column], marks.get((line, column), ())) for line, column in cells]
+
+        if message != self.message:
+            self.message = message
+            self.message_surface = self.render_message(message) if message else None
+        if self.message_surface is not None and rects:
+            # текст лежит поверх клеток - рисуем заново, если под ним что-то перерисовали
+            message_rect = self.message_surface.get_rect(topleft=(100, 100))
+            if message_rect.collidelist(rects) != -1:
+                self.sc.blit(self.message_surface, message_rect)
+                rects.append(message_rect)
+
+        self.position = [list(line) for line in position]
+        self.marks = marks
+        return rects
+
+    def draw_cell(self, line: int, column: int, piece: str, flags):
+        rect = pg.Rect(column * TILE, line * TILE, TILE, TILE)
+        self.sc.blit(self.background, rect, rect)
+        sprite = self.sprites.get(piece)
+        if sprite is not None:
+            self.sc.blit(sprite, rect)
+        if self.HINT_FROM in flags:
+            draw_current_position(self.sc, line, column, GREEN)
+        if self.SELECTED in flags or self.HOVER in flags:
+            draw_current_position(self.sc, line, column)
+        hint_texts = sorted(flag[1] for flag in flags if isinstance(flag, tuple) and flag[0] == self.HINT)
+        if hint_texts:
+            if self.hint_font is None:
+                pg.font.init()
+                self.hint_font = pg.font.SysFont('Comic Sans MS', 16)
+            draw_hints(self.sc, self.hint_font, line, column, hint_texts)
+        if self.LEGAL in flags:
+            draw_legal_moves(self.sc, [HorsePosition((line, column))])
+        return rect
+
+    def render_message(self, message: str):
+        if self.font is None:
+            pg.font.init()
+            self.font = pg.font.SysFont('Comic Sans MS', 30)
+        return self.font.render(message, False, (0, 0, 0))
+
+
 TILE = 100
 
+pg = None
+"""
+pygame импортируется в run(): процессы параллельного поиска (spawn) импортируют запущенный модуль заново,
+и им не нужны ни pygame, ни SDL.
+"""
+
 
 def run():
+    global pg
+    import pygame as pg
     pg.init()
 
     cols, rows = 8, 8
 
     sc = pg.display.set_mode([cols * TILE, rows * TILE])
     clock = pg.time.Clock()
+    renderer = BoardRenderer(sc)
 
     game = GameProcess()
     game.make_players(player_is_white=True)
+    engine = BackgroundEngine(game)
 
-    while True:
-
-        draw_board(sc, game.board.position)
-        if game._position_from:
-            draw_current_position(sc, *game._position_from)
-        if game.user_legal_moves:
-            draw_legal_moves(sc, game.user_legal_moves)
+    hover = None
+    board = position = None
+    # H - показать/скрыть подсказку: лучшие ходы пользователя с оценками
+    show_hints = False
 
-        clicked_event = get_click_mouse_pos(sc)
+    while True:
 
-        # Обработка события клик
-        if clicked_event:
+        clicked_event = None
+        for event in pg.event.get():
+            if event.type == pg.QUIT:
+                engine.close()
+                game.close()
+                exit()
+            if event.type == pg.MOUSEMOTION:
+                hover = get_tile_event(event.pos)
+            if event.type == pg.MOUSEBUTTONDOWN and event.button == 1:
+                clicked_event = get_tile_event(event.pos)
+            if event.type == pg.KEYDOWN and event.key == pg.K_h:
+                show_hints = not show_hints
+
+        # Обработка события клик (пока компьютер думает - ходить нельзя)
+        if clicked_event and not engine.thinking:
             click_result = game.click_to_tile(HorsePosition((clicked_event.line, clicked_event.column)))
             if click_result:
 
                 # Событие - ход игрока закончен
                 if isinstance(click_result, UserStepFinishedEvent):
                     print('Ход совершен')
-                    draw_board(sc, game.board.position)
-                    # clock.tick(3)
+                    if not game.is_game_over:
+                        # компьютер ищет ход в фоне, окно продолжает рисоваться
+                        engine.start_thinking()
 
-                    game.step_computer()
-                    print('Ход компьютером совершен')
-                    draw_board(sc, game.board.position)
-                    # clock.tick(0)
+        if engine.thinking and engine.poll():
+            print('Ход компьютером совершен')
 
+        # подсказка ищется в фоне, пока ход пользователя
+        hints = None
+        if show_hints and not engine.thinking and not game.is_game_over:
+            engine.request_hints()
+            hints = engine.hints()
+
+        message = None
         if game.is_game_over:
-            pg.font.init()
             player_win = game.who_wins(game.board)
-            my_font = pg.font.SysFont('Comic Sans MS', 30)
-            text_surface = my_font.render(f'Игра окончена. Победили {player_win.verbose_color}', False, (0, 0, 0))
-            sc.blit(text_surface, (100, 100))
-
-        # # pygame necessary lines
-        [exit() for event in pg.event.get() if event.type == pg.QUIT]
-        pg.display.flip()
-        clock.tick(0)
+            message = f'Игра окончена. Победили {player_win.verbose_color}'
+
+        # список списков строим заново только после хода
+        if game.board is not board:
+            board = game.board
+            position = board.position
+
+        rects = renderer.render(position, game._position_from, game.user_legal_moves, hover, message, hints)
+        if rects:
+            pg.display.update(rects)
+        clock.tick(renderer.FPS if rects else renderer.IDLE_FPS)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,126 @@
+"""
+Нагрузка на service.py: много одновременных игр против сервиса.
+
+Запуск: python loadgen.py [--games 16] [--plies 8] [--depth 3] [--deadline-ms 5000] [--host ... --port ...]
+Без --host поднимает сервис в этом же процессе на свободном порту.
+Каждая игра - своё соединение: ход пользователя выбирается случайно из legal, ход компьютера - go.
+В конце печатает JSON: задержки на стороне клиента, ошибки, ходов в секунду и метрики сервиса.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import List, Optional
+
+from service import EngineService, LatencyStats
+
+
+class Client:
+    """Соединение с сервисом"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> 'Client':
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def request(self, **request) -> dict:
+        self.writer.write(json.dumps(request).encode() + b'\n')
+        await self.writer.drain()
+        return json.loads(await self.reader.readline())
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def play_game(host: str, port: int, plies: int, depth: int, deadline_ms: int, rnd: random.Random,
+                    latency: LatencyStats, errors: List[str]) -> int:
+    """Сыграть игру, вернуть количество ходов компьютера"""
+    client = await Client.connect(host, port)
+    try:
+        session = (await client.request(op='new', player_is_white=True))['session']
+        moves = []
+        computer_moves = 0
+        for _ in range(plies):
+            legal = (await client.request(op='legal', session=session)).get('moves')
+            if not legal:
+                break
+            moves.append(rnd.choice(legal))
+            await client.request(op='position', session=session, position='startpos moves ' + ' '.join(moves))
+
+            started = time.perf_counter()
+            response = await client.request(op='go', session=session, depth=depth, deadline_ms=deadline_ms)
+            latency.add(time.perf_counter() - started)
+            if 'error' in response:
+                errors.append(response['error'])
+                break
+            if response['bestmove'] is None:
+                break
+            moves.append(response['bestmove'])
+            computer_moves += 1
+            # игра окончена - ходов у пользователя нет или кто-то дошёл до финиша
+            await client.request(op='position', session=session, position='startpos moves ' + ' '.join(moves))
+        await client.request(op='close', session=session)
+        return computer_moves
+    finally:
+        await client.close()
+
+
+async def run(args) -> dict:
+    service: Optional[EngineService] = None
+    server = None
+    host, port = args.host, args.port
+    if host is None:
+        service = EngineService(args.workers)
+        server = await service.serve('127.0.0.1', 0)
+        host, port = server.sockets[0].getsockname()[:2]
+
+    latency = LatencyStats()
+    errors: List[str] = []
+    started = time.perf_counter()
+    try:
+        computer_moves = await asyncio.gather(*(
+            play_game(host, port, args.plies, args.depth, args.deadline_ms, random.Random(args.seed + i), latency, errors)
+            for i in range(args.games)
+        ))
+        elapsed = time.perf_counter() - started
+        client = await Client.connect(host, port)
+        metrics = await client.request(op='metrics')
+        await client.close()
+    finally:
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+            service.close()
+
+    return {
+        'games': args.games,
+        'computer_moves': sum(computer_moves),
+        'elapsed_s': elapsed,
+        'moves_per_s': sum(computer_moves) / elapsed if elapsed else 0.0,
+        'errors': len(errors),
+        'client_latency': latency.as_dict(),
+        'service': metrics,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузка на сервис движка')
+    parser.add_argument('--host', default=None, help='адрес сервиса (без него сервис запускается здесь же)')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None, help='процессов поиска для встроенного сервиса')
+    parser.add_argument('--games', type=int, default=16)
+    parser.add_argument('--plies', type=int, default=8, help='ходов компьютера в игре')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--deadline-ms', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    print(json.dumps(asyncio.run(run(parser.parse_args())), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Параллельный поиск: корневые ходы раздаются процессам пула.
+
+Процессы запускаются через spawn - в них импортируются только модули движка (pygame не нужен и не загружается).
+Лучшая найденная оценка (alpha корня) общая для всех процессов: ход, который заведомо хуже уже найденного,
+досчитывается с узким окном и отсекается быстрее.
+"""
+
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from base import Player, Move
+from board import Board
+from search import AlphaBetaSearch, root_move_codes
+
+_shared_alpha = None
+"""Лучшая оценка корня среди уже досчитанных ходов (multiprocessing.Value в процессе пула)"""
+
+
+def _init_worker(shared_alpha):
+    global _shared_alpha
+    _shared_alpha = shared_alpha
+
+
+def _search_root_move(bitboards: Dict[str, int], players: Dict[str, Player], color: str, move: int, depth: int):
+    """Оценка одного корневого хода (выполняется в процессе пула)"""
+    started = time.process_time()
+    player = players[color]
+    other_player = players[player.opponent_color.value]
+    search = AlphaBetaSearch(player, other_player)
+    board = search.search_board(Board(None, players, bitboards=bitboards))
+
+    # Окно чуть ниже общей alpha: ход с такой же оценкой досчитывается точно (при равенстве выигрывает
+    # ход, который раньше в списке, как и в последовательном поиске), а ход хуже - отсекается
+    alpha = _shared_alpha.value
+    bound = math.nextafter(alpha, -math.inf) if alpha > -math.inf else -math.inf
+    board.apply_code(move, player)
+    score = -search.negamax(board, depth - 1, -math.inf, -bound, other_player, ply=1)
+
+    if score > alpha:
+        with _shared_alpha.get_lock():
+            if score > _shared_alpha.value:
+                _shared_alpha.value = score
+    return move, score, os.getpid(), search.nodes, time.process_time() - started, 'pygame' in sys.modules
+
+
+@dataclass
+class ParallelSearchStats:
+    """Статистика последнего параллельного поиска"""
+    wall_time: float = 0.0
+    """Время поиска"""
+    work_time: float = 0.0
+    """Суммарное процессорное время процессов"""
+    nodes_by_worker: Dict[int, int] = field(default_factory=dict)
+    """Позиции, просмотренные каждым процессом (pid -> количество)"""
+    pygame_in_workers: bool = False
+
+    @property
+    def nodes(self) -> int:
+        return sum(self.nodes_by_worker.values())
+
+    @property
+    def utilization(self) -> float:
+        """
+        Сколько процессов в среднем были заняты поиском (процессорное время / время поиска).
+        Это не ускорение относительно последовательного поиска: отсечений в параллельном поиске меньше,
+        и часть работы процессов - лишняя. Ускорение по времени замеряет bench.py (раздел parallel).
+        """
+        return self.work_time / self.wall_time if self.wall_time else 0.0
+
+
+class ParallelSearch:
+    """Поиск альфа-бета, корневые ходы которого считаются в пуле процессов"""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.stats = ParallelSearchStats()
+        context = multiprocessing.get_context('spawn')
+        self._shared_alpha = context.Value('d', -math.inf)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context, initializer=_init_worker, initargs=(self._shared_alpha,),
+        )
+
+    def get_best_move(self, board: Board, depth: int, player: Player) -> Optional[Move]:
+        """
+        Лучший ход для игрока на глубину depth.
+        Совпадает с AlphaBetaSearch.get_best_move без таблицы транспозиций (и с GameProcess.minimax_new).
+        """
+        started = time.perf_counter()
+        moves = root_move_codes(board, player, AlphaBetaSearch.FOLD_MIRROR)
+        with self._shared_alpha.get_lock():
+            self._shared_alpha.value = -math.inf
+
+        futures = [
+            self._executor.submit(
+                _search_root_move, board.bitboards, board.players, player.color.value, move, depth,
+            )
+            for move in moves
+        ]
+        self.stats = stats = ParallelSearchStats()
+        scores = {}
+        for future in futures:
+            move, score, pid, nodes, work_time, pygame_imported = future.result()
+            scores[move] = score
+            stats.nodes_by_worker[pid] = stats.nodes_by_worker.get(pid, 0) + nodes
+            stats.work_time += work_time
+            stats.pygame_in_workers |= pygame_imported
+
+        best_score = float('-inf')
+        best_move = None
+        for move in moves:  # при равенстве - первый по порядку генерации
+            if scores[move] > best_score:
+                best_score = scores[move]
+                best_move = move
+        stats.wall_time = time.perf_counter() - started
+        return Move.from_packed(player, best_move) if best_move is not None else None
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
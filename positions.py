@@ -1,87 +1,171 @@
-from collections import defaultdict
 from functools import cached_property
-from typing import List, Dict, Tuple
+from typing import Iterator, List, Dict, Tuple
 
-from base import BoardPositions, Player, HorsePosition, Move, Color
+from base import Player, HorsePosition, Move, Color
+from bitboard import (
+    KNIGHT_STEPS, KNIGHT_TARGETS, KNIGHT_MASKS, FORWARD_KNIGHT_MASKS, LINE_MASKS, REACH_LINE_MASKS, CAPTURE_FLAG,
+    iter_squares, square_position, mirror_bitboard,
+)
 
 
 class PositionLogic:
     """Расчёты по позиции на доске"""
 
     # Определение возможных ходов конём
-    KNIGHT_STEPS = ((1, 2), (-1, 2), (1, -2), (-1, -2), (2, 1), (-2, 1), (2, -1), (-2, -1))
+    KNIGHT_STEPS = KNIGHT_STEPS
 
-    def __init__(self, position: BoardPositions, players: Dict[Color, Player]):
-        self.position = position
+    def __init__(self, bitboards: Dict[str, int], players: Dict[Color, Player]):
+        self.bitboards = bitboards
         self.players = players
 
     @cached_property
-    def player_positions_map(self) -> Dict[Color, List[HorsePosition]]:
+    def player_positions_map(self) -> Dict[str, List[HorsePosition]]:
         """Текущие позиции игроков"""
-        positions = defaultdict(list)
-        for line_index, line in enumerate(self.position):
-            for column_index, column_color in enumerate(line):
-                if column_color != '*':
-                    positions[column_color].append(HorsePosition((line_index, column_index)))
-        return positions
+        return {color: [square_position(sq) for sq in iter_squares(mask)] for color, mask in self.bitboards.items()}
 
     @cached_property
-    def legal_moves_map(self) -> Dict[Color, Tuple[Move]]:
-        """Возможные ходы игроков"""
-        moves = defaultdict(tuple)
-        for color in self.player_positions_map.keys():
-            player = self.players[color]
-            moves[color] = tuple(self._get_legal_moves(player))
-        return moves
+    def legal_moves_map(self) -> Dict[str, Tuple[int, ...]]:
+        """Возможные ходы игроков (упакованные, см. bitboard.pack_move)"""
+        return {color: tuple(self._get_legal_moves(self.players[color])) for color in self.bitboards.keys()}
+
+    @cached_property
+    def attack_maps(self) -> Dict[str, int]:
+        """Клетки, которые бьют кони каждой стороны"""
+        attack_maps = {}
+        for color, mask in self.bitboards.items():
+            attacks = 0
+            for sq in iter_squares(mask):
+                attacks |= KNIGHT_MASKS[sq]
+            attack_maps[color] = attacks
+        return attack_maps
+
+    def invalidate(self):
+        """Сбросить посчитанное после изменения bitboards на месте (Board.apply / Board.undo)"""
+        self.__dict__.pop('player_positions_map', None)
+        self.__dict__.pop('legal_moves_map', None)
+        self.__dict__.pop('attack_maps', None)
+
+    def get_attack_map(self, player: Player) -> int:
+        """Клетки, которые бьют кони игрока"""
+        return self.attack_maps[player.color.value]
+
+    def get_capture_targets(self, player: Player) -> int:
+        """Чужие кони, которых игрок может срубить следующим ходом"""
+        return self.attack_maps[player.color.value] & self.bitboards[player.opponent_color.value]
+
+    def is_square_safe(self, player: Player, sq: int) -> bool:
+        """Клетку не бьёт ни один конь соперника"""
+        return not self.attack_maps[player.opponent_color.value] >> sq & 1
+
+    def get_bitboard(self, player: Player) -> int:
+        """Битовая доска коней игрока"""
+        return self.bitboards[player.color.value]
 
     def get_player_positions(self, player: Player) -> List[HorsePosition]:
         """Получить все позиции пешек игрока"""
         return self.player_positions_map[player.color.value]
 
+    def is_finished(self, player: Player) -> bool:
+        """Конь игрока уже стоит на финишной линии"""
+        return bool(self.get_bitboard(player) & LINE_MASKS[player.finish_line])
+
     def get_danger_positions(self, player: Player) -> List[HorsePosition]:
         """Получить все позиции пешек игрока, которые под угрозой сруба"""
-        # todo САМАЯ долгая операция
-        # return [move.pos_from for move in self.get_legal_moves(player) if move.is_damage_to_opponent]
+        # Позиция повторяется столько раз, сколько чужих фигур с неё можно срубить
+        return [square_position(code & 63) for code in self.iter_captures(player)]
 
-        danger_positions = []
-        for move in self.get_legal_moves(player):
-            if self.position[move.pos_to[0]][move.pos_to[1]] == player.opponent_color.value:
-                # Проверка, находится ли новая позиция в пределах доски и занята ЧУЖОЙ фигурой
-                danger_positions.append(move.pos_from)
-        return danger_positions
+    def get_capture_moves(self, player: Player) -> List[int]:
+        """Ходы-рубки игрока"""
+        return list(self.iter_captures(player))
 
-    def get_legal_moves(self, player: Player) -> Tuple[Move]:
+    def iter_moves(self, player: Player) -> Iterator[int]:
+        """
+        Ходы игрока по этапам, лениво - если поиск отсёк ветку на первых ходах, остальные не генерируются:
+        1. ходы на финишную линию (победа)
+        2. рубка
+        3. тихие ходы вперёд
+        """
+        yield from self.iter_winning_moves(player)
+        yield from self.iter_captures(player, to_finish=False)
+        yield from self.iter_quiet_moves(player, to_finish=False)
+
+    def iter_winning_moves(self, player: Player) -> Iterator[int]:
+        """Ходы на финишную линию"""
+        own = self.get_bitboard(player)
+        opponent = self.bitboards[player.opponent_color.value]
+        empty = ~(own | opponent)
+        finish = LINE_MASKS[player.finish_line]
+        forward_masks = FORWARD_KNIGHT_MASKS[player.home_line]
+        for sq in iter_squares(own & REACH_LINE_MASKS[player.finish_line]):
+            targets = ((KNIGHT_MASKS[sq] & opponent) | (forward_masks[sq] & empty)) & finish
+            if targets:
+                yield from self._iter_moves_from(sq, targets, opponent)
+
+    def iter_captures(self, player: Player, to_finish: bool = True) -> Iterator[int]:
+        """Ходы-рубки (to_finish=False - кроме рубок на финишной линии, они уже среди победных)"""
+        # Удар конём симметричен: рубить могут ровно те наши кони, которые стоят под ударом соперника
+        capture_targets = self.get_capture_targets(player)
+        if not to_finish:
+            capture_targets &= ~LINE_MASKS[player.finish_line]
+        if not capture_targets:
+            return
+        attackers = self.get_bitboard(player) & self.attack_maps[player.opponent_color.value]
+        for sq in iter_squares(attackers):
+            targets = KNIGHT_MASKS[sq] & capture_targets
+            if targets:
+                yield from self._iter_moves_from(sq, targets, capture_targets)
+
+    def iter_quiet_moves(self, player: Player, to_finish: bool = True) -> Iterator[int]:
+        """Ходы вперёд на пустые клетки (to_finish=False - кроме ходов на финишную линию)"""
+        own = self.get_bitboard(player)
+        empty = ~(own | self.bitboards[player.opponent_color.value])
+        if not to_finish:
+            empty &= ~LINE_MASKS[player.finish_line]
+        forward_masks = FORWARD_KNIGHT_MASKS[player.home_line]
+        for sq in iter_squares(own):
+            targets = forward_masks[sq] & empty
+            if targets:
+                yield from self._iter_moves_from(sq, targets, 0)
+
+    @staticmethod
+    def _iter_moves_from(sq: int, targets: int, opponent: int) -> Iterator[int]:
+        """Упакованные ходы с клетки sq на клетки targets (в порядке KNIGHT_STEPS)"""
+        for target in KNIGHT_TARGETS[sq]:
+            if targets >> target & 1:
+                yield sq | target << 6 | (CAPTURE_FLAG if opponent >> target & 1 else 0)
+
+    def is_mirror_symmetric(self) -> bool:
+        """Позиция совпадает со своим зеркалом по колонкам"""
+        return all(mirror_bitboard(mask) == mask for mask in self.bitboards.values())
+
+    def is_legal(self, player: Player, code: int) -> bool:
+        """Может ли игрок так сходить (флаг рубки не проверяется)"""
+        from_sq, to_sq = code & 63, code >> 6 & 63
+        own = self.get_bitboard(player)
+        if not own >> from_sq & 1:
+            return False
+        opponent = self.bitboards[player.opponent_color.value]
+        targets = (KNIGHT_MASKS[from_sq] & opponent) | (FORWARD_KNIGHT_MASKS[player.home_line][from_sq] & ~(own | opponent))
+        return bool(targets >> to_sq & 1)
+
+    def get_legal_move_codes(self, player: Player) -> Tuple[int, ...]:
+        """Возможные ходы игрока, упакованные"""
         return self.legal_moves_map[player.color.value]
 
-    def _get_legal_moves(self, player: Player) -> List[Move]:
+    def get_legal_moves(self, player: Player) -> Tuple[Move]:
+        """Возможные ходы игрока объектами Move (для интерфейса)"""
+        return tuple(Move.from_packed(player, code) for code in self.legal_moves_map[player.color.value])
+
+    def _get_legal_moves(self, player: Player) -> List[int]:
         """Получить список возможных ходов"""
         knight_moves = []
-        current_positions = self.get_player_positions(player)
-        for position in current_positions:
-            for (i, j) in self.KNIGHT_STEPS:
-                try:
-                    x, y = position[0] + i, position[1] + j
-
-                    # Если на новой позиции не стоит пешка оппонента - то проверяем можно ли ходить назад
-                    if self.position[x][y] != player.opponent_color.value:
-                        # Нельзя ходить назад
-                        current_line = position[0]
-                        if player.finish_line == 7 and x < current_line:
-                            continue
-                        if player.finish_line == 0 and x > current_line:
-                            continue
-
-                    # Проверка, находится ли новая позиция в пределах доски и не занята ли она своей фигурой
-                    if 0 <= x < 8 and 0 <= y < 8 and self.position[x][y] != player.color.value:
-                        knight_moves.append(
-                            Move(
-                                player=player,
-                                pos_from=position,
-                                pos_to=HorsePosition((x, y)),
-                                # is_damage_to_opponent=self.position[x][y] == player.opponent_color.value
-                            )
-                        )
-                except IndexError:
-                    pass
-
+        own = self.get_bitboard(player)
+        opponent = self.bitboards[player.opponent_color.value]
+        empty = ~(own | opponent)
+        forward_masks = FORWARD_KNIGHT_MASKS[player.home_line]
+        for sq in iter_squares(own):
+            # рубить можно в любую сторону, на пустую клетку - только вперёд
+            targets = (KNIGHT_MASKS[sq] & opponent) | (forward_masks[sq] & empty)
+            if targets:
+                knight_moves.extend(self._iter_moves_from(sq, targets, opponent))
         return knight_moves
@@ -1,12 +1,57 @@
+import os
+import time
 from typing import List, Optional
 from base import Color, HorsePosition, EvaluateCtx, UserStepFinishedEvent, PositionFromSavedEvent
+from bitboard import CAPTURE_FLAG, MOVE_SQUARES_MASK, square, square_position
 from board import Board, Move, Player, WHITE_TOP_POSITIONS, BLACK_TOP_POSITIONS
-from utils import timeit
+from book import open_book
+from parallel import ParallelSearch
+from records import GameRecord, MoveStats, append_games
+from search import AlphaBetaSearch, AnalysisLine, WIN_SCORE, analyze_position, distance_score
+from stats import SearchStats, write_json_line
+from tablebase import Tablebase, open_tablebase
+from transposition import TranspositionTable
 
 
 class GameProcess:
-    PREDICT_LEVEL = 3
+    PREDICT_LEVEL = 4
+    TIME_BUDGET: Optional[float] = None
+    """Время на ход компьютера в секундах, например 0.2 (None - фиксированная глубина PREDICT_LEVEL)"""
+    MAX_DEPTH = 64
+    """Предел глубины при поиске по времени и наибольшая глубина поиска (в таблице транспозиций глубина - байт со знаком)"""
+    USE_ALPHA_BETA = True
+    """Поиск альфа-бета (True) или полный минимакс minimax_new (False) - для A/B сравнения"""
     board: Board
+    nodes: int = 0
+    """Количество позиций, просмотренных последним поиском"""
+    depth_reached: int = 0
+    """Глубина, на которую досчитал последний поиск"""
+    search_stats: Optional[SearchStats] = None
+    """Статистика последнего поиска"""
+    PROFILE_SEARCH = False
+    """Разбивка времени поиска по частям в search_stats (поиск с ней медленнее)"""
+    STATS_SINK: Optional[str] = None
+    """Файл, в который дописывается статистика каждого поиска строкой JSON (None - не пишем)"""
+    TT_MEMORY_BYTES = 16 * 1024 * 1024
+    """Память под таблицу транспозиций одной игры"""
+    transposition_table: Optional[TranspositionTable] = None
+    PARALLEL_WORKERS = 0
+    """Процессов для параллельного поиска по корневым ходам (0 - искать в этом процессе)"""
+    parallel_search: Optional[ParallelSearch] = None
+    BOOK_PATH: Optional[str] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opening_book.bin')
+    """Дебютная книга (см. book.py). None - не использовать, файла нет - ходы ищутся как обычно"""
+    GAME_RECORDS: Optional[str] = None
+    """Файл, в который дописывается каждая доигранная партия (см. records.py). None - не записываем"""
+    game_record: Optional[GameRecord] = None
+    """Запись текущей партии (None - партия не записывается, например позиция задана извне)"""
+    HINT_DEPTH = PREDICT_LEVEL
+    """Глубина подсказки пользователю"""
+    HINT_LINES = 3
+    """Вариантов в подсказке"""
+    hint_table: Optional[TranspositionTable] = None
+    """Таблица транспозиций подсказок: оценки в ней - за пользователя, с таблицей компьютера не смешиваются"""
+    no_moves_player: Optional[Player] = None
+    """Игрок, которому нечем ходить: он проиграл (как в поиске - ходов нет, значит проигрыш)"""
     _position_from: Optional[HorsePosition] = None
     user_legal_moves: Optional[List[HorsePosition]] = None
 
@@ -21,8 +66,15 @@ class GameProcess:
                 pos_to=HorsePosition((int(pos_to[0]), int(pos_to[1]))),
             )
 
+        def is_legal(move: Move) -> bool:
+            # клетка вне доски не помещается в 6 бит упакованного хода и может совпасть с другим ходом
+            if not all(0 <= coordinate < 8 for coordinate in (*move.pos_from, *move.pos_to)):
+                return False
+            return move.packed in legal_codes
+
+        legal_codes = {move.packed & MOVE_SQUARES_MASK for move in legal_moves}
         user_move = user_step()
-        while user_move not in legal_moves:
+        while not is_legal(user_move):
             print('Ход невозможен')
             user_move = user_step()
 
@@ -34,7 +86,11 @@ class GameProcess:
         user_positions = self.board.logic.get_player_positions(self.other_player)
         if position in user_positions:
             self._position_from = position
-            self.user_legal_moves = [move.pos_to for move in self.board.logic.get_legal_moves(self.other_player) if move.pos_from == position]
+            from_sq = square(*position)
+            self.user_legal_moves = [
+                square_position(code >> 6 & 63)
+                for code in self.board.logic.get_legal_move_codes(self.other_player) if code & 63 == from_sq
+            ]
 
             print('POSITION FROM SAVED', position)
             return PositionFromSavedEvent()
@@ -44,20 +100,89 @@ class GameProcess:
                 pos_from=self._position_from,
                 pos_to=position
             )
-            if current_move in self.board.logic.get_legal_moves(self.other_player):
+            legal_codes = {code & MOVE_SQUARES_MASK for code in self.board.logic.get_legal_move_codes(self.other_player)}
+            if current_move.packed in legal_codes:
+                code = self.packed_move(current_move)
                 self.board = self.board.make_move(move=current_move)
+                self.record_move(code)
                 print('USER STEP FINISHED', current_move)
                 self._position_from = None
                 self.user_legal_moves = None
                 return UserStepFinishedEvent()
 
-    def step_computer(self):
-        """Ход компьютера"""
-        move = self.get_best_move(depth=self.PREDICT_LEVEL, player=self.computer_player, other_player=self.other_player)
+    def step_computer(self) -> Optional[Move]:
+        """Ход компьютера (None - ходов нет, компьютер проиграл)"""
+        move = self.get_book_move()
+        if move is not None:
+            self.record_stats(self.book_stats(move))
+        elif self.TIME_BUDGET:
+            move = self.get_best_move(depth=self.MAX_DEPTH, player=self.computer_player, other_player=self.other_player,
+                                      time_budget=self.TIME_BUDGET)
+        else:
+            move = self.get_best_move(depth=self.PREDICT_LEVEL, player=self.computer_player, other_player=self.other_player)
+        if move is None:
+            self.set_no_moves(self.computer_player)
+            return None
+        self.apply_computer_move(move)
+        return move
+
+    def get_book_move(self) -> Optional[Move]:
+        """Ход компьютера из дебютной книги (None - позиции в книге нет)"""
+        book = open_book(self.BOOK_PATH) if self.BOOK_PATH else None
+        return book.get_move(self.board, self.computer_player) if book is not None else None
+
+    def book_stats(self, move: Move) -> SearchStats:
+        return SearchStats(player=self.computer_player.color.value, move=move.notation, book=True)
+
+    def apply_computer_move(self, move: Move):
+        """Сделать найденный ход компьютера"""
+        code = self.packed_move(move)
         self.board = self.board.make_move(move)
+        self.record_move(code, MoveStats.from_search_stats(self.search_stats) if self.search_stats else None)
         print('COMPUTER STEP FINISHED', move)
+        if not self.is_game_over and not self.board.logic.get_legal_move_codes(self.other_player):
+            self.set_no_moves(self.other_player)
+
+    def packed_move(self, move: Move) -> int:
+        """
+        Упакованный ход с флагом рубки по текущей доске (до хода), как в Board.apply_code:
+        у хода пользователя из click_to_tile флага нет, а в записи партии один ход - одно число.
+        """
+        to_sq = square(*move.pos_to)
+        captured = self.board.bitboards[move.player.opponent_color.value] >> to_sq & 1
+        return move.packed & MOVE_SQUARES_MASK | (CAPTURE_FLAG if captured else 0)
+
+    def record_move(self, code: int, stats: Optional[MoveStats] = None):
+        """
+        Записать сделанный ход (упакованный, см. packed_move) в запись партии.
+        Партия окончена - дописать её в GAME_RECORDS
+        """
+        if self.game_record is None:
+            return
+        self.game_record.add_move(code, stats)
+        if self.is_game_over:
+            self.finish_record()
+
+    def finish_record(self):
+        """Партия окончена - записать победителя и дописать партию в GAME_RECORDS"""
+        if self.game_record is None:
+            return
+        self.game_record.winner = self.who_wins(self.board).color
+        if self.GAME_RECORDS:
+            append_games(self.GAME_RECORDS, [self.game_record])
+        self.game_record = None
+
+    def set_no_moves(self, player: Player):
+        """У игрока нет ходов - он проиграл, партия окончена"""
+        self.no_moves_player = player
+        print('NO MOVES', player.verbose_color)
+        self.finish_record()
 
     def make_players(self, player_is_white: bool):
+        # таблица транспозиций живёт всю игру - позиции прошлых ходов переиспользуются
+        self.transposition_table = TranspositionTable(self.TT_MEMORY_BYTES) if self.TT_MEMORY_BYTES else None
+        self.hint_table = None
+        self.no_moves_player = None
         if player_is_white:
             self.other_player = Player(color=Color.WHITE, home_line=7, is_computer=False)
             self.computer_player = Player(color=Color.BLACK, home_line=0, is_computer=True)
@@ -74,24 +199,65 @@ class GameProcess:
                 Color.BLACK.value: self.other_player
             }
             self.board = Board(WHITE_TOP_POSITIONS, self.players)
+        # первым ходит пользователь
+        self.game_record = GameRecord(
+            bitboards=dict(self.board.bitboards),
+            white_home_line=self.players[Color.WHITE.value].home_line,
+            first_color=self.other_player.color,
+        )
+
+    def close(self):
+        """Игра больше не нужна - остановить процессы параллельного поиска"""
+        if self.parallel_search is not None:
+            self.parallel_search.close()
+            self.parallel_search = None
 
     @property
     def is_game_over(self) -> bool:
         """Игра окончена ?"""
-        return self.other_player.color.value in self.board.position[self.other_player.finish_line] or \
-            self.computer_player.color.value in self.board.position[self.computer_player.finish_line]
+        return self.board.is_finished(self.other_player) or self.board.is_finished(self.computer_player) \
+            or self.no_moves_player is not None
 
     def who_wins(self, board: Board):
         """Кто выиграл? Чей конь перешёл на другую сторону первым?"""
-        if self.other_player.color.value in board.position[self.other_player.finish_line]:
+        if board.is_finished(self.other_player):
             return self.other_player
 
-        if self.computer_player.color.value in board.position[self.computer_player.finish_line]:
+        if board.is_finished(self.computer_player):
             return self.computer_player
 
-    @timeit
-    def get_best_move(self, depth: int, player: Player, other_player: Player) -> Optional[Move]:
-        """Получить лучший ход для игрока (по глубине)"""
+        if self.no_moves_player is not None:
+            return self.other_player if self.no_moves_player is self.computer_player else self.computer_player
+
+    def get_best_move(self, depth: int, player: Player, other_player: Player,
+                      time_budget: Optional[float] = None) -> Optional[Move]:
+        """
+        Получить лучший ход для игрока (по глубине).
+        Если задан time_budget (секунды) - итеративное углубление до depth, пока не кончится время.
+        """
+        if self.USE_ALPHA_BETA and self.PARALLEL_WORKERS and not time_budget:
+            if self.parallel_search is None:
+                self.parallel_search = ParallelSearch(self.PARALLEL_WORKERS)
+            best_move = self.parallel_search.get_best_move(self.board, depth, player)
+            parallel_stats = self.parallel_search.stats
+            self.record_stats(SearchStats(
+                player=player.color.value, move=best_move.notation if best_move else None, depth=depth,
+                nodes=parallel_stats.nodes, time=parallel_stats.wall_time,
+            ))
+            return best_move
+
+        if self.USE_ALPHA_BETA:
+            search = AlphaBetaSearch(player, other_player, transposition_table=self.transposition_table,
+                                     profile=self.PROFILE_SEARCH)
+            if time_budget:
+                best_move = search.iterative_deepening(self.board, depth, time_budget)
+            else:
+                best_move = search.get_best_move(self.board, depth)
+            self.record_stats(search.get_stats(best_move))
+            return best_move
+
+        started = time.perf_counter()
+        self.nodes = 0
         best_score = float('-inf')
         best_move = None
         for move in self.board.logic.get_legal_moves(player):
@@ -102,16 +268,70 @@ class GameProcess:
             # на доске new_board учтен гипотетический ход компьютера - поэтому is_maximizing=False
             # ищем максимальное кол-во очков для компьютера на этом ходе
             score = self.minimax_new(new_board, depth - 1, is_maximizing=True)
-            # print(score, move.pos_from, '=>', move.pos_to)  # todo выводить потенциальные очки для варианта хода
+            # оценки всех вариантов хода с продолжениями - self.analyze
             if score > best_score:
                 best_score = score
                 best_move = move
+        self.record_stats(SearchStats(
+            player=player.color.value, move=best_move.notation if best_move else None, depth=depth,
+            nodes=self.nodes, time=time.perf_counter() - started,
+        ))
         return best_move
 
-    # @timeit
-    def minimax_new(self, board: Board, depth: int, is_maximizing: bool) -> float:
-        """Алгоритм минимакс - функция, которая рекурсивно анализирует все возможные ходы"""
-        if depth == 0 or self.is_game_over:
+    def analyze(self, depth: int, lines: int, player: Optional[Player] = None,
+                time_budget: Optional[float] = None) -> List[AnalysisLine]:
+        """
+        lines лучших ходов игрока (по умолчанию - компьютера) с точными оценками и продолжениями за один поиск
+        (см. AlphaBetaSearch.analyze). Для пользователя это подсказка: оценки - за него.
+        """
+        player = player or self.computer_player
+        if player is not self.computer_player:
+            if self.hint_table is None and self.TT_MEMORY_BYTES:
+                self.hint_table = TranspositionTable(self.TT_MEMORY_BYTES)
+            return analyze_position(self.board, player, depth, lines, time_budget, self.hint_table)
+        search = AlphaBetaSearch(player, self.other_player, transposition_table=self.transposition_table,
+                                 profile=self.PROFILE_SEARCH)
+        analysis = search.analyze(self.board, depth, lines, time_budget)
+        self.record_stats(search.get_stats(analysis[0].move if analysis else None))
+        return analysis
+
+    def get_hints(self) -> List[AnalysisLine]:
+        """Подсказка пользователю: лучшие ходы в текущей позиции"""
+        return self.analyze(self.HINT_DEPTH, self.HINT_LINES, player=self.other_player)
+
+    @property
+    def tablebase(self) -> Optional[Tablebase]:
+        """Таблица эндшпиля - та же, что у AlphaBetaSearch"""
+        return open_tablebase(AlphaBetaSearch.TABLEBASE_PATH) if AlphaBetaSearch.TABLEBASE_PATH else None
+
+    def record_stats(self, stats: SearchStats):
+        """Запомнить статистику поиска (и дописать в STATS_SINK)"""
+        self.search_stats = stats
+        self.nodes = stats.nodes
+        self.depth_reached = stats.depth
+        if self.STATS_SINK:
+            write_json_line(self.STATS_SINK, stats)
+
+    def minimax_new(self, board: Board, depth: int, is_maximizing: bool, ply: int = 1) -> float:
+        """
+        Алгоритм минимакс - функция, которая рекурсивно анализирует все возможные ходы.
+        Выигрыш компьютера через ply ходов - WIN_SCORE - ply, проигрыш - минус столько же (как в AlphaBetaSearch).
+        Позиции с малым числом коней оцениваются точно по таблице эндшпиля.
+        """
+        self.nodes += 1
+        # конец игры проверяем на доске дерева, а не на доске игры
+        if board.is_finished(self.computer_player):
+            return WIN_SCORE - ply
+        if board.is_finished(self.other_player):
+            return ply - WIN_SCORE
+        tablebase = self.tablebase
+        if tablebase is not None:
+            to_move = self.other_player if is_maximizing else self.computer_player
+            distance = tablebase.probe(board.bitboards, to_move)
+            if distance is not None:
+                score = distance_score(distance, ply)
+                return score if to_move is self.computer_player else -score
+        if depth == 0:
             return board.evaluate(self.computer_player, EvaluateCtx(
                 next_step_player=self.other_player if is_maximizing else self.computer_player,
                 other_player=self.other_player
@@ -119,20 +339,29 @@ class GameProcess:
 
         # меняем is_maximizing т.к следующий ход просчитываем для другого игрока
         is_maximizing = not is_maximizing
+        player = self.computer_player if is_maximizing else self.other_player
+        sign = 1 if is_maximizing else -1
+
+        # победа следующим ходом - дальше не смотрим
+        if next(board.logic.iter_winning_moves(player), None) is not None:
+            return sign * (WIN_SCORE - ply - 1)
+        # ходов нет - проигрыш
+        if not board.logic.get_legal_move_codes(player):
+            return -sign * (WIN_SCORE - ply)
 
         if is_maximizing:
             # ищем максимум очков (для хода компьютера)
             max_eval = float('-inf')
-            for move in board.logic.get_legal_moves(self.computer_player):
-                new_board = board.make_move(move)
-                value = self.minimax_new(new_board, depth=depth-1, is_maximizing=True)
+            for move in board.logic.get_legal_move_codes(self.computer_player):
+                new_board = board.make_move_code(move, self.computer_player)
+                value = self.minimax_new(new_board, depth=depth-1, is_maximizing=True, ply=ply + 1)
                 max_eval = max(max_eval, value)
             return max_eval
         else:
             # ищем минимум очков (для хода игрока)
             min_eval = float('inf')
-            for move in board.logic.get_legal_moves(self.other_player):
-                new_board = board.make_move(move)
-                value = self.minimax_new(new_board, depth=depth-1, is_maximizing=False)
+            for move in board.logic.get_legal_move_codes(self.other_player):
+                new_board = board.make_move_code(move, self.other_player)
+                value = self.minimax_new(new_board, depth=depth-1, is_maximizing=False, ply=ply + 1)
                 min_eval = min(min_eval, value)
             return min_eval
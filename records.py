@@ -0,0 +1,280 @@
+"""
+Записи партий в двоичном виде.
+
+Партия - начальная позиция (битовые доски), кто ходит первым, упакованные ходы (bitboard.pack_move, по 2 байта),
+результат и, если есть, статистика поиска каждого хода (глубина, позиции, время).
+Файл - блоки друг за другом: заголовок блока (метка, число партий, длина, CRC32) и партии подряд.
+Файл только дописывается, блок - одной записью в конец. Если процесс упал во время записи, оборванный
+последний блок читатель пропускает, а следующая запись отрезает его перед своим блоком - остальные целы.
+Читатель - генератор: в памяти только текущий блок, поэтому файлы с миллионами партий читаются потоком.
+
+Запуск: python records.py info FILE                 - количество партий, ходов и результаты
+        python records.py positions FILE [--out F]  - позиции всех партий строками JSON
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from base import Color, Move, Player
+from board import Board
+from stats import SearchStats
+
+MAGIC = b'HGGR'
+CHUNK_HEADER = struct.Struct('<4sIII')
+"""Метка, партий в блоке, длина блока в байтах, CRC32 блока"""
+GAME_HEADER = struct.Struct('<QQBBH')
+"""Белые, чёрные, флаги, победитель, количество ходов"""
+MOVE = struct.Struct('<H')
+MOVE_STATS = struct.Struct('<BBIf')
+"""Флаги хода, глубина, позиции, время (с)"""
+
+WHITE_TOP = 1
+"""Домашняя линия белых - 0 (иначе 7)"""
+WHITE_FIRST = 2
+"""Первыми ходят белые"""
+HAS_STATS = 4
+"""После ходов записана статистика каждого хода"""
+
+STATS_SEARCHED = 1
+STATS_BOOK = 2
+
+WINNERS = {None: 0, Color.WHITE: 1, Color.BLACK: 2}
+WINNER_COLORS = {code: color for color, code in WINNERS.items()}
+
+
+class MoveStats(NamedTuple):
+    """Статистика поиска хода (ход пользователя или случайный ход - без неё)"""
+    depth: int
+    nodes: int
+    time: float
+    book: bool = False
+
+    @classmethod
+    def from_search_stats(cls, stats: SearchStats) -> 'MoveStats':
+        return cls(depth=stats.depth, nodes=stats.nodes, time=stats.time, book=stats.book)
+
+
+@dataclass
+class GameRecord:
+    """Одна партия"""
+    bitboards: Dict[str, int]
+    """Начальная позиция"""
+    white_home_line: int = 7
+    first_color: Color = Color.WHITE
+    """Кто ходит первым"""
+    moves: List[int] = field(default_factory=list)
+    """Упакованные ходы (bitboard.pack_move)"""
+    winner: Optional[Color] = None
+    """None - партия не доиграна"""
+    stats: List[Optional[MoveStats]] = field(default_factory=list)
+    """Статистика каждого хода (пустой список - статистики нет)"""
+
+    def add_move(self, code: int, stats: Optional[MoveStats] = None):
+        if stats is not None and len(self.stats) < len(self.moves):
+            self.stats.extend([None] * (len(self.moves) - len(self.stats)))
+        self.moves.append(code)
+        if stats is not None or self.stats:
+            self.stats.append(stats)
+
+    def players(self) -> Dict[str, Player]:
+        """Игроки партии. Компьютер - как в GameProcess, сторона с домашней линией 0"""
+        return {
+            color.value: Player(color=color, home_line=home_line, is_computer=home_line == 0)
+            for color, home_line in ((Color.WHITE, self.white_home_line), (Color.BLACK, 7 - self.white_home_line))
+        }
+
+
+def encode_game(record: GameRecord) -> bytes:
+    flags = (WHITE_TOP if record.white_home_line == 0 else 0) \
+        | (WHITE_FIRST if record.first_color == Color.WHITE else 0) \
+        | (HAS_STATS if record.stats else 0)
+    parts = [
+        GAME_HEADER.pack(record.bitboards[Color.WHITE.value], record.bitboards[Color.BLACK.value], flags,
+                         WINNERS[record.winner], len(record.moves)),
+        struct.pack(f'<{len(record.moves)}H', *record.moves),
+    ]
+    if record.stats:
+        stats = record.stats + [None] * (len(record.moves) - len(record.stats))
+        for move_stats in stats:
+            if move_stats is None:
+                parts.append(MOVE_STATS.pack(0, 0, 0, 0.0))
+            else:
+                parts.append(MOVE_STATS.pack(STATS_SEARCHED | (STATS_BOOK if move_stats.book else 0),
+                                             min(move_stats.depth, 255), move_stats.nodes, move_stats.time))
+    return b''.join(parts)
+
+
+def decode_game(buffer: bytes, offset: int) -> Tuple[GameRecord, int]:
+    """Партия с позиции offset и позиция следующей партии"""
+    white, black, flags, winner, count = GAME_HEADER.unpack_from(buffer, offset)
+    offset += GAME_HEADER.size
+    moves = list(struct.unpack_from(f'<{count}H', buffer, offset))
+    offset += count * MOVE.size
+    stats = []
+    if flags & HAS_STATS:
+        for move_flags, depth, nodes, seconds in MOVE_STATS.iter_unpack(
+                buffer[offset:offset + count * MOVE_STATS.size]):
+            stats.append(MoveStats(depth, nodes, seconds, bool(move_flags & STATS_BOOK))
+                         if move_flags & STATS_SEARCHED else None)
+        offset += count * MOVE_STATS.size
+    record = GameRecord(
+        bitboards={Color.WHITE.value: white, Color.BLACK.value: black},
+        white_home_line=0 if flags & WHITE_TOP else 7,
+        first_color=Color.WHITE if flags & WHITE_FIRST else Color.BLACK,
+        moves=moves,
+        winner=WINNER_COLORS[winner],
+        stats=stats,
+    )
+    return record, offset
+
+
+def _complete_length(f) -> int:
+    """Длина файла без оборванного последнего блока (по заголовкам блоков, без проверки CRC)"""
+    size = f.seek(0, os.SEEK_END)
+    offset = 0
+    while offset < size:
+        f.seek(offset)
+        header = f.read(CHUNK_HEADER.size)
+        if len(header) < CHUNK_HEADER.size:
+            return offset
+        magic, _, chunk_size, _ = CHUNK_HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f'{f.name} - не файл записей партий')
+        if offset + CHUNK_HEADER.size + chunk_size > size:
+            return offset
+        offset += CHUNK_HEADER.size + chunk_size
+    return offset
+
+
+def append_games(path: str, records: List[GameRecord]):
+    """Дописать партии в конец файла одним блоком (оборванный при записи последний блок отрезается)"""
+    if not records:
+        return
+    payload = b''.join(encode_game(record) for record in records)
+    with open(path, 'a+b') as f:
+        f.truncate(_complete_length(f))
+        f.write(CHUNK_HEADER.pack(MAGIC, len(records), len(payload), zlib.crc32(payload)) + payload)
+
+
+class GameRecordWriter:
+    """Запись партий блоками по chunk_games (незаписанный остаток - при flush/close)"""
+    CHUNK_GAMES = 256
+
+    def __init__(self, path: str, chunk_games: Optional[int] = None):
+        self.path = path
+        self.chunk_games = chunk_games or self.CHUNK_GAMES
+        self._pending: List[GameRecord] = []
+
+    def write(self, record: GameRecord):
+        self._pending.append(record)
+        if len(self._pending) >= self.chunk_games:
+            self.flush()
+
+    def flush(self):
+        append_games(self.path, self._pending)
+        self._pending = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self) -> 'GameRecordWriter':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_games(path: str) -> Iterator[GameRecord]:
+    """Партии файла по одной (в памяти - один блок)"""
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                return
+            magic, games, size, crc = CHUNK_HEADER.unpack(header)
+            if magic != MAGIC:
+                raise ValueError(f'{path} - не файл записей партий')
+            payload = f.read(size)
+            if len(payload) < size:  # блок оборван на записи - дальше ничего нет
+                return
+            if zlib.crc32(payload) != crc:
+                raise ValueError(f'{path}: повреждён блок на позиции {f.tell() - size - CHUNK_HEADER.size}')
+            offset = 0
+            for _ in range(games):
+                record, offset = decode_game(payload, offset)
+                yield record
+
+
+def replay(record: GameRecord) -> Iterator[Tuple[Board, Player, Move]]:
+    """Повторить партию через Board.make_move: доска перед каждым ходом, кто ходит и ход"""
+    players = record.players()
+    board = Board(None, players, bitboards=dict(record.bitboards))
+    player = players[record.first_color.value]
+    for ply, code in enumerate(record.moves):
+        move = Move.from_packed(player, code)
+        if not board.logic.is_legal(player, code):
+            raise ValueError(f'ход {ply + 1} невозможен: {move.notation}')
+        yield board, player, move
+        board = board.make_move(move)
+        player = players[player.opponent_color.value]
+
+
+def iter_positions(path: str) -> Iterator[dict]:
+    """Позиции всех партий файла для анализа: доска, кто ходит, ход и результат партии для ходящего"""
+    for game, record in enumerate(iter_games(path)):
+        for ply, (board, player, move) in enumerate(replay(record)):
+            yield {
+                'game': game,
+                'ply': ply,
+                'white': board.bitboards[Color.WHITE.value],
+                'black': board.bitboards[Color.BLACK.value],
+                'to_move': player.color.value,
+                'move': move.notation,
+                'result': None if record.winner is None else int(record.winner == player.color),
+            }
+
+
+def info(path: str) -> dict:
+    games = moves = with_stats = 0
+    winners = {'W': 0, 'B': 0, 'unfinished': 0}
+    for record in iter_games(path):
+        games += 1
+        moves += len(record.moves)
+        with_stats += bool(record.stats)
+        winners[record.winner.value if record.winner else 'unfinished'] += 1
+    return {
+        'games': games,
+        'moves': moves,
+        'avg_plies': moves / games if games else 0.0,
+        'with_stats': with_stats,
+        'winners': winners,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Записи партий')
+    parser.add_argument('command', choices=('info', 'positions'))
+    parser.add_argument('path')
+    parser.add_argument('--out', default=None, help='файл для positions (по умолчанию - stdout)')
+    args = parser.parse_args()
+
+    if args.command == 'info':
+        print(json.dumps(info(args.path), indent=2))
+        return
+    out = open(args.out, 'w') if args.out else sys.stdout
+    try:
+        for position in iter_positions(args.path):
+            out.write(json.dumps(position) + '\n')
+    finally:
+        if args.out:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
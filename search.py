@@ -0,0 +1,505 @@
+import time
+from bisect import insort
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Type
+
+from base import Player, Move, EvaluateCtx
+from bitboard import LINE_MASKS, CAPTURE_FLAG, mirror_move
+from board import Board
+from eveluate import EvaluateStrategy
+from stats import SearchStats, SectionTimer, profile_board
+from tablebase import DEFAULT_PATH as DEFAULT_TABLEBASE_PATH, open_tablebase
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+from zobrist import ZOBRIST_TO_MOVE
+
+
+WIN_SCORE = 1000000
+"""Оценка выигранной позиции. Победа через ply ходов - WIN_SCORE - ply: чем быстрее, тем лучше"""
+MAX_PLY = 1000
+"""Оценки по модулю больше WIN_SCORE - MAX_PLY - это выигрыш или проигрыш, а не оценка позиции"""
+
+
+def is_decided(score: float) -> bool:
+    """Оценка - выигрыш или проигрыш"""
+    return abs(score) >= WIN_SCORE - MAX_PLY
+
+
+def score_to_tt(score: float, ply: int) -> float:
+    """Расстояние до победы в таблице транспозиций считается от самой позиции, а не от корня"""
+    if score >= WIN_SCORE - MAX_PLY:
+        return score + ply
+    if score <= MAX_PLY - WIN_SCORE:
+        return score - ply
+    return score
+
+
+def score_from_tt(score: float, ply: int) -> float:
+    if score >= WIN_SCORE - MAX_PLY:
+        return score - ply
+    if score <= MAX_PLY - WIN_SCORE:
+        return score + ply
+    return score
+
+
+def format_score(score: float) -> str:
+    """Оценка для показа: +35, выигрыш через 3 хода - #3, проигрыш через 4 - -#4"""
+    if is_decided(score):
+        return f'{"" if score > 0 else "-"}#{int(WIN_SCORE - abs(score))}'
+    return f'{score:+.0f}'
+
+
+def distance_score(distance: int, ply: int) -> float:
+    """Оценка по расстоянию до конца игры из таблицы эндшпиля (> 0 - ходящий выигрывает через столько ходов)"""
+    return WIN_SCORE - ply - distance if distance > 0 else ply - distance - WIN_SCORE
+
+
+def root_move_codes(board: Board, player: Player, fold_mirror: bool = True) -> List[int]:
+    """
+    Корневые ходы. В позиции, симметричной по колонкам (например, начальной), зеркальные ходы дают одинаковые
+    оценки - из каждой пары остаётся первый по порядку генерации, его и выбрал бы полный перебор.
+    """
+    moves = board.logic.get_legal_move_codes(player)
+    if not (fold_mirror and board.evaluate_strategy_cls.is_mirror_symmetric() and board.logic.is_mirror_symmetric()):
+        return list(moves)
+    seen = set()
+    unique = []
+    for move in moves:
+        if mirror_move(move) not in seen:
+            unique.append(move)
+        seen.add(move)
+    return unique
+
+
+class SearchTimeout(Exception):
+    """Время на поиск закончилось"""
+
+
+@dataclass
+class AnalysisLine:
+    """Вариант анализа: корневой ход, его точная оценка и ожидаемое продолжение"""
+    move: Move
+    score: float
+    """Оценка для того, кто ходит (как у AlphaBetaSearch.player)"""
+    pv: List[Move] = field(default_factory=list)
+    """Продолжение, начиная с move (из таблицы транспозиций; без неё - только move)"""
+
+
+class AlphaBetaSearch:
+    """
+    Поиск альфа-бета (negamax) с сортировкой ходов.
+
+    Без таблицы транспозиций считает те же значения, что и GameProcess.minimax_new на той же глубине (оценка всегда для компьютера),
+    но отсекает ветки, которые не могут повлиять на результат. Порядок ходов:
+    1. ходы на финишную линию (победа)
+    2. рубка
+    3. killer-ходы (давали отсечение на этой же глубине) и ходы с лучшей историей отсечений
+    4. остальные
+
+    Конец игры проверяется в каждой позиции дерева: оценка выигрыша - WIN_SCORE минус количество ходов до него,
+    решённая позиция стоит одну позицию поиска. Если можно выиграть следующим ходом - ходы не перебираются.
+    Нет ходов - проигрыш.
+
+    Если передана таблица транспозиций - позиции, уже посчитанные на той же или большей глубине,
+    берутся из неё, а сохранённый лучший ход смотрится первым.
+    При симметричной оценке (FOLD_MIRROR) позиция и её зеркало по колонкам - одна запись таблицы
+    (ключ - меньший из двух хешей, ход хранится в ориентации ключа), а в симметричном корне
+    из пары зеркальных ходов считается один.
+
+    Позиции, где коней не больше, чем в таблице эндшпиля (TABLEBASE_PATH, см. tablebase.py), не перебираются:
+    точная оценка берётся из таблицы.
+
+    Внутри поиска ходы - упакованные числа (bitboard.pack_move), Move создаётся только для результата.
+    Статистика последнего поиска - get_stats(), с profile=True в ней есть и разбивка времени по частям.
+    """
+    KILLERS_PER_PLY = 2
+    FOLD_MIRROR = True
+    """Склеивать зеркальные позиции (только если оценка симметрична, см. EvaluateStrategy.is_mirror_symmetric)"""
+    TIME_CHECK_NODES = 256
+    """Как часто (в позициях) проверять, не кончилось ли время"""
+    TABLEBASE_PATH: Optional[str] = DEFAULT_TABLEBASE_PATH
+    """Таблица эндшпиля (None - не использовать, папки нет - позиции ищутся как обычно)"""
+    ANALYSIS_TT_MEMORY_BYTES = 4 * 1024 * 1024
+    """Таблица транспозиций для analyze, если поиску её не передали (из неё берутся продолжения)"""
+
+    def __init__(self, player: Player, other_player: Player,
+                 transposition_table: Optional[TranspositionTable] = None, profile: bool = False,
+                 evaluate_strategy_cls: Optional[Type[EvaluateStrategy]] = None):
+        self.player = player
+        """Для кого ищем ход (компьютер) - для него считается оценка позиции"""
+        self.other_player = other_player
+        self.transposition_table = transposition_table
+        self.evaluate_strategy_cls = evaluate_strategy_cls or Board.evaluate_strategy_cls
+        """Оценка позиции (по умолчанию - оценка доски)"""
+        self.fold_mirror = self.FOLD_MIRROR and self.evaluate_strategy_cls.is_mirror_symmetric()
+        self.tablebase = open_tablebase(self.TABLEBASE_PATH) if self.TABLEBASE_PATH else None
+        self.nodes = 0
+        """Количество просмотренных позиций"""
+        self.depth_reached = 0
+        """Глубина последней завершённой итерации"""
+        self.leaves = 0
+        self.cutoffs = 0
+        self.tablebase_hits = 0
+        self.max_ply = 0
+        self.timer = SectionTimer() if profile else None
+        """Замеры времени по частям поиска (только с profile=True)"""
+        self._started = 0.0
+        self._tt_counters = (0, 0)
+        self.deadline: Optional[float] = None
+        self.killers: Dict[int, List[int]] = defaultdict(list)
+        """Тихие ходы, давшие отсечение на этой глубине"""
+        self.history: Dict[Tuple[str, int], int] = defaultdict(int)
+        """Сколько отсечений дал тихий ход (цвет, ход), с весом по глубине"""
+
+    def opponent(self, player: Player) -> Player:
+        return self.other_player if player is self.player else self.player
+
+    def get_best_move(self, board: Board, depth: int) -> Optional[Move]:
+        """Лучший ход для self.player. При равных очках - первый по порядку генерации, как в get_best_move"""
+        self.start_search()
+        # корневые ходы не сортируем, чтобы при равенстве очков выбрать тот же ход, что и полный минимакс
+        best_move, _ = self.search_root(self.search_board(board), self.root_moves(board), depth)
+        self.depth_reached = depth
+        return self.to_move(best_move)
+
+    def iterative_deepening(self, board: Board, max_depth: int, time_budget: float) -> Optional[Move]:
+        """
+        Поиск на глубину 1, 2, 3... пока не кончится время (в секундах).
+        Возвращает лучший ход последней завершённой итерации, порядок корневых ходов берётся из предыдущей.
+        """
+        self.start_search()
+        deadline = time.perf_counter() + time_budget
+        board = self.search_board(board)
+        root_moves = self.root_moves(board)
+        best_move = root_moves[0] if root_moves else None
+        if len(root_moves) < 2:
+            return self.to_move(best_move)
+
+        for depth in range(1, max_depth + 1):
+            # первая итерация доводится до конца всегда, иначе нечего вернуть
+            self.deadline = deadline if depth > 1 else None
+            try:
+                best_move, scores = self.search_root(board, root_moves, depth)
+            except SearchTimeout:
+                break
+            finally:
+                self.deadline = None
+            self.depth_reached = depth
+            # лучший ход первым, остальные - по оценкам (или границам) прошлой итерации
+            root_moves.sort(key=lambda move: (move != best_move, -scores[move]))
+            # выигрыш или проигрыш найден - глубже искать нечего
+            if time.perf_counter() >= deadline or is_decided(scores[best_move]):
+                break
+        return self.to_move(best_move)
+
+    def analyze(self, board: Board, depth: int, lines: int = 3,
+                time_budget: Optional[float] = None) -> List[AnalysisLine]:
+        """
+        lines лучших ходов self.player с точными оценками и продолжениями - за один поиск.
+        Ход ищется с окном от худшей из уже найденных lines лучших оценок (см. search_root): точно досчитываются
+        только ходы, которые в них попадают, остальные отсекаются, как в поиске одного хода.
+        С time_budget (секунды) - итеративное углубление до depth, как в iterative_deepening.
+        Варианты - по убыванию оценки, при равных - в порядке ходов (первый - ход get_best_move).
+        В симметричной позиции из пары зеркальных ходов - один вариант.
+        """
+        if self.transposition_table is None:
+            # продолжения берутся из таблицы транспозиций
+            self.transposition_table = TranspositionTable(self.ANALYSIS_TT_MEMORY_BYTES)
+        self.start_search()
+        deadline = time.perf_counter() + time_budget if time_budget else None
+        board = self.search_board(board)
+        root_moves = self.root_moves(board)
+        result: List[Tuple[int, float, List[int]]] = []
+        for current in (range(1, depth + 1) if time_budget else (depth,)):
+            # первая итерация доводится до конца всегда, иначе нечего вернуть
+            self.deadline = deadline if current > 1 else None
+            pvs: Dict[int, List[int]] = {}
+            try:
+                _, scores = self.search_root(board, root_moves, current, lines, pvs)
+            except SearchTimeout:
+                break
+            finally:
+                self.deadline = None
+            self.depth_reached = current
+            # сортировка устойчивая: при равных оценках остаётся порядок перебора
+            root_moves.sort(key=lambda move: -scores[move])
+            result = [(move, scores[move], pvs[move]) for move in root_moves[:lines]]
+            if deadline is not None and (time.perf_counter() >= deadline
+                                         or all(is_decided(score) for _, score, _ in result)):
+                break
+
+        lines_result = []
+        for move, score, pv in result:
+            pv_moves = []
+            player = self.player
+            for code in pv:
+                pv_moves.append(Move.from_packed(player, code))
+                player = self.opponent(player)
+            lines_result.append(AnalysisLine(move=self.to_move(move), score=score, pv=pv_moves))
+        return lines_result
+
+    def start_search(self):
+        self._started = time.perf_counter()
+        tt = self.transposition_table
+        if tt is not None:
+            tt.new_search()
+            self._tt_counters = (tt.probes, tt.hits)
+
+    def get_stats(self, move: Optional[Move]) -> SearchStats:
+        """Статистика поиска, который вернул ход move"""
+        stats = SearchStats(
+            player=self.player.color.value,
+            move=move.notation if move else None,
+            depth=self.depth_reached,
+            max_ply=self.max_ply,
+            nodes=self.nodes,
+            leaves=self.leaves,
+            cutoffs=self.cutoffs,
+            tablebase_hits=self.tablebase_hits,
+            time=time.perf_counter() - self._started,
+        )
+        tt = self.transposition_table
+        if tt is not None:
+            stats.tt_probes = tt.probes - self._tt_counters[0]
+            stats.tt_hits = tt.hits - self._tt_counters[1]
+        if self.timer is not None:
+            stats.timings = dict(self.timer.timings)
+            stats.timings['search'] = stats.time - sum(stats.timings.values())
+        return stats
+
+    def root_moves(self, board: Board) -> List[int]:
+        return root_move_codes(board, self.player, self.fold_mirror)
+
+    def tt_key(self, board: Board, to_move: Player) -> Tuple[int, bool]:
+        """Ключ позиции в таблице транспозиций и то, что ключ взят от зеркала позиции"""
+        mirrored = self.fold_mirror and board.mirror_hash < board.hash
+        return (board.mirror_hash if mirrored else board.hash) ^ ZOBRIST_TO_MOVE[to_move.color.value], mirrored
+
+    def expected_reply(self, board: Board, move: int) -> Optional[int]:
+        """Ожидаемый ответ соперника на ход move (лучший ход позиции после него из таблицы транспозиций)"""
+        if self.transposition_table is None:
+            return None
+        child = board.make_move_code(move, self.player)
+        key, mirrored = self.tt_key(child, self.other_player)
+        entry = self.transposition_table.probe(key)
+        if entry is None or not entry.move:
+            return None
+        reply = mirror_move(entry.move) if mirrored else entry.move
+        return reply if child.logic.is_legal(self.other_player, reply) else None
+
+    def to_move(self, code: Optional[int]) -> Optional[Move]:
+        return Move.from_packed(self.player, code) if code is not None else None
+
+    def search_board(self, board: Board) -> Board:
+        """
+        Копия доски для поиска: ходы делаются на ней на месте (прерванный по времени поиск не портит доску игры),
+        оценка обновляется по ходам.
+        """
+        board = board.copy()
+        board.evaluate_strategy_cls = self.evaluate_strategy_cls
+        board.start_incremental_evaluation()
+        if self.timer is not None:
+            profile_board(board, self.timer)
+        return board
+
+    def search_root(self, board: Board, moves: Sequence[int], depth: int, lines: int = 1,
+                    pvs: Optional[Dict[int, List[int]]] = None) -> Tuple[Optional[int], Dict[int, float]]:
+        """
+        Перебор корневых ходов. Возвращает лучший ход и оценки ходов: у lines лучших - точные,
+        у остальных - верхняя граница. Каждый ход ищется с окном от худшей из lines лучших оценок,
+        поэтому при lines=1 это обычный поиск одного лучшего хода.
+        pvs - куда записать продолжения ходов, попавших в число лучших.
+        Ходы делаются на самой board через apply_code/undo.
+        """
+        best_score = float('-inf')
+        best_move = None
+        scores = {}
+        top: List[float] = []
+        """Лучшие оценки по возрастанию (не больше lines)"""
+        for move in moves:
+            alpha = top[0] if len(top) == lines else float('-inf')
+            board.apply_code(move, self.player)
+            score = -self.negamax(board, depth - 1, float('-inf'), -alpha, self.other_player, ply=1)
+            if score > alpha:
+                insort(top, score)
+                del top[:-lines]
+                if pvs is not None:
+                    # продолжение - сразу, пока записи таблицы не вытеснены поиском следующих ходов
+                    pvs[move] = [move] + self.principal_variation(board, self.other_player, depth - 1)
+            board.undo()
+            scores[move] = score
+            if score > best_score:
+                best_score = score
+                best_move = move
+        return best_move, scores
+
+    def principal_variation(self, board: Board, to_move: Player, length: int) -> List[int]:
+        """Лучшие ходы из таблицы транспозиций, начиная с позиции board (не больше length)"""
+        tt = self.transposition_table
+        pv = []
+        while tt is not None and len(pv) < length:
+            logic = board.logic
+            if logic.is_finished(to_move) or logic.is_finished(self.opponent(to_move)):
+                break
+            key, mirrored = self.tt_key(board, to_move)
+            entry = tt.probe(key)
+            if entry is None or not entry.move:
+                break
+            move = mirror_move(entry.move) if mirrored else entry.move
+            if not logic.is_legal(to_move, move):
+                break
+            board.apply_code(move, to_move)
+            pv.append(move)
+            to_move = self.opponent(to_move)
+        for _ in pv:
+            board.undo()
+        return pv
+
+    def negamax(self, board: Board, depth: int, alpha: float, beta: float, to_move: Player, ply: int) -> float:
+        """Оценка позиции для игрока to_move (чем больше, тем лучше для него)"""
+        self.nodes += 1
+        if ply > self.max_ply:
+            self.max_ply = ply
+        if self.deadline is not None and self.nodes % self.TIME_CHECK_NODES == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+
+        # конец игры: конь дошёл до финиша (последним ходил соперник, но проверяем обоих)
+        logic = board.logic
+        if logic.is_finished(self.opponent(to_move)):
+            self.leaves += 1
+            return ply - WIN_SCORE
+        if logic.is_finished(to_move):
+            self.leaves += 1
+            return WIN_SCORE - ply
+
+        # мало коней - точная оценка из таблицы эндшпиля
+        if self.tablebase is not None:
+            distance = self.tablebase.probe(logic.bitboards, to_move)
+            if distance is not None:
+                self.leaves += 1
+                self.tablebase_hits += 1
+                return distance_score(distance, ply)
+
+        # лучше победы следующим ходом и хуже проигрыша здесь же не будет - окно сужается
+        alpha = max(alpha, ply - WIN_SCORE)
+        beta = min(beta, WIN_SCORE - ply - 1)
+        if alpha >= beta:
+            return alpha
+
+        tt = self.transposition_table
+        tt_move = 0
+        if tt is not None:
+            mirrored = self.fold_mirror and board.mirror_hash < board.hash
+            key = (board.mirror_hash if mirrored else board.hash) ^ ZOBRIST_TO_MOVE[to_move.color.value]
+            entry = tt.probe(key)
+            if entry is not None:
+                if entry.depth >= depth:
+                    score = score_from_tt(entry.score, ply)
+                    if entry.bound == EXACT \
+                            or (entry.bound == LOWER and score >= beta) \
+                            or (entry.bound == UPPER and score <= alpha):
+                        return score
+                tt_move = mirror_move(entry.move) if mirrored and entry.move else entry.move
+
+        if depth == 0:
+            self.leaves += 1
+            score = board.evaluate(self.player, EvaluateCtx(next_step_player=to_move, other_player=self.other_player))
+            score = score if to_move is self.player else -score
+            if tt is not None:
+                tt.store(key, 0, score, EXACT)
+            return score
+
+        # победа следующим ходом - остальные ходы не нужны
+        winning_move = next(logic.iter_winning_moves(to_move), None)
+        if winning_move is not None:
+            self.leaves += 1
+            score = WIN_SCORE - ply - 1
+            if tt is not None:
+                tt.store(key, depth, score_to_tt(score, ply), EXACT, mirror_move(winning_move) if mirrored else winning_move)
+            return score
+
+        best = float('-inf')
+        best_move = None
+        for move in self.order_moves(board, to_move, ply, tt_move):
+            board.apply_code(move, to_move)
+            value = -self.negamax(board, depth - 1, -beta, -max(alpha, best), self.opponent(to_move), ply + 1)
+            board.undo()
+            if value > best:
+                best = value
+                best_move = move
+                if best >= beta:
+                    self.cutoffs += 1
+                    self.store_cutoff(move, to_move, depth, ply)
+                    break
+
+        if best_move is None:  # ходов нет - проигрыш
+            best = ply - WIN_SCORE
+        if tt is not None:
+            bound = UPPER if best <= alpha else LOWER if best >= beta else EXACT
+            if best_move is not None and mirrored:
+                best_move = mirror_move(best_move)
+            tt.store(key, depth, score_to_tt(best, ply), bound, best_move or 0)
+        return best
+
+    def order_moves(self, board: Board, player: Player, ply: int, tt_move: int = 0) -> Iterator[int]:
+        """
+        Ходы по этапам, лениво: ход из таблицы транспозиций, победа, рубка, killer-ходы, остальные по истории.
+        Генератор продолжается после board.undo(), т.е. всегда в позиции этого узла.
+        """
+        logic = board.logic
+        if tt_move and logic.is_legal(player, tt_move):
+            yield tt_move
+        else:
+            tt_move = 0
+
+        for move in logic.iter_winning_moves(player):
+            if move != tt_move:
+                yield move
+        for move in logic.iter_captures(player, to_finish=False):
+            if move != tt_move:
+                yield move
+
+        # killer-ходы - только если они всё ещё тихие ходы в этой позиции
+        occupied_or_finish = logic.bitboards[player.color.value] | logic.bitboards[player.opponent_color.value] \
+            | LINE_MASKS[player.finish_line]
+        killers = [
+            move for move in self.killers[ply]
+            if move != tt_move and not occupied_or_finish >> (move >> 6 & 63) & 1 and logic.is_legal(player, move)
+        ]
+        yield from killers
+
+        color = player.color.value
+        skip = set(killers)
+        skip.add(tt_move)
+        quiet = [move for move in logic.iter_quiet_moves(player, to_finish=False) if move not in skip]
+        # сначала ходы на клетки, которые соперник не бьёт, внутри - по истории отсечений
+        quiet.sort(key=lambda move: (not logic.is_square_safe(player, move >> 6 & 63),
+                                     -self.history.get((color, move), 0)))
+        yield from quiet
+
+    def store_cutoff(self, move: int, player: Player, depth: int, ply: int):
+        """Запоминаем тихий ход, давший отсечение"""
+        if move & CAPTURE_FLAG or move >> 9 & 7 == player.finish_line:
+            return
+        self.history[(player.color.value, move)] += depth * depth
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[self.KILLERS_PER_PLY:]
+
+
+def analyze_position(board: Board, player: Player, depth: int, lines: int = 3, time_budget: Optional[float] = None,
+                     transposition_table: Optional[TranspositionTable] = None) -> List[AnalysisLine]:
+    """
+    Анализ (AlphaBetaSearch.analyze) за любую сторону, например подсказка пользователю.
+    Оценка позиции считается для "компьютера" - здесь им становится player (ходы вариантов - с копиями
+    игроков доски, где компьютер - player). Поэтому таблица транспозиций нужна своя для каждой стороны.
+    """
+    me = Player(color=player.color, home_line=player.home_line, is_computer=True)
+    other = Player(color=player.opponent_color, home_line=7 - player.home_line, is_computer=False)
+    players = {me.color.value: me, other.color.value: other}
+    own_board = Board(None, players, bitboards=dict(board.bitboards), zobrist=board.hash,
+                      mirror_zobrist=board.mirror_hash)
+    search = AlphaBetaSearch(me, other, transposition_table=transposition_table,
+                             evaluate_strategy_cls=board.evaluate_strategy_cls)
+    return search.analyze(own_board, depth, lines, time_budget)
@@ -0,0 +1,383 @@
+"""
+Сервис на много игр сразу: сессии GameProcess в одном процессе, поиск - в общем пуле процессов.
+
+Запуск: python service.py [--host 127.0.0.1] [--port 8765] [--workers N]
+
+Протокол: TCP, JSON по строке на запрос и на ответ (поле id из запроса возвращается в ответе).
+    {"op": "new", "player_is_white": true}                       -> {"session": "1"}
+    {"op": "position", "session": "1", "position": "startpos moves 7253"}   (как position в engine.py)
+    {"op": "legal", "session": "1"}                              -> {"moves": ["0021", ...]} - ходы пользователя
+    {"op": "go", "session": "1", "depth": 4, "deadline_ms": 5000} -> {"bestmove": "0021", "depth": 4, "nodes": ...}
+    {"op": "go", "session": "1", "movetime": 200}                  поиск по времени
+    {"op": "metrics"} / {"op": "metrics", "session": "1"}        очереди и задержки
+    {"op": "close", "session": "1"}
+Ошибка - {"error": "..."}, истёкший срок запроса - {"error": "deadline"}.
+
+Одновременно ищется не больше ходов, чем процессов в пуле, остальные ждут в очереди.
+Срок запроса (deadline_ms) считается с момента получения: если он истёк в очереди - поиск не запускается.
+Остаток срока передаётся процессу пула: поиск идёт итеративным углублением до depth и к сроку останавливается
+с лучшим ходом последней законченной глубины (в ответе - достигнутая глубина), процесс сразу свободен.
+Таблицы ходов коня (bitboard) и ключи zobrist - модульные, в каждом процессе пула они загружаются
+один раз при старте и общие для всех сессий; таблица транспозиций у процесса пула своя, тоже общая для сессий.
+Дебютная книга (GameProcess.BOOK_PATH) открывается через mmap один раз на процесс сервиса: позиция из книги
+отвечается сразу, без очереди и пула (в ответе "book": true).
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional, Tuple
+
+from base import Move, Player
+from board import Board
+from engine import EngineError, HeadlessEngine, format_move
+from search import AlphaBetaSearch
+from transposition import TranspositionTable
+
+_tt_memory_bytes = 0
+_transposition_tables: Dict[str, TranspositionTable] = {}
+"""Таблицы транспозиций процесса пула - по цвету компьютера (оценка позиции зависит от того, за кого играет компьютер)"""
+
+
+def _init_worker(tt_memory_bytes: int):
+    global _tt_memory_bytes
+    _tt_memory_bytes = tt_memory_bytes
+    # таблицы строятся при импорте - загружаем их при старте процесса, а не на первом запросе
+    import bitboard  # noqa: F401
+    import zobrist  # noqa: F401
+
+
+def _search_position(bitboards: Dict[str, int], players: Dict[str, Player], color: str, depth: int,
+                     time_budget: float) -> Tuple[Optional[int], int, int]:
+    """
+    Лучший ход (упакованный), количество позиций и достигнутая глубина (выполняется в процессе пула).
+    Поиск - итеративное углубление до depth, не дольше time_budget секунд.
+    """
+    tt = _transposition_tables.get(color)
+    if tt is None and _tt_memory_bytes:
+        tt = _transposition_tables[color] = TranspositionTable(_tt_memory_bytes)
+
+    player = players[color]
+    other_player = players[player.opponent_color.value]
+    board = Board(None, players, bitboards=bitboards)
+    search = AlphaBetaSearch(player, other_player, transposition_table=tt)
+    move = search.iterative_deepening(board, depth, time_budget)
+    return (move.packed if move else None), search.nodes, search.depth_reached
+
+
+class ServiceError(Exception):
+    """Ошибка запроса"""
+
+
+@dataclass
+class LatencyStats:
+    """Задержки запросов (секунды)"""
+    RECENT = 1000
+    """Сколько последних задержек хранить для перцентилей"""
+
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    recent: Deque[float] = field(default_factory=lambda: deque(maxlen=LatencyStats.RECENT))
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def percentile(self, p: float) -> float:
+        if not self.recent:
+            return 0.0
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+    def as_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p50_ms': self.percentile(0.5) * 1000,
+            'p95_ms': self.percentile(0.95) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+@dataclass
+class QueueStats:
+    """Счётчики очереди поиска"""
+    queued: int = 0
+    """Запросы, ждущие свободный процесс"""
+    running: int = 0
+    completed: int = 0
+    timeouts: int = 0
+    errors: int = 0
+    latency: LatencyStats = field(default_factory=LatencyStats)
+    """От получения запроса до ответа"""
+    queue_wait: LatencyStats = field(default_factory=LatencyStats)
+    """Ожидание свободного процесса"""
+
+    def as_dict(self) -> dict:
+        return {
+            'queued': self.queued,
+            'running': self.running,
+            'completed': self.completed,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'latency': self.latency.as_dict(),
+            'queue_wait': self.queue_wait.as_dict(),
+        }
+
+
+class Session:
+    """Одна игра"""
+
+    def __init__(self, session_id: str, player_is_white: bool):
+        self.id = session_id
+        # поиск идёт в пуле - своя таблица транспозиций сессии не нужна
+        self.engine = HeadlessEngine(player_is_white=player_is_white, tt_memory_bytes=0)
+        self.stats = QueueStats()
+
+    @property
+    def game(self):
+        return self.engine.game
+
+
+class EngineService:
+    """Сессии игр и очередь поиска на ограниченном пуле процессов"""
+    WORKERS: Optional[int] = None
+    """Процессов поиска (None - по числу ядер)"""
+    TT_MEMORY_BYTES = 16 * 1024 * 1024
+    """Таблица транспозиций каждого процесса пула"""
+    DEFAULT_DEADLINE_MS = 10000
+    DEADLINE_MARGIN = 0.05
+    """Поиск в пуле кончается раньше срока запроса на столько секунд - запас на передачу ответа"""
+    MAX_SESSIONS = 10000
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or self.WORKERS or os.cpu_count() or 1
+        self.sessions: Dict[str, Session] = {}
+        self.stats = QueueStats()
+        self._ids = itertools.count(1)
+        self._executor = self._new_executor()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker, initargs=(self.TT_MEMORY_BYTES,),
+        )
+
+    def _run_search(self, *args) -> asyncio.Future:
+        """Поиск в пуле; если процесс пула упал - пул создаётся заново"""
+        loop = asyncio.get_running_loop()
+        try:
+            return loop.run_in_executor(self._executor, _search_position, *args)
+        except BrokenProcessPool:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._new_executor()
+            return loop.run_in_executor(self._executor, _search_position, *args)
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        # семафор создаётся в работающем цикле событий
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._slots
+
+    async def handle(self, request: dict) -> dict:
+        """Выполнить запрос, вернуть ответ"""
+        try:
+            response = await self._dispatch(request)
+        except (ServiceError, EngineError) as e:
+            response = {'error': str(e)}
+        except Exception as e:
+            # ошибка одного запроса не должна рвать соединение с остальными запросами
+            self.stats.errors += 1
+            response = {'error': f'internal error: {e!r}'}
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    async def _dispatch(self, request: dict) -> dict:
+        op = request.get('op')
+        if op == 'new':
+            if len(self.sessions) >= self.MAX_SESSIONS:
+                raise ServiceError('too many sessions')
+            player_is_white = request.get('player_is_white', True)
+            if not isinstance(player_is_white, bool):
+                raise ServiceError('player_is_white must be true or false')
+            session = Session(str(next(self._ids)), player_is_white)
+            self.sessions[session.id] = session
+            return {'session': session.id}
+        if op == 'metrics':
+            return self.metrics(request.get('session'))
+
+        session = self.get_session(request.get('session'))
+        if op == 'position':
+            session.engine.set_position(str(request.get('position', '')).split())
+            return {}
+        if op == 'legal':
+            game = session.game
+            return {'moves': [format_move(move) for move in game.board.logic.get_legal_moves(game.other_player)]}
+        if op == 'go':
+            return await self.go(session, request)
+        if op == 'close':
+            del self.sessions[session.id]
+            session.engine.close()
+            return {}
+        raise ServiceError(f'unknown op {op}')
+
+    def get_session(self, session_id) -> Session:
+        session = self.sessions.get(str(session_id))
+        if session is None:
+            raise ServiceError(f'unknown session {session_id}')
+        return session
+
+    async def go(self, session: Session, request: dict) -> dict:
+        """Поиск хода компьютера в пуле с ограничением по сроку запроса"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        game = session.game
+        try:
+            depth = int(request.get('depth') or 0)
+            movetime = int(request.get('movetime') or 0)
+            deadline = int(request.get('deadline_ms') or self.DEFAULT_DEADLINE_MS) / 1000
+        except (TypeError, ValueError):
+            raise ServiceError('bad go parameters')
+        if depth > game.MAX_DEPTH:
+            raise ServiceError(f'depth must be 1..{game.MAX_DEPTH}')
+        if movetime > 0:
+            depth, time_budget = game.MAX_DEPTH, movetime / 1000
+        else:
+            depth, time_budget = depth if depth > 0 else game.PREDICT_LEVEL, deadline
+        book_move = game.get_book_move()
+        if book_move is not None:
+            latency = loop.time() - started
+            for stats in (self.stats, session.stats):
+                stats.completed += 1
+                stats.latency.add(latency)
+            return {'bestmove': format_move(book_move), 'book': True, 'depth': 0, 'nodes': 0,
+                    'latency_ms': latency * 1000, 'queue_ms': 0.0}
+
+        # позиция берётся на момент запроса - последующие position её не меняют
+        bitboards, players, color = dict(game.board.bitboards), game.players, game.computer_player.color.value
+
+        counters = (self.stats, session.stats)
+        for stats in counters:
+            stats.queued += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), deadline)
+        except asyncio.TimeoutError:
+            for stats in counters:
+                stats.timeouts += 1
+            raise ServiceError('deadline')
+        finally:
+            for stats in counters:
+                stats.queued -= 1
+
+        queue_wait = loop.time() - started
+        remaining = deadline - queue_wait
+        time_budget = max(0.0, min(time_budget, remaining - self.DEADLINE_MARGIN))
+        try:
+            future = self._run_search(bitboards, players, color, depth, time_budget)
+        except Exception as e:
+            self.slots.release()
+            for stats in counters:
+                stats.errors += 1
+            raise ServiceError(f'search failed: {e!r}')
+        # процесс занят, пока поиск не остановится, даже если клиент уже получил отказ по сроку
+        future.add_done_callback(lambda _: self.slots.release())
+        for stats in counters:
+            stats.running += 1
+            stats.queue_wait.add(queue_wait)
+        try:
+            move, nodes, depth_reached = await asyncio.wait_for(asyncio.shield(future), remaining)
+        except asyncio.TimeoutError:
+            for stats in counters:
+                stats.timeouts += 1
+            raise ServiceError('deadline')
+        except Exception as e:
+            for stats in counters:
+                stats.errors += 1
+            raise ServiceError(f'search failed: {e!r}')
+        finally:
+            for stats in counters:
+                stats.running -= 1
+
+        latency = loop.time() - started
+        for stats in counters:
+            stats.completed += 1
+            stats.latency.add(latency)
+        return {
+            'bestmove': format_move(Move.from_packed(game.computer_player, move)) if move is not None else None,
+            'depth': depth_reached,
+            'nodes': nodes,
+            'latency_ms': latency * 1000,
+            'queue_ms': queue_wait * 1000,
+        }
+
+    def metrics(self, session_id=None) -> dict:
+        if session_id is not None:
+            return {'session': str(session_id), **self.get_session(session_id).stats.as_dict()}
+        return {'sessions': len(self.sessions), 'workers': self.workers, **self.stats.as_dict()}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Запросы одного соединения выполняются по очереди, соединения - параллельно"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError
+                except ValueError:
+                    response = {'error': 'bad json'}
+                else:
+                    response = await self.handle(request)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8765) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def _main(args):
+    service = EngineService(args.workers)
+    server = await service.serve(args.host, args.port)
+    print(f'Сервис слушает {args.host}:{args.port}, процессов поиска: {service.workers}')
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сервис движка "Буква Г" на много игр')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None)
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
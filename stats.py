@@ -0,0 +1,119 @@
+"""
+Статистика поиска хода.
+
+Счётчики (позиции, листья, отсечения, глубина) поиск ведёт всегда - это несколько сложений на позицию.
+Разбивка времени по частям (генерация ходов, make_move, каждый показатель оценки) включается отдельно:
+методы доски поиска и показателей оборачиваются замерами только в этом случае, без неё код поиска не меняется.
+"""
+
+import json
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field, asdict
+from typing import Callable, Dict, Iterator, List, Optional
+
+from board import Board
+
+
+@dataclass
+class SearchStats:
+    """Статистика одного поиска хода"""
+    player: str = ''
+    """Цвет игрока, для которого искали ход"""
+    move: Optional[str] = None
+    """Найденный ход (Move.notation)"""
+    depth: int = 0
+    """Глубина последней завершённой итерации"""
+    max_ply: int = 0
+    """Самый глубокий просмотренный уровень"""
+    nodes: int = 0
+    leaves: int = 0
+    """Позиции, для которых считалась оценка"""
+    cutoffs: int = 0
+    """Отсечения по beta"""
+    tt_probes: int = 0
+    tt_hits: int = 0
+    tablebase_hits: int = 0
+    """Позиции, оценка которых взята из таблицы эндшпиля"""
+    time: float = 0.0
+    book: bool = False
+    """Ход взят из дебютной книги, поиска не было"""
+    timings: Dict[str, float] = field(default_factory=dict)
+    """Время по частям поиска (секунды, без вложенных частей), только при profile=True"""
+
+    @property
+    def effective_branching_factor(self) -> float:
+        """Во сколько раз в среднем растёт дерево на каждый уровень"""
+        return self.nodes ** (1 / self.depth) if self.depth and self.nodes else 0.0
+
+    def as_dict(self) -> dict:
+        result = asdict(self)
+        result['effective_branching_factor'] = self.effective_branching_factor
+        return result
+
+
+def write_json_line(path: str, stats: SearchStats):
+    """Дописать статистику строкой JSON в файл"""
+    with open(path, 'a') as f:
+        f.write(json.dumps(stats.as_dict()) + '\n')
+
+
+class SectionTimer:
+    """Время по частям. Вложенные замеры вычитаются из внешних - части не пересекаются"""
+
+    def __init__(self):
+        self.timings: Dict[str, float] = defaultdict(float)
+        self._stack: List[List[float]] = []
+        """Начатые замеры: [время начала, время вложенных замеров]"""
+
+    def _enter(self):
+        self._stack.append([time.perf_counter(), 0.0])
+
+    def _exit(self, name: str):
+        started, nested = self._stack.pop()
+        elapsed = time.perf_counter() - started
+        self.timings[name] += elapsed - nested
+        if self._stack:
+            self._stack[-1][1] += elapsed
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        def timed(*args, **kwargs):
+            self._enter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._exit(name)
+        return timed
+
+    def wrap_iter(self, name: str, func: Callable[..., Iterator]) -> Callable[..., Iterator]:
+        """Для генераторов меряется каждый шаг, а не создание генератора"""
+        def timed(*args, **kwargs):
+            iterator = func(*args, **kwargs)
+            while True:
+                self._enter()
+                try:
+                    value = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self._exit(name)
+                yield value
+        return timed
+
+
+def profile_board(board: Board, timer: SectionTimer):
+    """
+    Обернуть замерами методы доски поиска (после start_incremental_evaluation):
+    movegen - генерация и проверка ходов, make_move - apply/undo, показатели оценки - по имени класса.
+    """
+    logic = board.logic
+    for name in ('iter_winning_moves', 'iter_captures', 'iter_quiet_moves'):
+        setattr(logic, name, timer.wrap_iter('movegen', getattr(logic, name)))
+    for name in ('get_legal_move_codes', 'is_legal'):
+        setattr(logic, name, timer.wrap('movegen', getattr(logic, name)))
+    board.apply_code = timer.wrap('make_move', board.apply_code)
+    board.undo = timer.wrap('make_move', board.undo)
+    for index in board.evaluation.indexes:
+        index_name = type(index).__name__
+        index.update = timer.wrap(index_name, index.update)
+        index.calc_incremental = timer.wrap(index_name, index.calc_incremental)
@@ -0,0 +1,295 @@
+"""
+Таблица эндшпиля: точный результат каждой позиции, где на доске не больше N коней.
+
+Позиция приводится к виду "ходит игрок, идущий к линии 7" (иначе доска отражается по линиям),
+поэтому цвет и сторона доски не важны - позиция задаётся двумя масками: кони того, кто ходит,
+и кони соперника. Хранится расстояние до конца игры в ходах, один байт со знаком:
+d > 0 - ходящий выигрывает через d ходов, d <= 0 - проигрывает через -d (0 - ходов нет).
+
+Файлы - по одному на количество коней (ходящего, соперника): knights_<m>_<o>.bin, заголовок и байты
+всех позиций подряд. Кони ходящего стоят на линиях 0-6 (на линии 7 он уже выиграл), соперника -
+на линиях 1-7, номер позиции - номера сочетаний клеток обеих сторон. Файлы отображаются в память (mmap).
+
+Генерация - ретроградный анализ. Тихий ход - только вперёд, рубка уменьшает число коней, поэтому в игре
+нет циклов. Позиции считаются от меньшего числа коней к большему, а при равном - от самых продвинутых
+(сумма пройденных линий обеих сторон) к менее продвинутым: позиции после любого хода к этому времени уже посчитаны.
+Позиции одного уровня друг от друга не зависят, их делят между собой процессы пула и пишут прямо в файл.
+После каждого уровня записывается прогресс - прерванная генерация продолжается с того же места.
+
+Генерация: python tablebase.py --out tablebase [--pieces 3] [--workers N]
+"""
+
+import argparse
+import itertools
+import math
+import mmap
+import multiprocessing
+import os
+import re
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from base import Player
+from bitboard import KNIGHT_MASKS, FORWARD_KNIGHT_MASKS, LINE_MASKS, iter_squares, flip_bitboard
+
+MAGIC = b'HGTB0001'
+HEADER = struct.Struct('<8sBB')
+"""Метка формата, коней у ходящего, коней у соперника"""
+SQUARES = 56
+"""Клеток, где может стоять конь каждой стороны в позиции, где игра не окончена"""
+UNKNOWN = -128
+"""Позиция не посчитана (или невозможна - кони обеих сторон на одной клетке)"""
+MAX_DISTANCE = 127
+"""Самое большое расстояние, которое помещается в байт"""
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tablebase')
+
+BINOMIALS: Tuple[Tuple[int, ...], ...] = tuple(tuple(math.comb(n, k) for k in range(9)) for n in range(SQUARES + 1))
+
+Layer = Tuple[int, int]
+"""Коней у ходящего, коней у соперника"""
+
+
+def layer_name(layer: Layer) -> str:
+    return 'knights_{}_{}.bin'.format(*layer)
+
+
+def layer_size(layer: Layer) -> int:
+    """Позиций в файле"""
+    return BINOMIALS[SQUARES][layer[0]] * BINOMIALS[SQUARES][layer[1]]
+
+
+def combination_rank(mask: int) -> int:
+    """Номер сочетания клеток маски среди всех сочетаний того же размера (клетки 0..55)"""
+    rank = 0
+    for i, sq in enumerate(iter_squares(mask)):
+        rank += BINOMIALS[sq][i + 1]
+    return rank
+
+
+def position_index(mover: int, opponent: int) -> int:
+    """Номер позиции в файле. Кони соперника на линиях 1-7 сдвигаются на линию вниз"""
+    return combination_rank(mover) * BINOMIALS[SQUARES][opponent.bit_count()] + combination_rank(opponent >> 8)
+
+
+class Tablebase:
+    """Таблица эндшпиля: файлы слоёв, отображённые в память"""
+
+    def __init__(self, layers: Dict[Layer, mmap.mmap]):
+        self.layers = layers
+        self.max_pieces = 0
+        """Все позиции до стольких коней включительно есть в таблице"""
+        while all((movers, self.max_pieces + 1 - movers) in layers for movers in range(self.max_pieces + 2)):
+            self.max_pieces += 1
+
+    @classmethod
+    def open(cls, directory: str) -> 'Tablebase':
+        layers = {}
+        for name in sorted(os.listdir(directory)):
+            match = re.fullmatch(r'knights_(\d)_(\d)\.bin', name)
+            if match:
+                layer = (int(match[1]), int(match[2]))
+                layers[layer] = open_layer(os.path.join(directory, name), layer)
+        return cls(layers)
+
+    def value(self, mover: int, opponent: int) -> int:
+        """Расстояние до конца игры для приведённой позиции (ходящий идёт к линии 7)"""
+        data = self.layers[(mover.bit_count(), opponent.bit_count())]
+        value = data[HEADER.size + position_index(mover, opponent)]
+        return value - 256 if value > 127 else value
+
+    def probe(self, bitboards: Dict[str, int], player: Player) -> Optional[int]:
+        """
+        Расстояние до конца игры, если ходит player: > 0 - он выигрывает через столько ходов, <= 0 - проигрывает.
+        None - коней больше, чем в таблице, или игра уже окончена.
+        """
+        own = bitboards[player.color.value]
+        opponent = bitboards[player.opponent_color.value]
+        if (own | opponent).bit_count() > self.max_pieces:
+            return None
+        if player.home_line != 0:
+            own, opponent = flip_bitboard(own), flip_bitboard(opponent)
+        if own & LINE_MASKS[7] or opponent & LINE_MASKS[0]:
+            return None
+        return self.value(own, opponent)
+
+    def close(self):
+        for data in self.layers.values():
+            data.close()
+
+
+def open_layer(path: str, layer: Layer, writable: bool = False) -> mmap.mmap:
+    with open(path, 'r+b' if writable else 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+    magic, movers, opponents = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or (movers, opponents) != layer or len(data) != HEADER.size + layer_size(layer):
+        data.close()
+        raise ValueError(f'{path} - не файл таблицы эндшпиля')
+    return data
+
+
+_tablebases: Dict[str, Tuple[int, Optional[Tablebase]]] = {}
+"""Папка -> время её изменения и открытая таблица"""
+
+
+def open_tablebase(directory: str) -> Optional[Tablebase]:
+    """
+    Таблица по пути, одна на процесс (None - таблицы нет).
+    Слои, готовые после первого открытия (генерация идёт, пока процесс работает), подхватываются:
+    готовый слой переименовывается в папке, и время её изменения меняется.
+    """
+    if not os.path.isdir(directory):
+        return None
+    mtime = os.stat(directory).st_mtime_ns
+    cached = _tablebases.get(directory)
+    if cached is None or cached[0] != mtime:
+        tablebase = Tablebase.open(directory)
+        cached = _tablebases[directory] = (mtime, tablebase if tablebase.max_pieces else None)
+    return cached[1]
+
+
+def solve(tablebase: Tablebase, mover: int, opponent: int) -> int:
+    """Расстояние до конца игры по уже посчитанным позициям после каждого хода"""
+    empty = ~(mover | opponent)
+    forward_masks = FORWARD_KNIGHT_MASKS[0]
+    best = None
+    best_key = None
+    for sq in iter_squares(mover):
+        # рубить можно в любую сторону, на пустую клетку - только вперёд
+        targets = (KNIGHT_MASKS[sq] & opponent) | (forward_masks[sq] & empty)
+        if targets & LINE_MASKS[7]:
+            return 1
+        for target in iter_squares(targets):
+            to_bit = 1 << target
+            # после хода ходит соперник - доска отражается, чтобы он шёл к линии 7
+            child = tablebase.value(flip_bitboard(opponent & ~to_bit), flip_bitboard(mover ^ (1 << sq) ^ to_bit))
+            if child == UNKNOWN or child <= -MAX_DISTANCE or child >= MAX_DISTANCE:
+                raise ValueError(f'позиция после хода не посчитана или слишком далека от конца игры: {child}')
+            # соперник проигрывает через k - мы выигрываем через k + 1, и наоборот
+            value = 1 - child if child <= 0 else -child - 1
+            # быстрее выиграть, дольше проигрывать
+            key = -value if value > 0 else -value - 2 * MAX_DISTANCE
+            if best_key is None or key > best_key:
+                best, best_key = value, key
+    return 0 if best is None else best
+
+
+@lru_cache(maxsize=None)
+def combinations_by_advance(count: int, opponent: bool) -> Dict[int, List[Tuple[int, int]]]:
+    """
+    Сочетания клеток одной стороны по продвинутости (сколько линий пройдено всеми конями): [(номер, маска)].
+    Ходящий идёт от линии 0, соперник - от линии 7.
+    """
+    result: Dict[int, List[Tuple[int, int]]] = {}
+    for squares in itertools.combinations(range(SQUARES), count):
+        mask = 0
+        for sq in squares:
+            mask |= 1 << sq
+        if opponent:
+            advance = sum(6 - sq // 8 for sq in squares)
+            mask <<= 8
+        else:
+            advance = sum(sq // 8 for sq in squares)
+        rank = sum(BINOMIALS[sq][i + 1] for i, sq in enumerate(squares))
+        result.setdefault(advance, []).append((rank, mask))
+    return result
+
+
+def _layer_path(directory: str, layer: Layer) -> str:
+    """Готовый файл слоя или ещё считаемый"""
+    path = os.path.join(directory, layer_name(layer))
+    return path if os.path.exists(path) else path + '.part'
+
+
+def _solve_level(directory: str, layer: Layer, level: int, part: int, parts: int) -> int:
+    """Посчитать часть позиций слоя с продвинутостью level (выполняется в процессе пула)"""
+    movers, opponents = layer
+    data = open_layer(_layer_path(directory, layer), layer, writable=True)
+    # после хода: кони соперника ходят, наших - столько же; после рубки у соперника на одного меньше
+    layers = {layer: data}
+    for child in {(opponents, movers), (opponents - 1, movers)}:
+        if movers and child[0] >= 0 and child not in layers:
+            layers[child] = open_layer(_layer_path(directory, child), child)
+    tablebase = Tablebase(layers)
+
+    solved = 0
+    opponent_size = BINOMIALS[SQUARES][opponents]
+    opponent_groups = combinations_by_advance(opponents, True)
+    for advance, mover_list in combinations_by_advance(movers, False).items():
+        opponent_list = opponent_groups.get(level - advance)
+        if not opponent_list:
+            continue
+        for mover_rank, mover in mover_list[part::parts]:
+            offset = HEADER.size + mover_rank * opponent_size
+            for opponent_rank, opponent in opponent_list:
+                if mover & opponent:
+                    continue
+                data[offset + opponent_rank] = solve(tablebase, mover, opponent) & 0xFF
+                solved += 1
+    data.flush()
+    tablebase.close()
+    return solved
+
+
+def _generate_group(executor: ProcessPoolExecutor, directory: str, layers: List[Layer], parts: int):
+    """Посчитать слои с одним набором коней (m, o) и (o, m) - позиции после тихого хода остаются в нём же"""
+    progress_path = os.path.join(directory, layer_name(layers[0]) + '.progress')
+    max_level = 6 * sum(layers[0])
+    if os.path.exists(progress_path):
+        with open(progress_path) as f:
+            start = int(f.read()) - 1
+    else:
+        for layer in layers:
+            with open(os.path.join(directory, layer_name(layer) + '.part'), 'wb') as f:
+                f.write(HEADER.pack(MAGIC, *layer))
+                f.write(bytes([UNKNOWN & 0xFF]) * layer_size(layer))
+        start = max_level
+
+    started = time.perf_counter()
+    solved = 0
+    for level in range(start, -1, -1):
+        futures = [
+            executor.submit(_solve_level, directory, layer, level, part, parts)
+            for layer in layers for part in range(parts)
+        ]
+        solved += sum(future.result() for future in futures)
+        with open(progress_path, 'w') as f:
+            f.write(str(level))
+
+    for layer in layers:
+        path = os.path.join(directory, layer_name(layer))
+        if not os.path.exists(path):
+            os.replace(path + '.part', path)
+    os.remove(progress_path)
+    print(f'{", ".join(layer_name(layer) for layer in layers)}: {solved} позиций за {time.perf_counter() - started:.1f} с')
+
+
+def generate(directory: str, pieces: int, workers: Optional[int] = None):
+    """Построить таблицу для позиций до pieces коней (уже готовые слои пропускаются)"""
+    os.makedirs(directory, exist_ok=True)
+    workers = workers or os.cpu_count()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        for total in range(1, pieces + 1):
+            for movers in range(total, (total - 1) // 2, -1):
+                layers = [(movers, total - movers)]
+                if movers != total - movers:
+                    layers.append((total - movers, movers))
+                if all(os.path.exists(os.path.join(directory, layer_name(layer))) for layer in layers):
+                    continue
+                _generate_group(executor, directory, layers, parts=workers * 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генерация таблицы эндшпиля')
+    parser.add_argument('--out', default=DEFAULT_PATH, help='папка с файлами таблицы')
+    parser.add_argument('--pieces', type=int, default=3, help='коней на доске (обеих сторон)')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    generate(args.out, args.pieces, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# модули движка лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from process import GameProcess  # noqa: E402
+
+
+@pytest.fixture
+def game():
+    """Новая игра, пользователь - белыми: без дебютной книги и таблицы транспозиций"""
+    game = GameProcess()
+    game.BOOK_PATH = None
+    game.TT_MEMORY_BYTES = 0
+    game.make_players(player_is_white=True)
+    yield game
+    game.close()
@@ -0,0 +1,81 @@
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from background import BackgroundEngine
+from stats import SearchStats
+
+
+@pytest.fixture
+def game(game):
+    game.PREDICT_LEVEL = 2
+    return game
+
+
+def wait_move(engine: BackgroundEngine, timeout: float = 20.0):
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        move = engine.poll()
+        if move is not None or not engine.thinking:
+            return move
+        time.sleep(0.02)
+    raise AssertionError('компьютер не походил')
+
+
+def test_search_does_not_wait_for_stale_ponder_and_hints(game):
+    engine = BackgroundEngine(game)
+    try:
+        # прогреваем процесс поиска, чтобы замерять только ожидание
+        engine._search_executor.submit(time.sleep, 0).result()
+        # обдумывание не той позиции и подсказка заняли свои процессы надолго
+        stale = engine._ponder_executor.submit(time.sleep, 30)
+        engine._ponder = ({'W': 0, 'B': 0}, stale)
+        engine._hint_executor.submit(time.sleep, 30)
+        engine.request_hints()
+
+        game.click_to_tile((7, 2))
+        game.click_to_tile((5, 3))
+        started = time.perf_counter()
+        engine.start_thinking()
+        assert wait_move(engine) is not None
+        assert time.perf_counter() - started < 10
+        assert engine.hints() is None
+    finally:
+        engine.close()
+
+
+def finished_future(result=None, exception=None) -> Future:
+    future = Future()
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+    return future
+
+
+def test_no_computer_move_ends_the_game(game):
+    engine = BackgroundEngine(game, ponder=False)
+    try:
+        engine._future = finished_future((None, None, SearchStats(player=game.computer_player.color.value)))
+        assert engine.poll() is None
+        assert not engine.thinking
+        assert game.is_game_over
+        assert game.who_wins(game.board) is game.other_player
+    finally:
+        engine.close()
+
+
+def test_failed_search_falls_back_to_search_in_process(game):
+    engine = BackgroundEngine(game, ponder=False)
+    try:
+        game.click_to_tile((7, 2))
+        game.click_to_tile((5, 3))
+        board = game.board
+        engine._future = finished_future(exception=RuntimeError('worker died'))
+        move = engine.poll()
+        assert move is not None and move.player is game.computer_player
+        assert game.board is not board
+        assert not engine.thinking
+    finally:
+        engine.close()
@@ -0,0 +1,30 @@
+import random
+
+import pytest
+
+from base import EvaluateCtx
+from eveluate import EvaluateStrategy
+
+batch = pytest.importorskip('batch')
+
+
+def test_batch_evaluation_matches_calc_for(game):
+    rng = random.Random(13)
+    boards = []
+    for _ in range(30):
+        board = game.board
+        mover, other = game.other_player, game.computer_player
+        for _ in range(rng.randrange(40)):
+            moves = board.logic.get_legal_move_codes(mover)
+            if not moves or board.is_finished(other):
+                break
+            board = board.make_move_code(rng.choice(moves), mover)
+            mover, other = other, mover
+        boards.append(board)
+
+    planes = batch.planes_from_boards(boards)
+    for player in (game.computer_player, game.other_player):
+        for mover in (game.computer_player, game.other_player):
+            ctx = EvaluateCtx(next_step_player=mover, other_player=game.other_player)
+            expected = [EvaluateStrategy(board.logic).calc_for(player, ctx) for board in boards]
+            assert batch.evaluate_batch(planes, player, ctx).tolist() == expected
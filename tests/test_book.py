@@ -0,0 +1,37 @@
+from bitboard import mirror_bitboards, mirror_move
+from board import Board
+from book import OpeningBook, book_key, open_book
+
+
+def test_mirrored_position_gets_mirrored_book_move(game, tmp_path):
+    user, computer = game.other_player, game.computer_player
+    # несимметричная позиция после хода пользователя крайним конём
+    board = game.board.make_move_code(game.board.logic.get_legal_move_codes(user)[0], user)
+    mirror = Board(None, board.players, bitboards=mirror_bitboards(board.bitboards))
+    assert board.hash != mirror.hash
+
+    # запись - как при генерации: ход в ориентации ключа
+    move = game.board.logic.get_legal_move_codes(computer)[-1]
+    key, mirrored = book_key(board, computer)
+    assert book_key(mirror, computer) == (key, not mirrored)
+    path = str(tmp_path / 'book.bin')
+    OpeningBook.write(path, {key: mirror_move(move) if mirrored else move}, depth=1)
+
+    book = OpeningBook(path)
+    try:
+        assert len(book) == 1
+        assert book.get_move(board, computer).packed == move
+        assert book.get_move(mirror, computer).packed == mirror_move(move)
+        # позиция не из книги
+        assert book.get_move(game.board, computer) is None
+    finally:
+        book.close()
+
+
+def test_book_created_after_first_probe_is_opened(tmp_path):
+    path = str(tmp_path / 'book.bin')
+    assert open_book(path) is None
+    OpeningBook.write(path, {1: 2}, depth=1)
+    book = open_book(path)
+    assert book is not None and book.probe(1) == 2
+    assert open_book(path) is book
@@ -0,0 +1,24 @@
+import io
+
+from engine import HeadlessEngine, serve
+
+
+def run_commands(*commands: str) -> list:
+    engine = HeadlessEngine(book_path=None)
+    out = io.StringIO()
+    serve(engine, io.StringIO(''.join(command + '\n' for command in commands)), out)
+    return out.getvalue().splitlines()
+
+
+def test_go_depth_above_max_is_rejected():
+    # глубина хранится в таблице транспозиций байтом со знаком - большая глубина роняла движок
+    answer = run_commands('position startpos moves 7253', 'go depth 200', 'analyze depth 200', 'isready')
+    assert answer[0].startswith('error depth must be')
+    assert answer[1].startswith('error depth must be')
+    assert answer[2] == 'readyok'
+
+
+def test_go_depth():
+    answer = run_commands('position startpos moves 7253', 'go depth 2')
+    assert answer[0].startswith('info depth 2')
+    assert answer[1].startswith('bestmove ')
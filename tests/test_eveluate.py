@@ -0,0 +1,47 @@
+import random
+
+from base import EvaluateCtx
+from eveluate import EvaluateStrategy
+from zobrist import mirror_zobrist_hash, zobrist_hash
+
+
+def full_scores(board, players) -> list:
+    """Оценки полным пересчётом за обоих игроков при обоих очерёдностях хода"""
+    return [
+        EvaluateStrategy(board.logic).calc_for(player, EvaluateCtx(next_step_player=mover, other_player=players[1]))
+        for player in players for mover in players
+    ]
+
+
+def incremental_scores(board, players) -> list:
+    return [
+        board.evaluate(player, EvaluateCtx(next_step_player=mover, other_player=players[1]))
+        for player in players for mover in players
+    ]
+
+
+def test_incremental_evaluation_matches_full_after_apply_and_undo(game):
+    players = (game.computer_player, game.other_player)
+    rng = random.Random(11)
+    for _ in range(20):
+        board = game.board.copy()
+        board.start_incremental_evaluation()
+        history = [(incremental_scores(board, players), board.hash, board.mirror_hash)]
+        mover, other = game.other_player, game.computer_player
+        while not board.is_finished(other):
+            moves = board.logic.get_legal_move_codes(mover)
+            if not moves:
+                break
+            board.apply_code(rng.choice(moves), mover)
+            assert incremental_scores(board, players) == full_scores(board, players)
+            assert (board.hash, board.mirror_hash) == (zobrist_hash(board.bitboards),
+                                                       mirror_zobrist_hash(board.bitboards))
+            history.append((incremental_scores(board, players), board.hash, board.mirror_hash))
+            mover, other = other, mover
+
+        # undo возвращает и оценку, и хеши каждой пройденной позиции
+        history.pop()
+        while history:
+            board.undo()
+            assert (incremental_scores(board, players), board.hash, board.mirror_hash) == history.pop()
+        assert board.bitboards == game.board.bitboards
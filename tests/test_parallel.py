@@ -0,0 +1,16 @@
+from search import AlphaBetaSearch
+
+
+def test_parallel_search_matches_serial_and_closes_with_game(game):
+    game.PARALLEL_WORKERS = 2
+    game.board = game.board.make_move_code(game.board.logic.get_legal_move_codes(game.other_player)[0],
+                                           game.other_player)
+
+    move = game.get_best_move(depth=3, player=game.computer_player, other_player=game.other_player)
+    serial = AlphaBetaSearch(game.computer_player, game.other_player).get_best_move(game.board, 3)
+    assert move.packed == serial.packed
+    stats = game.parallel_search.stats
+    assert stats.utilization > 0 and stats.nodes > 0
+
+    game.close()
+    assert game.parallel_search is None
@@ -0,0 +1,42 @@
+import random
+
+from base import Color, Player
+from bitboard import KNIGHT_TARGETS, iter_squares
+from board import Board, BLACK_TOP_POSITIONS
+
+
+def random_boards(count: int, seed: int = 1):
+    white = Player(color=Color.WHITE, home_line=7, is_computer=False)
+    black = Player(color=Color.BLACK, home_line=0, is_computer=True)
+    rng = random.Random(seed)
+    for _ in range(count):
+        board = Board(BLACK_TOP_POSITIONS, {Color.WHITE.value: white, Color.BLACK.value: black})
+        player, other = white, black
+        for _ in range(rng.randint(0, 20)):
+            moves = board.logic.get_legal_move_codes(player)
+            if not moves:
+                break
+            board = board.make_move_code(rng.choice(moves), player)
+            player, other = other, player
+        yield board, player, other
+
+
+def test_capture_targets_and_safe_squares():
+    for board, player, other in random_boards(200):
+        logic = board.logic
+        own = board.bitboards[player.color.value]
+        opponent = board.bitboards[other.color.value]
+        targets = {t for sq in iter_squares(own) for t in KNIGHT_TARGETS[sq] if opponent >> t & 1}
+        assert set(iter_squares(logic.get_capture_targets(player))) == targets
+        attacked = {t for sq in iter_squares(opponent) for t in KNIGHT_TARGETS[sq]}
+        assert {sq for sq in range(64) if not logic.is_square_safe(player, sq)} == attacked
+
+
+def test_captures_use_capture_targets():
+    for board, player, other in random_boards(200, seed=2):
+        opponent = board.bitboards[other.color.value]
+        expected = sorted(
+            sq | t << 6 | 1 << 12
+            for sq in iter_squares(board.bitboards[player.color.value]) for t in KNIGHT_TARGETS[sq] if opponent >> t & 1
+        )
+        assert sorted(board.logic.iter_captures(player)) == expected
@@ -0,0 +1,9 @@
+def test_console_move_off_the_board_is_rejected(game, monkeypatch, capsys):
+    legal_moves = game.board.logic.get_legal_moves(game.other_player)
+    legal = next(move for move in legal_moves if move.notation == '7062')
+    # клетка (6, 8) упаковывается как (7, 0) - ход совпал бы с возможным ходом 70 62
+    answers = iter(['68 62', '70 62'])
+    monkeypatch.setattr('builtins.input', lambda prompt: next(answers))
+    move = game.get_move_from_player(game.other_player, legal_moves)
+    assert move.notation == legal.notation
+    assert 'Ход невозможен' in capsys.readouterr().out
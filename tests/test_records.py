@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+from base import Move
+from bitboard import MOVE_SQUARES_MASK, square_position
+from process import GameProcess
+from records import CHUNK_HEADER, GameRecord, GameRecordWriter, MoveStats, append_games, iter_games, replay
+
+
+def random_record(game: GameProcess, rng: random.Random) -> GameRecord:
+    """Случайная партия до конца от начальной позиции игры, у ходов компьютера - статистика"""
+    board = game.board
+    record = GameRecord(bitboards=dict(board.bitboards), first_color=game.other_player.color)
+    mover, other = game.other_player, game.computer_player
+    while not board.is_finished(other):
+        code = rng.choice(board.logic.get_legal_move_codes(mover))
+        board = board.make_move_code(code, mover)
+        record.add_move(code, MoveStats(depth=3, nodes=rng.randrange(1000), time=0.25) if mover.is_computer else None)
+        if board.is_finished(mover):
+            record.winner = mover.color
+            break
+        mover, other = other, mover
+    return record
+
+
+def test_user_and_computer_captures_are_recorded_with_capture_flag(game):
+    rng = random.Random(3)
+    # случайная партия, пока у пользователя не появится рубка
+    mover = game.other_player
+    while not game.board.logic.get_capture_moves(game.other_player) or mover is not game.other_player:
+        game.board = game.board.make_move_code(rng.choice(game.board.logic.get_legal_move_codes(mover)), mover)
+        mover = game.computer_player if mover is game.other_player else game.other_player
+    game.game_record = GameRecord(bitboards=dict(game.board.bitboards), first_color=game.other_player.color)
+
+    capture = game.board.logic.get_capture_moves(game.other_player)[0]
+    game.click_to_tile(square_position(capture & 63))
+    game.click_to_tile(square_position(capture >> 6 & 63))
+    assert game.game_record.moves == [capture]
+
+    # ход компьютера без флага рубки (как из дебютной книги) записывается по доске
+    code = next(iter(game.board.logic.get_legal_move_codes(game.computer_player)))
+    game.apply_computer_move(Move.from_packed(game.computer_player, code & MOVE_SQUARES_MASK))
+    assert game.game_record.moves[1] == code
+
+
+def test_games_round_trip_and_damaged_chunks(game, tmp_path):
+    rng = random.Random(5)
+    records = [random_record(game, rng) for _ in range(5)]
+    path = str(tmp_path / 'games.bin')
+    with GameRecordWriter(path, chunk_games=2) as writer:
+        for record in records:
+            writer.write(record)
+    assert list(iter_games(path)) == records
+    for record in records:
+        # ходы повторяются на доске, последний ход выигрывает
+        *_, (board, player, move) = replay(record)
+        assert board.make_move(move).is_finished(player) == (record.winner is not None)
+
+    # оборванный на записи последний блок пропускается
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:-1])
+    assert list(iter_games(path)) == records[:4]
+
+    # повреждённый блок - ошибка, а не мусорные партии
+    with open(path, 'wb') as f:
+        f.write(data[:CHUNK_HEADER.size] + bytes([data[CHUNK_HEADER.size] ^ 1]) + data[CHUNK_HEADER.size + 1:])
+    with pytest.raises(ValueError):
+        list(iter_games(path))
+
+
+def test_torn_chunk_is_cut_off_by_the_next_append(game, tmp_path):
+    rng = random.Random(7)
+    records = [random_record(game, rng) for _ in range(3)]
+    path = str(tmp_path / 'games.bin')
+    append_games(path, records[:1])
+    append_games(path, records[1:2])
+    # процесс упал, дописав блок не до конца
+    with open(path, 'rb+') as f:
+        f.truncate(f.seek(0, 2) - 3)
+    append_games(path, records[2:])
+    assert list(iter_games(path)) == [records[0], records[2]]
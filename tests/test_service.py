@@ -0,0 +1,75 @@
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from service import EngineService
+
+
+@pytest.fixture
+def service():
+    service = EngineService(workers=1)
+    yield service
+    service.close()
+
+
+def request(service: EngineService, **fields) -> dict:
+    return asyncio.run(service.handle(fields))
+
+
+def test_player_is_white_must_be_boolean(service):
+    assert request(service, op='new', player_is_white='false', id=1) == {
+        'error': 'player_is_white must be true or false', 'id': 1}
+    session = request(service, op='new', player_is_white=False)['session']
+    assert service.sessions[session].game.other_player.color.value == 'B'
+
+
+def test_depth_above_max_is_rejected(service):
+    session = request(service, op='new')['session']
+    assert request(service, op='go', session=session, depth=200)['error'].startswith('depth must be')
+
+
+def test_unexpected_error_is_answered(service, monkeypatch):
+    async def broken(request):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(service, '_dispatch', broken)
+    response = request(service, op='metrics', id=7)
+    assert response['id'] == 7 and 'boom' in response['error']
+
+
+def test_search_past_deadline_does_not_hold_the_next_request(service):
+    async def scenario():
+        session = (await service.handle({'op': 'new'}))['session']
+        await service.handle({'op': 'position', 'session': session, 'position': 'startpos moves 7253'})
+        # процесс пула уже запущен - дальше считается только время поиска
+        assert 'bestmove' in await service.handle({'op': 'go', 'session': session, 'depth': 1})
+
+        slow = await service.handle({'op': 'go', 'session': session, 'depth': 14, 'deadline_ms': 300})
+        assert slow.get('error') == 'deadline' or slow['depth'] < 14
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        fast = await service.handle({'op': 'go', 'session': session, 'depth': 1, 'deadline_ms': 2000})
+        return fast, loop.time() - started
+
+    fast, seconds = asyncio.run(scenario())
+    assert fast['bestmove'] is not None and fast['depth'] == 1
+    assert seconds < 1
+
+
+def test_broken_pool_is_recreated(service):
+    class BrokenExecutor:
+        def submit(self, *args):
+            raise BrokenProcessPool('worker died')
+
+        def shutdown(self, **kwargs):
+            pass
+
+    async def scenario():
+        session = (await service.handle({'op': 'new'}))['session']
+        service._executor.shutdown()
+        service._executor = BrokenExecutor()
+        return [await service.handle({'op': 'go', 'session': session, 'depth': 1}) for _ in range(2)]
+
+    for response in asyncio.run(scenario()):
+        assert response['bestmove'] is not None
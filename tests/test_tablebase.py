@@ -0,0 +1,74 @@
+import random
+from functools import lru_cache
+
+import pytest
+
+import tablebase
+from base import Color, Player
+from board import Board
+
+WHITE = Player(Color.WHITE, 7, False)
+BLACK = Player(Color.BLACK, 0, True)
+PLAYERS = {Color.WHITE.value: WHITE, Color.BLACK.value: BLACK}
+
+
+@pytest.fixture(scope='module')
+def table(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('tablebase'))
+    tablebase.generate(directory, 3, workers=1)
+    table = tablebase.Tablebase.open(directory)
+    yield table
+    table.close()
+
+
+@lru_cache(maxsize=None)
+def brute_force(white: int, black: int, color: str) -> int:
+    """Расстояние до конца игры полным перебором, как в таблице"""
+    board = Board(None, PLAYERS, bitboards={'W': white, 'B': black})
+    player = PLAYERS[color]
+    opponent = PLAYERS[player.opponent_color.value]
+    best = None
+    for code in board.logic.get_legal_move_codes(player):
+        child = board.make_move_code(code, player)
+        if child.is_finished(player):
+            value = 1
+        else:
+            child_value = brute_force(child.bitboards['W'], child.bitboards['B'], opponent.color.value)
+            value = 1 - child_value if child_value <= 0 else -child_value - 1
+        # быстрее выиграть, дольше проигрывать
+        if best is None or (value > 0 and (best <= 0 or value < best)) or (value <= 0 and best <= 0 and value < best):
+            best = value
+    return 0 if best is None else best
+
+
+def test_three_knights_match_brute_force(table):
+    assert table.max_pieces == 3
+    rng = random.Random(1)
+    checked = 0
+    while checked < 500:
+        squares = rng.sample(range(64), rng.randint(1, 3))
+        split = rng.randint(0, len(squares))
+        white = sum(1 << sq for sq in squares[:split])
+        black = sum(1 << sq for sq in squares[split:])
+        player = rng.choice((WHITE, BLACK))
+        board = Board(None, PLAYERS, bitboards={'W': white, 'B': black})
+        if board.is_finished(WHITE) or board.is_finished(BLACK):
+            assert table.probe(board.bitboards, player) is None
+            continue
+        assert table.probe(board.bitboards, player) == brute_force(white, black, player.color.value)
+        checked += 1
+
+
+def test_more_knights_than_table_are_not_probed(table):
+    board = Board(None, PLAYERS, bitboards={'W': 0b11 << 8, 'B': 0b11 << 48})
+    assert table.probe(board.bitboards, WHITE) is None
+
+
+def test_layers_generated_after_first_open_are_picked_up(tmp_path):
+    directory = str(tmp_path)
+    assert tablebase.open_tablebase(directory) is None
+    tablebase.generate(directory, 1, workers=1)
+    table = tablebase.open_tablebase(directory)
+    assert table is not None and table.max_pieces == 1
+    tablebase.generate(directory, 2, workers=1)
+    assert tablebase.open_tablebase(directory).max_pieces == 2
@@ -0,0 +1,252 @@
+"""
+Турнир движка с самим собой: две настройки (оценка позиции и глубина) играют друг с другом без интерфейса.
+
+Запуск: python tournament.py [--games 1000] [--strategy-a eveluate.EvaluateStrategy] [--depth-a 3]
+                             [--strategy-b ...] [--depth-b 3] [--random-plies 4] [--workers N] [--seed 1]
+                             [--record games.bin]
+
+Оценка - путь к классу-наследнику EvaluateStrategy (модуль.Класс), например с другими весами показателей.
+Каждое начало (random-plies случайных ходов от начальной позиции) играется дважды - белыми то A, то B,
+поэтому преимущество цвета и начала делится между настройками поровну. Белые начинают снизу и ходят первыми.
+Игры идут в пуле процессов (spawn). У каждой стороны в каждой игре своя таблица транспозиций: результат игры
+зависит только от начала, а не от того, какой процесс и после какой игры её играл.
+
+В игре нет ничьих (ходов нет - проигрыш). В конце печатается JSON: победы, доля побед A с доверительным
+интервалом Уилсона (95%), разница в Elo, игр и позиций в секунду.
+С --record FILE все партии со статистикой поиска каждого хода дописываются в FILE (см. records.py).
+"""
+
+import argparse
+import importlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Type
+
+from base import Color, Player
+from board import Board, BLACK_TOP_POSITIONS
+from eveluate import EvaluateStrategy
+from records import GameRecord, GameRecordWriter, MoveStats
+from search import AlphaBetaSearch
+from transposition import TranspositionTable
+
+
+@dataclass
+class EngineSettings:
+    """Настройки одного участника"""
+    strategy: str = 'eveluate.EvaluateStrategy'
+    """Класс оценки позиции: модуль.Класс"""
+    depth: int = 3
+
+    @property
+    def label(self) -> str:
+        return f'{self.strategy}@{self.depth}'
+
+
+@dataclass
+class GameTask:
+    a: EngineSettings
+    b: EngineSettings
+    a_is_white: bool
+    opening_seed: int
+    random_plies: int
+    tt_memory_bytes: int
+
+
+@dataclass
+class GameResult:
+    a_is_white: bool
+    a_won: bool
+    plies: int
+    nodes: int
+    """Позиций в поиске обеих сторон"""
+    record: Optional[GameRecord]
+
+
+def load_strategy(path: str) -> Type[EvaluateStrategy]:
+    """Класс оценки по пути модуль.Класс"""
+    module_name, _, class_name = path.rpartition('.')
+    strategy_cls = getattr(importlib.import_module(module_name), class_name, None) if module_name else None
+    if not (isinstance(strategy_cls, type) and issubclass(strategy_cls, EvaluateStrategy)):
+        raise ValueError(f'{path} - не наследник EvaluateStrategy')
+    return strategy_cls
+
+
+class Engine:
+    """Одна сторона игры: поиск хода с её оценкой, глубиной и таблицей транспозиций"""
+
+    def __init__(self, settings: EngineSettings, color: Color, home_line: int, tt_memory_bytes: int):
+        self.depth = settings.depth
+        self.strategy_cls = load_strategy(settings.strategy)
+        # оценка считается для "компьютера" - в своих поисках компьютер эта сторона
+        self.player = Player(color=color, home_line=home_line, is_computer=True)
+        self.other_player = Player(color=self.player.opponent_color, home_line=7 - home_line, is_computer=False)
+        self.players = {color.value: self.player, self.other_player.color.value: self.other_player}
+        self.transposition_table = TranspositionTable(tt_memory_bytes) if tt_memory_bytes else None
+        self.nodes = 0
+
+    def get_move(self, board: Board) -> Tuple[int, MoveStats]:
+        search = AlphaBetaSearch(self.player, self.other_player, transposition_table=self.transposition_table,
+                                 evaluate_strategy_cls=self.strategy_cls)
+        own_board = Board(None, self.players, bitboards=board.bitboards, zobrist=board.hash,
+                          mirror_zobrist=board.mirror_hash)
+        move = search.get_best_move(own_board, self.depth)
+        self.nodes += search.nodes
+        return move.packed, MoveStats.from_search_stats(search.get_stats(move))
+
+
+def play_game(task: GameTask) -> GameResult:
+    """Сыграть одну игру (выполняется в процессе пула)"""
+    white = Player(color=Color.WHITE, home_line=7, is_computer=False)
+    black = Player(color=Color.BLACK, home_line=0, is_computer=False)
+    board = Board(BLACK_TOP_POSITIONS, {Color.WHITE.value: white, Color.BLACK.value: black})
+    white_settings, black_settings = (task.a, task.b) if task.a_is_white else (task.b, task.a)
+    engines = {
+        Color.WHITE: Engine(white_settings, Color.WHITE, white.home_line, task.tt_memory_bytes),
+        Color.BLACK: Engine(black_settings, Color.BLACK, black.home_line, task.tt_memory_bytes),
+    }
+    rng = random.Random(task.opening_seed)
+    record = GameRecord(bitboards=dict(board.bitboards), white_home_line=white.home_line, first_color=Color.WHITE)
+
+    player, other_player = white, black
+    plies = 0
+    while True:
+        if board.is_finished(other_player):
+            winner = other_player
+            break
+        moves = board.logic.get_legal_move_codes(player)
+        if not moves:  # ходов нет - проигрыш
+            winner = other_player
+            break
+        if plies < task.random_plies:
+            move, move_stats = rng.choice(moves), None
+        else:
+            move, move_stats = engines[player.color].get_move(board)
+        record.add_move(move, move_stats)
+        board = board.make_move_code(move, player)
+        plies += 1
+        player, other_player = other_player, player
+
+    record.winner = winner.color
+    return GameResult(
+        a_is_white=task.a_is_white,
+        a_won=(winner is white) == task.a_is_white,
+        plies=plies,
+        nodes=sum(engine.nodes for engine in engines.values()),
+        record=record,
+    )
+
+
+def wilson_interval(wins: int, games: int, z: float = 1.96) -> Tuple[float, float]:
+    """Доверительный интервал доли побед (Уилсон, z=1.96 - 95%)"""
+    if not games:
+        return 0.0, 1.0
+    p = wins / games
+    denominator = 1 + z * z / games
+    centre = (p + z * z / (2 * games)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / denominator
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def elo_difference(score: float) -> Optional[float]:
+    """Разница в Elo по доле побед (None - все игры выиграла одна сторона)"""
+    if score <= 0 or score >= 1:
+        return None
+    return -400 * math.log10(1 / score - 1)
+
+
+def summarize(a: EngineSettings, b: EngineSettings, results: List[GameResult], seconds: float) -> dict:
+    games = len(results)
+    wins_a = sum(result.a_won for result in results)
+    low, high = wilson_interval(wins_a, games)
+    by_color: Dict[str, dict] = {}
+    for name, a_is_white in (('a_white', True), ('a_black', False)):
+        subset = [result for result in results if result.a_is_white == a_is_white]
+        by_color[name] = {'games': len(subset), 'wins_a': sum(result.a_won for result in subset)}
+    nodes = sum(result.nodes for result in results)
+    return {
+        'a': a.label,
+        'b': b.label,
+        'games': games,
+        'wins_a': wins_a,
+        'wins_b': games - wins_a,
+        'score_a': wins_a / games if games else 0.0,
+        'score_a_95': [low, high],
+        'elo_a': elo_difference(wins_a / games) if games else None,
+        'elo_a_95': [elo_difference(low), elo_difference(high)],
+        'white_wins': sum(result.a_won == result.a_is_white for result in results),
+        **by_color,
+        'avg_plies': sum(result.plies for result in results) / games if games else 0.0,
+        'seconds': seconds,
+        'games_per_s': games / seconds if seconds else 0.0,
+        'nodes_per_s': nodes / seconds if seconds else 0.0,
+    }
+
+
+def run(a: EngineSettings, b: EngineSettings, games: int, random_plies: int = 4, seed: int = 1,
+        workers: Optional[int] = None, tt_memory_bytes: int = 4 * 1024 * 1024,
+        record_path: Optional[str] = None) -> dict:
+    """Сыграть games игр (парами с одним началом) и вернуть сводку. record_path - куда дописать партии"""
+    # ошибку в пути к оценке лучше увидеть сразу, а не из процесса пула
+    load_strategy(a.strategy)
+    load_strategy(b.strategy)
+    tasks = [
+        GameTask(a, b, a_is_white=game % 2 == 0, opening_seed=seed * 1000003 + game // 2,
+                 random_plies=random_plies, tt_memory_bytes=tt_memory_bytes)
+        for game in range(games)
+    ]
+    results: List[GameResult] = []
+    writer = GameRecordWriter(record_path) if record_path else None
+    started = time.perf_counter()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=context) as executor:
+        for result in executor.map(play_game, tasks):
+            if writer is not None:
+                writer.write(result.record)
+            # партия уже записана - в сводке она не нужна
+            result.record = None
+            results.append(result)
+            if len(results) % 100 == 0:
+                elapsed = time.perf_counter() - started
+                print(f'{len(results)}/{games} игр, A {sum(r.a_won for r in results)}, '
+                      f'{len(results) / elapsed:.1f} игр/с', file=sys.stderr)
+    if writer is not None:
+        writer.close()
+    return summarize(a, b, results, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Турнир двух настроек движка')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--strategy-a', default=EngineSettings.strategy)
+    parser.add_argument('--depth-a', type=int, default=EngineSettings.depth)
+    parser.add_argument('--strategy-b', default=EngineSettings.strategy)
+    parser.add_argument('--depth-b', type=int, default=EngineSettings.depth)
+    parser.add_argument('--random-plies', type=int, default=4, help='случайных ходов в начале каждой игры')
+    parser.add_argument('--hash', type=int, default=4, help='память под таблицу транспозиций каждой стороны, МБ')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--record', default=None, help='дописать партии в файл (см. records.py)')
+    args = parser.parse_args()
+
+    summary = run(
+        EngineSettings(args.strategy_a, args.depth_a),
+        EngineSettings(args.strategy_b, args.depth_b),
+        games=args.games,
+        random_plies=args.random_plies,
+        seed=args.seed,
+        workers=args.workers,
+        tt_memory_bytes=args.hash * 1024 * 1024,
+        record_path=args.record,
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
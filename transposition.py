@@ -0,0 +1,101 @@
+from array import array
+from typing import Dict, NamedTuple, Optional
+
+EXACT = 0
+"""Точная оценка"""
+LOWER = 1
+"""Оценка не меньше сохранённой (было отсечение по beta)"""
+UPPER = 2
+"""Оценка не больше сохранённой (ни один ход не поднял alpha)"""
+
+
+class TTEntry(NamedTuple):
+    depth: int
+    score: float
+    bound: int
+    move: int
+    """Лучший ход: откуда | куда << 6 (0 - хода нет)"""
+
+
+class TranspositionTable:
+    """
+    Таблица транспозиций фиксированного размера.
+
+    Хранится в плоских массивах array (ключ, глубина, оценка, тип границы, лучший ход, поколение),
+    поэтому занимаемая память определяется только количеством записей и не растёт по ходу игры.
+    Замещение: пустая ячейка, запись из прошлого поиска или запись не глубже новой.
+    """
+    ENTRY_SIZE = 8 + 1 + 8 + 1 + 2 + 1
+    """Байт на запись (ключ Q, глубина b, оценка d, граница b, ход H, поколение B)"""
+
+    def __init__(self, memory_bytes: int = 16 * 1024 * 1024):
+        self.size = max(1, memory_bytes // self.ENTRY_SIZE)
+        self.keys = array('Q', bytes(8 * self.size))
+        self.depths = array('b', bytes(self.size))
+        self.scores = array('d', bytes(8 * self.size))
+        self.bounds = array('b', bytes(self.size))
+        self.moves = array('H', bytes(2 * self.size))
+        self.generations = array('B', bytes(self.size))
+        self.generation = 1
+        """Номер поиска (0 в generations - пустая ячейка)"""
+
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+        self.filled = 0
+
+    def new_search(self):
+        """Начало нового поиска - записи прошлых поисков становятся кандидатами на замещение"""
+        self.generation = self.generation % 255 + 1
+
+    def probe(self, key: int) -> Optional[TTEntry]:
+        self.probes += 1
+        index = key % self.size
+        if self.generations[index] and self.keys[index] == key:
+            self.hits += 1
+            return TTEntry(self.depths[index], self.scores[index], self.bounds[index], self.moves[index])
+        return None
+
+    def store(self, key: int, depth: int, score: float, bound: int, move: int = 0):
+        index = key % self.size
+        generation = self.generations[index]
+        if generation:
+            if generation == self.generation and self.depths[index] > depth:
+                return  # более глубокая запись текущего поиска ценнее
+            if self.keys[index] != key:
+                self.overwrites += 1
+            elif not move:
+                move = self.moves[index]  # лучший ход позиции сохраняем, даже если новый поиск его не нашёл
+        else:
+            self.filled += 1
+        self.stores += 1
+        self.keys[index] = key
+        self.depths[index] = depth
+        self.scores[index] = score
+        self.bounds[index] = bound
+        self.moves[index] = move
+        self.generations[index] = self.generation
+
+    @property
+    def memory_bytes(self) -> int:
+        """Память под записи таблицы"""
+        return sum(a.itemsize * len(a) for a in (self.keys, self.depths, self.scores, self.bounds, self.moves, self.generations))
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.probes if self.probes else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        """Статистика для подбора размера таблицы"""
+        return {
+            'size': self.size,
+            'filled': self.filled,
+            'fill_rate': self.filled / self.size,
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hit_rate,
+            'stores': self.stores,
+            'overwrites': self.overwrites,
+            'memory_bytes': self.memory_bytes,
+        }
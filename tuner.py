@@ -0,0 +1,320 @@
+"""
+Подбор весов оценки позиции по записанным партиям (метод Texel).
+
+Оценка EvaluateStrategy линейна по весам показателей: очки за всех коней (TotalCountEvaluateIndex.SCORE),
+за коня на домашней линии по колонкам (HomeTotalCountEvaluateIndex.score_column_map), за каждую возможную рубку
+(DangerPositionsEvaluateIndex.DANGER_SCORE) и за коня по расстоянию до финиша
+(FinishTotalCountEvaluateIndex.SCORE_LINE_MAP). Поэтому позиция - строка из FEATURES признаков,
+а её оценка - скалярное произведение признаков и весов.
+
+1. extract: позиции партий (records.py) -> файл признаков. Партии читаются потоком, признаки считаются пакетами
+   по EXTRACT_BATCH позиций на NumPy и дописываются в файл - в памяти один пакет при любом размере корпуса.
+   Каждая позиция даёт две строки: за ходящего и за его соперника (оценка считается для "компьютера",
+   компьютером по очереди становится каждая сторона). Метка - победил ли тот, за кого строка.
+   Недоигранные партии пропускаются.
+2. fit: сначала подбирается K - масштаб, при котором sigmoid(K * оценка) при исходных весах лучше всего
+   предсказывает метку, затем веса - пакетным градиентным спуском (Adam) по средней квадратичной ошибке.
+   Файл признаков читается через np.memmap пакетами по --batch строк, порядок пакетов каждую эпоху свой.
+   Результат - модуль Python с наследниками показателей и EvaluateStrategy, веса в атрибутах классов:
+       python tournament.py --strategy-a tuned_strategy.TunedEvaluateStrategy
+       Board.evaluate_strategy_cls = TunedEvaluateStrategy
+   Веса колонок, несимметричные относительно центра, выключают склейку зеркальных позиций в поиске
+   (EvaluateStrategy.is_mirror_symmetric). С --symmetric веса колонок c и 7 - c подбираются одинаковыми.
+
+Запуск: python tuner.py extract games.bin [games2.bin ...] --out features.bin [--skip-plies 0]
+        python tuner.py fit features.bin --out tuned_strategy.py [--start eveluate.EvaluateStrategy]
+                            [--epochs 50] [--batch 65536] [--lr 1.0] [--symmetric] [--seed 1]
+
+Нужен numpy (pip install numpy).
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Iterator, List, Optional, Tuple, Type
+
+import numpy as np
+
+from batch import knight_matrix, unpack_bitboards
+from bitboard import flip_bitboard
+from eveluate import (
+    DangerPositionsEvaluateIndex, EvaluateStrategy, FinishTotalCountEvaluateIndex, HomeTotalCountEvaluateIndex,
+    TotalCountEvaluateIndex,
+)
+from records import iter_games, replay
+from tournament import load_strategy
+
+# Строка файла признаков - FEATURES чисел int8 и метка
+COUNT = 0
+"""Количество своих коней"""
+HOME = slice(1, 9)
+"""Свои кони на домашней линии, по колонкам"""
+DANGER = 9
+"""Возможные рубки: со знаком плюс, если следующий ход свой"""
+FINISH = slice(10, 18)
+"""По расстоянию до финиша: свои кони минус кони соперника"""
+FEATURES = 18
+LABEL = FEATURES
+ROW = FEATURES + 1
+
+EXTRACT_BATCH = 65536
+INDEX_TYPES = (TotalCountEvaluateIndex, HomeTotalCountEvaluateIndex, DangerPositionsEvaluateIndex,
+               FinishTotalCountEvaluateIndex)
+
+Side = Tuple[int, int, int, int]
+"""Свои кони, кони соперника (битовые доски, своя домашняя линия - 0), знак рубок, метка"""
+
+
+def strategy_indexes(strategy_cls: Type[EvaluateStrategy]) -> list:
+    """Показатели оценки в порядке INDEX_TYPES (веса других показателей не подбираются)"""
+    indexes = []
+    for index_type in INDEX_TYPES:
+        index_cls = next((cls for cls in strategy_cls.INDEXES if issubclass(cls, index_type)), None)
+        if index_cls is None:
+            raise ValueError(f'{strategy_cls.__name__}: нет показателя {index_type.__name__}')
+        indexes.append(index_cls)
+    if len(indexes) != len(strategy_cls.INDEXES):
+        raise ValueError(f'{strategy_cls.__name__}: веса подбираются только для {len(INDEX_TYPES)} показателей')
+    return indexes
+
+
+def strategy_weights(strategy_cls: Type[EvaluateStrategy]) -> np.ndarray:
+    total, home, danger, finish = strategy_indexes(strategy_cls)
+    weights = np.zeros(FEATURES)
+    weights[COUNT] = total.SCORE / total.max
+    weights[HOME] = [home.score_column_map.get(column, 0) for column in range(8)]
+    weights[DANGER] = danger.DANGER_SCORE
+    weights[FINISH] = [finish.SCORE_LINE_MAP.get(distance, 0) for distance in range(8)]
+    return weights
+
+
+def iter_sides(paths: List[str], skip_plies: int = 0) -> Iterator[Side]:
+    """Позиции доигранных партий - по две строки на позицию"""
+    for path in paths:
+        for record in iter_games(path):
+            if record.winner is None:
+                continue
+            players = record.players()
+            for ply, (board, player, move) in enumerate(replay(record)):
+                if ply < skip_plies:
+                    continue
+                opponent = players[player.opponent_color.value]
+                won = int(record.winner == player.color)
+                for side, other, sign, label in ((player, opponent, 1, won), (opponent, player, -1, 1 - won)):
+                    own = board.bitboards[side.color.value]
+                    theirs = board.bitboards[other.color.value]
+                    if side.home_line != 0:
+                        own, theirs = flip_bitboard(own), flip_bitboard(theirs)
+                    yield own, theirs, sign, label
+
+
+def features(sides: List[Side]) -> np.ndarray:
+    """Строки файла признаков (позиции, ROW) int8"""
+    own_masks, their_masks, signs, labels = zip(*sides)
+    own = unpack_bitboards(own_masks)
+    theirs = unpack_bitboards(their_masks)
+    rows = np.empty((len(sides), ROW), dtype=np.int8)
+    rows[:, COUNT] = own.sum(axis=1)
+    rows[:, HOME] = own[:, :8]
+    rows[:, DANGER] = ((own @ knight_matrix()) * theirs).sum(axis=1) * np.asarray(signs)
+    # свои идут к линии 7 (расстояние d - линия 7 - d), соперник - к линии 0
+    own_lines = own.reshape(-1, 8, 8).sum(axis=2)
+    their_lines = theirs.reshape(-1, 8, 8).sum(axis=2)
+    rows[:, FINISH] = own_lines[:, ::-1] - their_lines
+    rows[:, LABEL] = labels
+    return rows
+
+
+def extract(paths: List[str], out: str, skip_plies: int = 0) -> int:
+    """Записать признаки позиций партий в out, вернуть количество строк"""
+    total = 0
+    with open(out, 'wb') as f:
+        batch: List[Side] = []
+        for side in iter_sides(paths, skip_plies):
+            batch.append(side)
+            if len(batch) == EXTRACT_BATCH:
+                f.write(features(batch).tobytes())
+                total += len(batch)
+                batch = []
+        if batch:
+            f.write(features(batch).tobytes())
+            total += len(batch)
+    return total
+
+
+def open_features(path: str) -> np.ndarray:
+    rows = os.path.getsize(path) // ROW
+    if not rows:
+        raise ValueError(f'{path}: нет позиций')
+    return np.memmap(path, dtype=np.int8, mode='r', shape=(rows, ROW))
+
+
+def iter_batches(data: np.ndarray, batch: int,
+                 order: Optional[np.ndarray] = None) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Признаки (float64) и метки пакетами по batch строк"""
+    starts = range(0, len(data), batch)
+    for index in (order if order is not None else range(len(starts))):
+        rows = np.asarray(data[starts[index]:starts[index] + batch])
+        yield rows[:, :FEATURES].astype(np.float64), rows[:, LABEL].astype(np.float64)
+
+
+def sigmoid(x: np.ndarray) -> np.ndarray:
+    return 0.5 * (1 + np.tanh(0.5 * x))
+
+
+def mean_error(data: np.ndarray, weights: np.ndarray, k: float, batch: int) -> float:
+    """Средняя квадратичная ошибка предсказания результата по всем строкам"""
+    error = 0.0
+    for x, y in iter_batches(data, batch):
+        error += float(((sigmoid(k * (x @ weights)) - y) ** 2).sum())
+    return error / len(data)
+
+
+def fit_k(data: np.ndarray, weights: np.ndarray, batch: int, steps: int = 40) -> float:
+    """K с наименьшей ошибкой при данных весах (золотое сечение по log10 K)"""
+    low, high = -6.0, 0.0
+    ratio = (5 ** 0.5 - 1) / 2
+    a, b = high - ratio * (high - low), low + ratio * (high - low)
+    error_a, error_b = (mean_error(data, weights, 10 ** x, batch) for x in (a, b))
+    for _ in range(steps):
+        if error_a < error_b:
+            high, b, error_b = b, a, error_a
+            a = high - ratio * (high - low)
+            error_a = mean_error(data, weights, 10 ** a, batch)
+        else:
+            low, a, error_a = a, b, error_b
+            b = low + ratio * (high - low)
+            error_b = mean_error(data, weights, 10 ** b, batch)
+    return 10 ** ((low + high) / 2)
+
+
+def symmetrize(values: np.ndarray) -> np.ndarray:
+    """Веса колонок c и 7 - c - среднее из двух"""
+    values = values.copy()
+    values[HOME] = (values[HOME] + values[HOME][::-1]) / 2
+    return values
+
+
+def fit(data: np.ndarray, weights: np.ndarray, k: float, epochs: int = 50, batch: int = 65536, lr: float = 1.0,
+        symmetric: bool = False, seed: int = 1, log=None) -> np.ndarray:
+    """Веса с наименьшей ошибкой (Adam по пакетам)"""
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    weights = symmetrize(weights) if symmetric else weights.copy()
+    m = np.zeros(FEATURES)
+    v = np.zeros(FEATURES)
+    step = 0
+    rng = np.random.default_rng(seed)
+    batches = -(-len(data) // batch)
+    for epoch in range(epochs):
+        for x, y in iter_batches(data, batch, rng.permutation(batches)):
+            p = sigmoid(k * (x @ weights))
+            # d/dw mean((p - y)^2) = mean(2 (p - y) p (1 - p) k x)
+            gradient = (2 * k / len(y)) * (((p - y) * p * (1 - p)) @ x)
+            if symmetric:
+                gradient = symmetrize(gradient)
+            step += 1
+            m = beta1 * m + (1 - beta1) * gradient
+            v = beta2 * v + (1 - beta2) * gradient * gradient
+            weights -= lr * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + eps)
+        if log is not None:
+            log(epoch + 1, weights)
+    return weights
+
+
+def strategy_source(weights: np.ndarray, start: str, k: float, error_before: float, error_after: float,
+                    positions: int) -> str:
+    """Модуль Python с подобранными весами"""
+    weights = np.round(weights, 2)
+
+    def number(value: float) -> str:
+        return repr(float(value))
+
+    column_map = ', '.join(f'{column}: {number(value)}' for column, value in enumerate(weights[HOME]))
+    line_map = ', '.join(f'{distance}: {number(value)}' for distance, value in enumerate(weights[FINISH]))
+    return f'''"""
+Веса оценки, подобранные tuner.py по {positions} позициям (исходные - {start}).
+K = {k:.6g}, ошибка {error_before:.6f} -> {error_after:.6f}
+"""
+
+from eveluate import (
+    DangerPositionsEvaluateIndex, EvaluateStrategy, FinishTotalCountEvaluateIndex, HomeTotalCountEvaluateIndex,
+    TotalCountEvaluateIndex,
+)
+
+
+class TunedTotalCountEvaluateIndex(TotalCountEvaluateIndex):
+    SCORE = {number(weights[COUNT] * TotalCountEvaluateIndex.max)}
+
+
+class TunedHomeTotalCountEvaluateIndex(HomeTotalCountEvaluateIndex):
+    score_column_map = {{{column_map}}}
+
+
+class TunedDangerPositionsEvaluateIndex(DangerPositionsEvaluateIndex):
+    DANGER_SCORE = {number(weights[DANGER])}
+
+
+class TunedFinishTotalCountEvaluateIndex(FinishTotalCountEvaluateIndex):
+    SCORE_LINE_MAP = {{{line_map}}}
+
+
+class TunedEvaluateStrategy(EvaluateStrategy):
+    INDEXES = [
+        TunedTotalCountEvaluateIndex,
+        TunedHomeTotalCountEvaluateIndex,
+        TunedDangerPositionsEvaluateIndex,
+        TunedFinishTotalCountEvaluateIndex,
+    ]
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Подбор весов оценки позиции по партиям')
+    commands = parser.add_subparsers(dest='command', required=True)
+    extract_parser = commands.add_parser('extract', help='признаки позиций партий')
+    extract_parser.add_argument('games', nargs='+', help='файлы записей партий (records.py)')
+    extract_parser.add_argument('--out', required=True)
+    extract_parser.add_argument('--skip-plies', type=int, default=0, help='не брать первые ходы каждой партии')
+    fit_parser = commands.add_parser('fit', help='подобрать веса')
+    fit_parser.add_argument('features')
+    fit_parser.add_argument('--out', required=True, help='модуль Python с весами')
+    fit_parser.add_argument('--start', default='eveluate.EvaluateStrategy', help='исходные веса: модуль.Класс')
+    fit_parser.add_argument('--epochs', type=int, default=50)
+    fit_parser.add_argument('--batch', type=int, default=65536)
+    fit_parser.add_argument('--lr', type=float, default=1.0)
+    fit_parser.add_argument('--symmetric', action='store_true', help='одинаковые веса колонок c и 7 - c')
+    fit_parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == 'extract':
+        rows = extract(args.games, args.out, args.skip_plies)
+        print(json.dumps({'rows': rows, 'out': args.out}))
+        return
+
+    data = open_features(args.features)
+    start = strategy_weights(load_strategy(args.start))
+    k = fit_k(data, start, args.batch)
+    error_before = mean_error(data, start, k, args.batch)
+    print(f'{len(data)} строк, K = {k:.6g}, ошибка {error_before:.6f}', file=sys.stderr)
+
+    def log(epoch: int, weights: np.ndarray):
+        print(f'эпоха {epoch}: ошибка {mean_error(data, weights, k, args.batch):.6f}', file=sys.stderr)
+
+    weights = fit(data, start, k, epochs=args.epochs, batch=args.batch, lr=args.lr, symmetric=args.symmetric,
+                  seed=args.seed, log=log)
+    error_after = mean_error(data, np.round(weights, 2), k, args.batch)
+    with open(args.out, 'w') as f:
+        f.write(strategy_source(weights, args.start, k, error_before, error_after, len(data)))
+    print(json.dumps({
+        'rows': len(data),
+        'k': k,
+        'error_before': error_before,
+        'error_after': error_after,
+        'weights': np.round(weights, 2).tolist(),
+        'out': args.out,
+    }))
+
+
+if __name__ == '__main__':
+    main()
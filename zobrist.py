@@ -0,0 +1,46 @@
+"""
+Хеширование позиций по Зобристу.
+
+Каждой паре (цвет, клетка) сопоставлено случайное 64-битное число, хеш позиции - XOR чисел всех коней.
+Ход меняет хеш тремя XOR (откуда, куда, срубленный конь), поэтому Board.make_move пересчитывает его инкрементально.
+Очередь хода в хеш доски не входит - её добавляет поиск через ZOBRIST_TO_MOVE.
+
+Доска хранит ещё и хеш зеркальной по колонкам позиции (ZOBRIST_MIRROR_KEYS): позиция и её зеркало
+равноценны, поэтому в таблице транспозиций и дебютной книге они хранятся под одним ключом - меньшим из двух.
+"""
+
+import random
+from typing import Dict, Tuple
+
+from base import Color
+from bitboard import iter_squares
+
+_random = random.Random(20240301)  # фиксированное зерно - хеши одинаковы во всех процессах
+
+ZOBRIST_KEYS: Dict[str, Tuple[int, ...]] = {
+    color.value: tuple(_random.getrandbits(64) for _ in range(64)) for color in Color
+}
+"""Ключ коня цвета на клетке"""
+
+ZOBRIST_MIRROR_KEYS: Dict[str, Tuple[int, ...]] = {
+    color: tuple(keys[sq ^ 7] for sq in range(64)) for color, keys in ZOBRIST_KEYS.items()
+}
+"""Ключ коня на зеркальной клетке: XOR этих ключей - хеш зеркальной позиции"""
+
+ZOBRIST_TO_MOVE: Dict[str, int] = {color.value: _random.getrandbits(64) for color in Color}
+"""Ключ игрока, который ходит следующим"""
+
+
+def zobrist_hash(bitboards: Dict[str, int], keys_map: Dict[str, Tuple[int, ...]] = ZOBRIST_KEYS) -> int:
+    """Хеш позиции (полный пересчёт)"""
+    value = 0
+    for color, mask in bitboards.items():
+        keys = keys_map[color]
+        for sq in iter_squares(mask):
+            value ^= keys[sq]
+    return value
+
+
+def mirror_zobrist_hash(bitboards: Dict[str, int]) -> int:
+    """Хеш зеркальной по колонкам позиции"""
+    return zobrist_hash(bitboards, ZOBRIST_MIRROR_KEYS)